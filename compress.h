@@ -0,0 +1,188 @@
+#pragma once
+
+#include <zlib.h>
+#include <algorithm>
+#include <cstddef>
+#include <string>
+#include <string_view>
+#include "http.h"
+
+// Response compression (gzip and deflate through zlib; link with -lz).
+//
+// The encoding is picked from Accept-Encoding. Only compressible content
+// types at or above a minimum size are compressed. Bodies whose length is
+// not known up front (echo, large static files) go through a Compressor
+// span by span; small static files keep a precompressed copy in the cache.
+
+enum class Encoding {
+    Identity,
+    Gzip,
+    Deflate,
+};
+
+struct CompressionConfig {
+    // zlib level 1-9; 0 turns compression off.
+    int level = 1;
+    size_t minSize = 1024;
+};
+
+inline std::string_view encodingName(Encoding encoding) {
+    switch (encoding) {
+    case Encoding::Gzip:
+        return "gzip";
+    case Encoding::Deflate:
+        return "deflate";
+    default:
+        return "identity";
+    }
+}
+
+// Picks the encoding with the highest q-value the client accepts, gzip first
+// on ties. A missing q counts as 1 and q=0 rules the coding out.
+inline Encoding negotiateEncoding(std::string_view acceptEncoding) {
+    Encoding best = Encoding::Identity;
+    int bestQuality = 0;
+    int wildcard = -1;
+    int quality[3] = {-1, -1, -1};
+    size_t start = 0;
+    while (start < acceptEncoding.size()) {
+        size_t end = acceptEncoding.find(',', start);
+        if (end == std::string_view::npos) end = acceptEncoding.size();
+        std::string_view item = trim(acceptEncoding.substr(start, end - start));
+        start = end + 1;
+
+        std::string_view name = trim(item.substr(0, item.find(';')));
+        int q = 1000;
+        size_t qAt = item.find("q=");
+        if (qAt != std::string_view::npos) {
+            // Thousandths, enough for the three decimals RFC 9110 allows.
+            std::string_view value = trim(item.substr(qAt + 2));
+            q = 0;
+            int digits = 0;
+            bool fraction = false;
+            for (char c : value) {
+                if (c == '.') {
+                    fraction = true;
+                } else if (c >= '0' && c <= '9' && (!fraction || digits < 3)) {
+                    q = q * 10 + (c - '0');
+                    if (fraction) ++digits;
+                } else {
+                    break;
+                }
+            }
+            while (digits++ < 3) q *= 10;
+        }
+
+        if (equalsIgnoreCase(name, "gzip") || equalsIgnoreCase(name, "x-gzip")) {
+            quality[(int)Encoding::Gzip] = q;
+        } else if (equalsIgnoreCase(name, "deflate")) {
+            quality[(int)Encoding::Deflate] = q;
+        } else if (name == "*") {
+            wildcard = q;
+        }
+    }
+    for (Encoding candidate : {Encoding::Gzip, Encoding::Deflate}) {
+        int q = quality[(int)candidate] >= 0 ? quality[(int)candidate] : wildcard;
+        if (q > bestQuality) {
+            best = candidate;
+            bestQuality = q;
+        }
+    }
+    return best;
+}
+
+// Text-like types worth compressing; images and archives are already packed.
+inline bool isCompressible(std::string_view contentType) {
+    return contentType.substr(0, 5) == "text/" || contentType.substr(0, 16) == "application/json" ||
+           contentType.substr(0, 22) == "application/javascript" || contentType.substr(0, 13) == "image/svg+xml" ||
+           contentType.substr(0, 16) == "application/wasm";
+}
+
+// One zlib stream. It holds about 256 KiB of zlib state, so connections
+// create one per compressed response and drop it when the response is done.
+class Compressor {
+public:
+    Compressor(Encoding encoding, int level) {
+        // 15 window bits is a zlib (RFC 1950) stream, which is what
+        // "deflate" means in HTTP; +16 adds the gzip wrapper instead.
+        int windowBits = encoding == Encoding::Gzip ? 15 + 16 : 15;
+        ok_ = deflateInit2(&stream_, level, Z_DEFLATED, windowBits, 8, Z_DEFAULT_STRATEGY) == Z_OK;
+    }
+
+    ~Compressor() {
+        if (ok_) deflateEnd(&stream_);
+    }
+
+    Compressor(const Compressor&) = delete;
+    Compressor& operator=(const Compressor&) = delete;
+
+    bool ok() const {
+        return ok_;
+    }
+
+    // Compresses `size` bytes and appends whatever zlib emits to `out`. With
+    // finish set the stream is closed and every remaining byte is flushed.
+    void write(const char* data, size_t size, std::string& out, bool finish) {
+        if (!stored_ && input_ >= ADAPT_AFTER && stream_.total_out > input_ - input_ / 20) {
+            storeRest(out);
+        }
+        stream_.next_in = reinterpret_cast<Bytef*>(const_cast<char*>(data));
+        stream_.avail_in = (uInt)size;
+        int flush = finish ? Z_FINISH : Z_NO_FLUSH;
+        while (true) {
+            size_t used = out.size();
+            size_t room = std::max<size_t>(deflateBound(&stream_, stream_.avail_in), 16 * 1024);
+            out.resize(used + room);
+            stream_.next_out = reinterpret_cast<Bytef*>(out.data() + used);
+            stream_.avail_out = (uInt)room;
+            int status = deflate(&stream_, flush);
+            out.resize(used + room - stream_.avail_out);
+            if (status == Z_STREAM_END || (!finish && stream_.avail_in == 0 && stream_.avail_out != 0)) break;
+            if (status != Z_OK && status != Z_BUF_ERROR) break;
+        }
+        input_ += size;
+    }
+
+    size_t input() const {
+        return input_;
+    }
+
+    size_t output() const {
+        return stream_.total_out;
+    }
+
+private:
+    // After this much input a stream that saved less than 5% switches to
+    // stored blocks: already-packed data costs zlib far more CPU than it
+    // saves on the wire.
+    static const size_t ADAPT_AFTER = 256 * 1024;
+
+    z_stream stream_ = {};
+    bool ok_ = false;
+    bool stored_ = false;
+    size_t input_ = 0;
+
+    void storeRest(std::string& out) {
+        stored_ = true;
+        stream_.avail_in = 0;
+        while (true) {
+            size_t used = out.size();
+            size_t room = 16 * 1024;
+            out.resize(used + room);
+            stream_.next_out = reinterpret_cast<Bytef*>(out.data() + used);
+            stream_.avail_out = (uInt)room;
+            int status = deflateParams(&stream_, Z_NO_COMPRESSION, Z_DEFAULT_STRATEGY);
+            out.resize(used + room - stream_.avail_out);
+            if (status != Z_BUF_ERROR || stream_.avail_out != 0) break;
+        }
+    }
+};
+
+// Compresses a whole buffer at once. Cached static variants are built once
+// and then served many times, so they use the best level.
+inline std::string compressAll(std::string_view data, Encoding encoding, int level = Z_BEST_COMPRESSION) {
+    std::string out;
+    Compressor compressor(encoding, level);
+    if (compressor.ok()) compressor.write(data.data(), data.size(), out, true);
+    return out;
+}
@@ -0,0 +1,219 @@
+#pragma once
+
+#include <string_view>
+#include <charconv>
+#include <cstring>
+#include <cstddef>
+#include <algorithm>
+
+// Incremental HTTP/1.x request head parser. It never copies: every field is
+// a view into the caller's buffer, which must stay untouched until the
+// request has been handled.
+struct HttpRequest {
+    std::string_view method;
+    std::string_view path;
+    std::string_view version;
+    std::string_view ifNoneMatch;
+    std::string_view acceptEncoding;
+    size_t headerLength = 0;
+    size_t contentLength = 0;
+    bool chunked = false;
+    bool keepAlive = true;
+};
+
+inline bool equalsIgnoreCase(std::string_view a, std::string_view b) {
+    if (a.size() != b.size()) return false;
+    for (size_t i = 0; i < a.size(); ++i) {
+        char x = a[i], y = b[i];
+        if (x >= 'A' && x <= 'Z') x = (char)(x - 'A' + 'a');
+        if (y >= 'A' && y <= 'Z') y = (char)(y - 'A' + 'a');
+        if (x != y) return false;
+    }
+    return true;
+}
+
+inline bool containsIgnoreCase(std::string_view haystack, std::string_view needle) {
+    if (needle.size() > haystack.size()) return false;
+    for (size_t i = 0; i + needle.size() <= haystack.size(); ++i) {
+        if (equalsIgnoreCase(haystack.substr(i, needle.size()), needle)) return true;
+    }
+    return false;
+}
+
+inline std::string_view trim(std::string_view value) {
+    while (!value.empty() && (value.front() == ' ' || value.front() == '\t')) value.remove_prefix(1);
+    while (!value.empty() && (value.back() == ' ' || value.back() == '\t' || value.back() == '\r')) value.remove_suffix(1);
+    return value;
+}
+
+class RequestParser {
+public:
+    enum class Status {
+        Incomplete,
+        Complete,
+        Error,
+    };
+
+    // Looks for the end of the request head in data[0, size). Bytes already
+    // scanned by an earlier call are not searched again.
+    Status parse(const char* data, size_t size, HttpRequest& request) {
+        size_t from = scanned_ > 3 ? scanned_ - 3 : 0;
+        const void* found = size > from ? memmem(data + from, size - from, "\r\n\r\n", 4) : nullptr;
+        if (found == nullptr) {
+            scanned_ = size;
+            return Status::Incomplete;
+        }
+        size_t headEnd = (size_t)((const char*)found - data);
+        request = HttpRequest();
+        request.headerLength = headEnd + 4;
+        return parseHead(std::string_view(data, headEnd), request) ? Status::Complete : Status::Error;
+    }
+
+    void reset() {
+        scanned_ = 0;
+    }
+
+private:
+    size_t scanned_ = 0;
+
+    static bool parseHead(std::string_view head, HttpRequest& request) {
+        size_t lineEnd = head.find("\r\n");
+        std::string_view line = head.substr(0, lineEnd);
+        std::string_view rest = lineEnd == std::string_view::npos ? std::string_view() : head.substr(lineEnd + 2);
+
+        size_t sp1 = line.find(' ');
+        size_t sp2 = sp1 == std::string_view::npos ? sp1 : line.find(' ', sp1 + 1);
+        if (sp2 == std::string_view::npos) return false;
+        request.method = line.substr(0, sp1);
+        request.path = line.substr(sp1 + 1, sp2 - sp1 - 1);
+        request.version = line.substr(sp2 + 1);
+        if (request.method.empty() || request.path.empty() || request.version.substr(0, 5) != "HTTP/") {
+            return false;
+        }
+        request.keepAlive = request.version != "HTTP/1.0";
+
+        while (!rest.empty()) {
+            lineEnd = rest.find("\r\n");
+            line = rest.substr(0, lineEnd);
+            rest = lineEnd == std::string_view::npos ? std::string_view() : rest.substr(lineEnd + 2);
+
+            size_t colon = line.find(':');
+            if (colon == std::string_view::npos) return false;
+            std::string_view name = line.substr(0, colon);
+            std::string_view value = trim(line.substr(colon + 1));
+
+            if (equalsIgnoreCase(name, "content-length")) {
+                auto result = std::from_chars(value.data(), value.data() + value.size(), request.contentLength);
+                if (result.ec != std::errc() || result.ptr != value.data() + value.size()) return false;
+            } else if (equalsIgnoreCase(name, "transfer-encoding")) {
+                request.chunked = containsIgnoreCase(value, "chunked");
+            } else if (equalsIgnoreCase(name, "if-none-match")) {
+                request.ifNoneMatch = value;
+            } else if (equalsIgnoreCase(name, "accept-encoding")) {
+                request.acceptEncoding = value;
+            } else if (equalsIgnoreCase(name, "connection")) {
+                if (containsIgnoreCase(value, "close")) {
+                    request.keepAlive = false;
+                } else if (containsIgnoreCase(value, "keep-alive")) {
+                    request.keepAlive = true;
+                }
+            }
+        }
+        if (request.chunked) {
+            request.contentLength = 0;
+        }
+        return true;
+    }
+};
+
+// Walks a request body framed either by Content-Length or by chunked
+// transfer-encoding. Chunk framing is skipped, body bytes are only reported
+// as spans so the caller can forward them without copying.
+class BodyDecoder {
+public:
+    enum class Status {
+        NeedInput,
+        Data,
+        Done,
+        Error,
+    };
+
+    static const size_t MAX_CHUNK_LINE = 1024;
+
+    void start(const HttpRequest& request) {
+        chunked_ = request.chunked;
+        remaining_ = chunked_ ? 0 : request.contentLength;
+        state_ = chunked_ ? State::ChunkSize : (remaining_ > 0 ? State::Data : State::Done);
+    }
+
+    // Looks at data[0, size): `consumed` framing bytes at the front can be
+    // dropped, then `span` body bytes follow when the status is Data.
+    Status next(const char* data, size_t size, size_t& consumed, size_t& span) {
+        consumed = 0;
+        span = 0;
+        while (true) {
+            std::string_view rest(data + consumed, size - consumed);
+            switch (state_) {
+            case State::Data:
+                span = std::min(remaining_, rest.size());
+                return span > 0 ? Status::Data : Status::NeedInput;
+            case State::DataEnd:
+                if (rest.size() < 2) return Status::NeedInput;
+                if (rest.substr(0, 2) != "\r\n") return Status::Error;
+                consumed += 2;
+                state_ = State::ChunkSize;
+                break;
+            case State::ChunkSize:
+            case State::Trailer: {
+                size_t lineEnd = rest.find("\r\n");
+                if (lineEnd == std::string_view::npos) {
+                    return rest.size() > MAX_CHUNK_LINE ? Status::Error : Status::NeedInput;
+                }
+                std::string_view line = rest.substr(0, lineEnd);
+                consumed += lineEnd + 2;
+                if (state_ == State::Trailer) {
+                    if (line.empty()) {
+                        state_ = State::Done;
+                        return Status::Done;
+                    }
+                    break;
+                }
+                line = trim(line.substr(0, line.find(';')));
+                auto result = std::from_chars(line.data(), line.data() + line.size(), remaining_, 16);
+                if (line.empty() || result.ec != std::errc() || result.ptr != line.data() + line.size()) {
+                    return Status::Error;
+                }
+                state_ = remaining_ > 0 ? State::Data : State::Trailer;
+                break;
+            }
+            case State::Done:
+                return Status::Done;
+            }
+        }
+    }
+
+    // Marks `count` body bytes of the last reported span as forwarded.
+    void advance(size_t count) {
+        remaining_ -= count;
+        if (remaining_ == 0 && state_ == State::Data) {
+            state_ = chunked_ ? State::DataEnd : State::Done;
+        }
+    }
+
+    bool chunked() const {
+        return chunked_;
+    }
+
+private:
+    enum class State {
+        ChunkSize,
+        Data,
+        DataEnd,
+        Trailer,
+        Done,
+    };
+
+    bool chunked_ = false;
+    size_t remaining_ = 0;
+    State state_ = State::Done;
+};
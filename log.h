@@ -0,0 +1,253 @@
+#pragma once
+
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cerrno>
+#include <cstdint>
+#include <cstdio>
+#include <cstring>
+#include <ctime>
+#include <deque>
+#include <string>
+#include <string_view>
+#include <thread>
+#include <unistd.h>
+
+// Asynchronous logging. Workers never write to stdout/stderr themselves:
+// each one owns a single-producer ring of fixed-size slots, and a background
+// thread drains all rings and writes the lines out in large batches. When a
+// ring is full the line is dropped and counted rather than blocking the
+// worker.
+//
+// Lines are logfmt-style key=value pairs:
+//   ts=2026-01-01T12:00:00.123456Z level=access worker=0 method=POST path=/ ...
+
+enum class LogLevel {
+    Off,
+    Error,
+    Access,
+};
+
+inline bool parseLogLevel(std::string_view name, LogLevel& level) {
+    if (name == "off") {
+        level = LogLevel::Off;
+    } else if (name == "error") {
+        level = LogLevel::Error;
+    } else if (name == "access") {
+        level = LogLevel::Access;
+    } else {
+        return false;
+    }
+    return true;
+}
+
+class LogRing {
+public:
+    static const size_t SLOTS = 4096;
+    static const size_t LINE_SIZE = 240;
+
+    struct Slot {
+        int64_t timeNanos;
+        LogLevel level;
+        uint32_t length;
+        char text[LINE_SIZE];
+    };
+
+    // Producer side, called only by the owning worker. Longer lines are cut
+    // at LINE_SIZE bytes.
+    bool push(LogLevel level, std::string_view text) {
+        size_t tail = tail_.load(std::memory_order_relaxed);
+        if (tail - head_.load(std::memory_order_acquire) == SLOTS) {
+            dropped_.store(dropped_.load(std::memory_order_relaxed) + 1, std::memory_order_relaxed);
+            return false;
+        }
+        Slot& slot = slots_[tail % SLOTS];
+        slot.timeNanos = std::chrono::duration_cast<std::chrono::nanoseconds>(
+            std::chrono::system_clock::now().time_since_epoch()).count();
+        slot.level = level;
+        slot.length = (uint32_t)std::min(text.size(), LINE_SIZE);
+        std::memcpy(slot.text, text.data(), slot.length);
+        tail_.store(tail + 1, std::memory_order_release);
+        return true;
+    }
+
+    // Consumer side, called only by the logger thread.
+    template <typename Sink>
+    size_t drain(Sink&& sink) {
+        size_t head = head_.load(std::memory_order_relaxed);
+        size_t tail = tail_.load(std::memory_order_acquire);
+        for (size_t i = head; i != tail; ++i) {
+            sink(slots_[i % SLOTS]);
+        }
+        head_.store(tail, std::memory_order_release);
+        return tail - head;
+    }
+
+    uint64_t takeDropped() {
+        return dropped_.exchange(0, std::memory_order_relaxed);
+    }
+
+private:
+    alignas(64) std::atomic<size_t> head_{0};
+    alignas(64) std::atomic<size_t> tail_{0};
+    std::atomic<uint64_t> dropped_{0};
+    Slot slots_[SLOTS];
+};
+
+class Logger {
+public:
+    static const size_t BATCH_SIZE = 64 * 1024;
+
+    Logger(LogLevel level, int sampleRate) : level_(level), sampleRate_(sampleRate > 0 ? sampleRate : 1) {}
+
+    ~Logger() {
+        stop();
+    }
+
+    bool enabled(LogLevel level) const {
+        return level_ != LogLevel::Off && level <= level_;
+    }
+
+    int sampleRate() const {
+        return sampleRate_;
+    }
+
+    // Must be called before start(); the ring lives as long as the logger.
+    LogRing& addWorker() {
+        return rings_.emplace_back();
+    }
+
+    void start() {
+        if (level_ == LogLevel::Off || thread_.joinable()) return;
+        running_.store(true, std::memory_order_relaxed);
+        thread_ = std::thread(&Logger::run, this);
+    }
+
+    // Writes out everything still queued and stops the background thread.
+    void stop() {
+        if (!thread_.joinable()) return;
+        running_.store(false, std::memory_order_relaxed);
+        thread_.join();
+    }
+
+private:
+    LogLevel level_;
+    int sampleRate_;
+    std::deque<LogRing> rings_;
+    std::atomic<bool> running_{false};
+    std::thread thread_;
+    std::string out_;
+    std::string err_;
+
+    void run() {
+        out_.reserve(BATCH_SIZE * 2);
+        err_.reserve(BATCH_SIZE);
+        while (true) {
+            bool running = running_.load(std::memory_order_relaxed);
+            size_t drained = 0;
+            for (size_t worker = 0; worker < rings_.size(); ++worker) {
+                drained += rings_[worker].drain([&](const LogRing::Slot& slot) {
+                    std::string& target = slot.level == LogLevel::Error ? err_ : out_;
+                    appendLine(target, slot, worker);
+                    if (target.size() >= BATCH_SIZE) flush();
+                });
+                uint64_t dropped = rings_[worker].takeDropped();
+                if (dropped > 0) {
+                    appendDropped(worker, dropped);
+                }
+            }
+            flush();
+            if (!running) break;
+            if (drained == 0) {
+                std::this_thread::sleep_for(std::chrono::milliseconds(10));
+            }
+        }
+    }
+
+    // Appends "ts=... level=... worker=N " for a line logged at timeNanos.
+    static void appendPrefix(std::string& target, int64_t timeNanos, LogLevel level, size_t worker) {
+        time_t seconds = (time_t)(timeNanos / 1000000000);
+        long micros = (long)(timeNanos % 1000000000 / 1000);
+        tm utc;
+        gmtime_r(&seconds, &utc);
+        char prefix[96];
+        size_t length = strftime(prefix, sizeof(prefix), "ts=%Y-%m-%dT%H:%M:%S", &utc);
+        length += (size_t)snprintf(prefix + length, sizeof(prefix) - length, ".%06ldZ level=%s worker=%zu ",
+                                   micros, level == LogLevel::Error ? "error" : "access", worker);
+        target.append(prefix, length);
+    }
+
+    static void appendLine(std::string& target, const LogRing::Slot& slot, size_t worker) {
+        appendPrefix(target, slot.timeNanos, slot.level, worker);
+        target.append(slot.text, slot.length);
+        target += '\n';
+    }
+
+    void appendDropped(size_t worker, uint64_t dropped) {
+        int64_t now = std::chrono::duration_cast<std::chrono::nanoseconds>(
+            std::chrono::system_clock::now().time_since_epoch()).count();
+        appendPrefix(err_, now, LogLevel::Error, worker);
+        err_ += "event=log_dropped lines=";
+        err_ += std::to_string(dropped);
+        err_ += '\n';
+    }
+
+    static void writeAll(int fd, std::string& data) {
+        size_t written = 0;
+        while (written < data.size()) {
+            ssize_t n = write(fd, data.data() + written, data.size() - written);
+            if (n < 0) {
+                if (errno == EINTR) continue;
+                break;
+            }
+            written += (size_t)n;
+        }
+        data.clear();
+    }
+
+    void flush() {
+        if (!out_.empty()) writeAll(STDOUT_FILENO, out_);
+        if (!err_.empty()) writeAll(STDERR_FILENO, err_);
+    }
+};
+
+// A worker's handle to the logger: owns the worker's ring and decides which
+// access lines are sampled.
+class WorkerLog {
+public:
+    WorkerLog(const Logger& logger, LogRing& ring) : logger_(&logger), ring_(&ring) {}
+
+    // True for one in every sampleRate requests while access logging is on.
+    bool sampleAccess() {
+        if (!logger_->enabled(LogLevel::Access)) return false;
+        if (++accessCounter_ < (uint64_t)logger_->sampleRate()) return false;
+        accessCounter_ = 0;
+        return true;
+    }
+
+    void access(std::string_view line) {
+        ring_->push(LogLevel::Access, line);
+    }
+
+    // Logs a failed system call like perror() would, without blocking.
+    void error(const char* operation, int errorNumber) {
+        if (!logger_->enabled(LogLevel::Error)) return;
+        std::string line = "op=";
+        line += operation;
+        line += " error=\"";
+        line += strerror(errorNumber);
+        line += '"';
+        ring_->push(LogLevel::Error, line);
+    }
+
+    void error(std::string_view message) {
+        if (!logger_->enabled(LogLevel::Error)) return;
+        ring_->push(LogLevel::Error, message);
+    }
+
+private:
+    const Logger* logger_;
+    LogRing* ring_;
+    uint64_t accessCounter_ = 0;
+};
@@ -0,0 +1,232 @@
+#pragma once
+
+#include <atomic>
+#include <chrono>
+#include <cstdint>
+#include <cstdio>
+#include <deque>
+#include <string>
+
+// Server counters exposed at /metrics in the Prometheus text format.
+//
+// Every worker owns one WorkerMetrics and is the only thread that writes to
+// it, so updates are plain relaxed load/store pairs instead of locked
+// read-modify-write instructions. Any worker may render the metrics while the
+// others keep counting; a scrape sees each value at some recent point, which
+// is all Prometheus expects.
+
+inline void bump(std::atomic<uint64_t>& counter, uint64_t amount = 1) {
+    counter.store(counter.load(std::memory_order_relaxed) + amount, std::memory_order_relaxed);
+}
+
+struct HistogramBucket {
+    uint64_t nanos;
+    const char* label;
+};
+
+const HistogramBucket LATENCY_BUCKETS[] = {
+    {10'000, "0.00001"},
+    {25'000, "0.000025"},
+    {50'000, "0.00005"},
+    {100'000, "0.0001"},
+    {250'000, "0.00025"},
+    {500'000, "0.0005"},
+    {1'000'000, "0.001"},
+    {2'500'000, "0.0025"},
+    {5'000'000, "0.005"},
+    {10'000'000, "0.01"},
+    {25'000'000, "0.025"},
+    {50'000'000, "0.05"},
+    {100'000'000, "0.1"},
+    {250'000'000, "0.25"},
+    {500'000'000, "0.5"},
+    {1'000'000'000, "1"},
+    {2'500'000'000, "2.5"},
+    {5'000'000'000, "5"},
+    {10'000'000'000, "10"},
+};
+
+const size_t LATENCY_BUCKET_COUNT = sizeof(LATENCY_BUCKETS) / sizeof(LATENCY_BUCKETS[0]);
+
+class StageHistogram {
+public:
+    void record(std::chrono::nanoseconds elapsed) {
+        uint64_t nanos = elapsed.count() > 0 ? (uint64_t)elapsed.count() : 0;
+        size_t bucket = 0;
+        while (bucket < LATENCY_BUCKET_COUNT && nanos > LATENCY_BUCKETS[bucket].nanos) ++bucket;
+        bump(buckets_[bucket]);
+        bump(sumNanos_, nanos);
+    }
+
+    // Adds this histogram's per-bucket counts (the last one is +Inf) and sum
+    // into the given totals.
+    void collect(uint64_t* counts, uint64_t& sumNanos) const {
+        for (size_t i = 0; i <= LATENCY_BUCKET_COUNT; ++i) {
+            counts[i] += buckets_[i].load(std::memory_order_relaxed);
+        }
+        sumNanos += sumNanos_.load(std::memory_order_relaxed);
+    }
+
+private:
+    std::atomic<uint64_t> buckets_[LATENCY_BUCKET_COUNT + 1] = {};
+    std::atomic<uint64_t> sumNanos_{0};
+};
+
+struct BufferPoolStats {
+    std::atomic<uint64_t> hits{0};
+    std::atomic<uint64_t> misses{0};
+    std::atomic<uint64_t> discarded{0};
+    std::atomic<uint64_t> idleBytes{0};
+};
+
+// Aligned to a cache line so workers never write to a line another worker's
+// counters live on.
+struct alignas(64) WorkerMetrics {
+    std::atomic<uint64_t> connectionsAccepted{0};
+    std::atomic<uint64_t> connectionsClosed{0};
+    std::atomic<uint64_t> connectionsRejected{0};
+    std::atomic<uint64_t> timeouts{0};
+    std::atomic<uint64_t> requests{0};
+    std::atomic<uint64_t> bytesReceived{0};
+    std::atomic<uint64_t> bytesSent{0};
+    std::atomic<uint64_t> parseErrors{0};
+    std::atomic<uint64_t> staticCacheHits{0};
+    std::atomic<uint64_t> staticCacheMisses{0};
+    std::atomic<uint64_t> compressedResponses{0};
+    std::atomic<uint64_t> compressionInput{0};
+    std::atomic<uint64_t> compressionOutput{0};
+    BufferPoolStats bufferPool;
+    StageHistogram firstByte;
+    StageHistogram parse;
+    StageHistogram route;
+    StageHistogram send;
+};
+
+class MetricsRegistry {
+public:
+    // Must be called before the workers start; the returned reference stays
+    // valid for the lifetime of the registry.
+    WorkerMetrics& addWorker() {
+        return workers_.emplace_back();
+    }
+
+    std::string render() const {
+        uint64_t accepted = 0, closed = 0, rejected = 0, timeouts = 0;
+        uint64_t requests = 0, received = 0, sent = 0, errors = 0, cacheHits = 0, cacheMisses = 0;
+        uint64_t compressed = 0, compressionInput = 0, compressionOutput = 0;
+        uint64_t poolHits = 0, poolMisses = 0, poolDiscarded = 0, poolIdle = 0;
+        for (const WorkerMetrics& worker : workers_) {
+            accepted += worker.connectionsAccepted.load(std::memory_order_relaxed);
+            closed += worker.connectionsClosed.load(std::memory_order_relaxed);
+            rejected += worker.connectionsRejected.load(std::memory_order_relaxed);
+            timeouts += worker.timeouts.load(std::memory_order_relaxed);
+            requests += worker.requests.load(std::memory_order_relaxed);
+            received += worker.bytesReceived.load(std::memory_order_relaxed);
+            sent += worker.bytesSent.load(std::memory_order_relaxed);
+            errors += worker.parseErrors.load(std::memory_order_relaxed);
+            cacheHits += worker.staticCacheHits.load(std::memory_order_relaxed);
+            cacheMisses += worker.staticCacheMisses.load(std::memory_order_relaxed);
+            compressed += worker.compressedResponses.load(std::memory_order_relaxed);
+            compressionInput += worker.compressionInput.load(std::memory_order_relaxed);
+            compressionOutput += worker.compressionOutput.load(std::memory_order_relaxed);
+            poolHits += worker.bufferPool.hits.load(std::memory_order_relaxed);
+            poolMisses += worker.bufferPool.misses.load(std::memory_order_relaxed);
+            poolDiscarded += worker.bufferPool.discarded.load(std::memory_order_relaxed);
+            poolIdle += worker.bufferPool.idleBytes.load(std::memory_order_relaxed);
+        }
+
+        std::string out;
+        out.reserve(4096);
+        appendMetric(out, "http_connections_accepted_total", "counter", "Connections accepted.", accepted);
+        appendMetric(out, "http_connections_active", "gauge", "Connections currently open.",
+                     accepted >= closed ? accepted - closed : 0);
+        appendMetric(out, "http_connections_rejected_total", "counter",
+                     "Connections shed with 503 at --max-connections.", rejected);
+        appendMetric(out, "http_timeouts_total", "counter",
+                     "Connections closed by a header or I/O deadline.", timeouts);
+        appendMetric(out, "http_requests_total", "counter", "Request heads parsed.", requests);
+        appendMetric(out, "http_received_bytes_total", "counter", "Bytes read from clients.", received);
+        appendMetric(out, "http_sent_bytes_total", "counter", "Bytes written to clients.", sent);
+        appendMetric(out, "http_parse_errors_total", "counter", "Requests rejected as malformed.", errors);
+        appendMetric(out, "http_static_cache_hits_total", "counter",
+                     "Static responses served from the in-memory cache.", cacheHits);
+        appendMetric(out, "http_static_cache_misses_total", "counter",
+                     "Static responses that had to open the file.", cacheMisses);
+        appendMetric(out, "http_compressed_responses_total", "counter",
+                     "Responses sent with a gzip or deflate Content-Encoding.", compressed);
+        appendMetric(out, "http_compression_input_bytes_total", "counter",
+                     "Bytes fed to the compressor.", compressionInput);
+        appendMetric(out, "http_compression_output_bytes_total", "counter",
+                     "Compressed bytes produced.", compressionOutput);
+        appendMetric(out, "http_buffer_pool_hits_total", "counter",
+                     "Connection buffers reused from the pool.", poolHits);
+        appendMetric(out, "http_buffer_pool_misses_total", "counter",
+                     "Connection buffers the pool had to allocate.", poolMisses);
+        appendMetric(out, "http_buffer_pool_discarded_total", "counter",
+                     "Released buffers freed because the pool was full or they were too large.", poolDiscarded);
+        appendMetric(out, "http_buffer_pool_idle_bytes", "gauge",
+                     "Bytes held by idle buffers in the pool.", poolIdle);
+        appendHistogram(out, "http_accept_to_first_byte_seconds",
+                        "Time from accepting a connection to its first received byte.", &WorkerMetrics::firstByte);
+        appendHistogram(out, "http_parse_seconds", "Time spent parsing request heads.", &WorkerMetrics::parse);
+        appendHistogram(out, "http_route_seconds", "Time spent finding the handler for a request.",
+                        &WorkerMetrics::route);
+        appendHistogram(out, "http_send_seconds",
+                        "Time from a parsed request head to its fully written response.", &WorkerMetrics::send);
+        return out;
+    }
+
+private:
+    std::deque<WorkerMetrics> workers_;
+
+    static void appendHeader(std::string& out, const char* name, const char* type, const char* help) {
+        out += "# HELP ";
+        out += name;
+        out += ' ';
+        out += help;
+        out += "\n# TYPE ";
+        out += name;
+        out += ' ';
+        out += type;
+        out += '\n';
+    }
+
+    static void appendMetric(std::string& out, const char* name, const char* type, const char* help, uint64_t value) {
+        appendHeader(out, name, type, help);
+        out += name;
+        out += ' ';
+        out += std::to_string(value);
+        out += '\n';
+    }
+
+    void appendHistogram(std::string& out, const char* name, const char* help,
+                         StageHistogram WorkerMetrics::*stage) const {
+        uint64_t counts[LATENCY_BUCKET_COUNT + 1] = {};
+        uint64_t sumNanos = 0;
+        for (const WorkerMetrics& worker : workers_) {
+            (worker.*stage).collect(counts, sumNanos);
+        }
+
+        appendHeader(out, name, "histogram", help);
+        uint64_t cumulative = 0;
+        for (size_t i = 0; i <= LATENCY_BUCKET_COUNT; ++i) {
+            cumulative += counts[i];
+            out += name;
+            out += "_bucket{le=\"";
+            out += i < LATENCY_BUCKET_COUNT ? LATENCY_BUCKETS[i].label : "+Inf";
+            out += "\"} ";
+            out += std::to_string(cumulative);
+            out += '\n';
+        }
+        char sum[32];
+        std::snprintf(sum, sizeof(sum), "%.9f", (double)sumNanos / 1e9);
+        out += name;
+        out += "_sum ";
+        out += sum;
+        out += '\n';
+        out += name;
+        out += "_count ";
+        out += std::to_string(cumulative);
+        out += '\n';
+    }
+};
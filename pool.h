@@ -0,0 +1,80 @@
+#pragma once
+
+#include <cstddef>
+#include <string>
+#include <vector>
+#include "metrics.h"
+
+// Per-worker pool of connection buffers. Buffers are plain std::strings
+// whose heap storage is handed from one connection to the next instead of
+// going back to malloc. They are kept in size classes (4 KiB to 1 MiB,
+// growing 4x) so a request for a small buffer never pins a large one. At
+// most `capacity` bytes sit idle in the pool; buffers released beyond that,
+// or larger than the biggest class, are freed.
+//
+// Only the owning worker touches its pool, so there is no locking.
+
+class BufferPool {
+public:
+    static constexpr size_t CLASS_COUNT = 5;
+    static constexpr size_t SMALLEST_CLASS = 4 * 1024;
+
+    BufferPool(size_t capacity, BufferPoolStats& stats) : capacity_(capacity), stats_(&stats) {}
+
+    static size_t classSize(size_t index) {
+        return SMALLEST_CLASS << (2 * index);
+    }
+
+    // A buffer with capacity for at least `size` bytes. Its contents and
+    // size are whatever the previous user left; callers clear() or resize().
+    std::string acquire(size_t size) {
+        size_t index = classFor(size);
+        std::string buffer;
+        if (index < CLASS_COUNT && !free_[index].empty()) {
+            buffer = std::move(free_[index].back());
+            free_[index].pop_back();
+            idleBytes_ -= buffer.capacity();
+            stats_->idleBytes.store(idleBytes_, std::memory_order_relaxed);
+            bump(stats_->hits);
+        } else {
+            buffer.reserve(index < CLASS_COUNT ? classSize(index) : size);
+            bump(stats_->misses);
+        }
+        return buffer;
+    }
+
+    // Takes the buffer's storage back; `buffer` is left empty without any.
+    void release(std::string& buffer) {
+        size_t capacity = buffer.capacity();
+        if (capacity < SMALLEST_CLASS) {
+            // Too small to be worth keeping.
+            std::string().swap(buffer);
+            return;
+        }
+        // File it under the largest class it can serve.
+        size_t index = 0;
+        while (index + 1 < CLASS_COUNT && capacity >= classSize(index + 1)) ++index;
+        if (capacity > classSize(CLASS_COUNT - 1) * 2 || idleBytes_ + capacity > capacity_) {
+            std::string().swap(buffer);
+            bump(stats_->discarded);
+            return;
+        }
+        idleBytes_ += capacity;
+        stats_->idleBytes.store(idleBytes_, std::memory_order_relaxed);
+        free_[index].push_back(std::move(buffer));
+        buffer = std::string();
+    }
+
+private:
+    size_t capacity_;
+    BufferPoolStats* stats_;
+    size_t idleBytes_ = 0;
+    std::vector<std::string> free_[CLASS_COUNT];
+
+    // Index of the smallest class holding `size` bytes, CLASS_COUNT if none.
+    static size_t classFor(size_t size) {
+        size_t index = 0;
+        while (index < CLASS_COUNT && classSize(index) < size) ++index;
+        return index;
+    }
+};
@@ -0,0 +1,182 @@
+#pragma once
+
+#include <algorithm>
+#include <memory>
+#include <string>
+#include <string_view>
+#include <utility>
+#include <vector>
+
+// Method + path dispatch on a radix trie. Each node holds a compressed run of
+// path bytes and its children are indexed by their first byte, so a lookup
+// costs O(path length) no matter how many routes are registered.
+//
+// A pattern is either an exact path ("/metrics") or a prefix ending in '*'
+// ("/files/*", "/*") that matches every path starting with it. Exact routes
+// win over prefixes and longer prefixes over shorter ones; a path that
+// matches routes only under other methods is MethodNotAllowed.
+//
+// Routes are added once at startup. Lookups are const and take no locks, so
+// every worker can share one router.
+
+template <typename Handler>
+class Router {
+public:
+    enum class Status {
+        Found,
+        NotFound,
+        MethodNotAllowed,
+    };
+
+    struct Match {
+        Status status = Status::NotFound;
+        const Handler* handler = nullptr;
+    };
+
+    // Returns false when method + pattern is already registered.
+    bool add(std::string_view method, std::string_view pattern, Handler handler) {
+        bool prefix = !pattern.empty() && pattern.back() == '*';
+        if (prefix) pattern.remove_suffix(1);
+        Node* node = insert(root_, pattern);
+        Methods& methods = prefix ? node->prefixRoutes : node->exactRoutes;
+        for (const auto& route : methods) {
+            if (route.first == method) return false;
+        }
+        methods.emplace_back(std::string(method), std::move(handler));
+        ++size_;
+        return true;
+    }
+
+    Match find(std::string_view method, std::string_view path) const {
+        Match match;
+        const Handler* prefixHandler = nullptr;
+        bool pathMatched = false;
+        const Node* exact = walk(path, [&](const Node& node) {
+            if (node.prefixRoutes.empty()) return;
+            pathMatched = true;
+            if (const Handler* handler = findMethod(node.prefixRoutes, method)) prefixHandler = handler;
+        });
+        if (exact != nullptr && !exact->exactRoutes.empty()) {
+            pathMatched = true;
+            if (const Handler* handler = findMethod(exact->exactRoutes, method)) {
+                match.status = Status::Found;
+                match.handler = handler;
+                return match;
+            }
+        }
+        if (prefixHandler != nullptr) {
+            match.status = Status::Found;
+            match.handler = prefixHandler;
+        } else if (pathMatched) {
+            match.status = Status::MethodNotAllowed;
+        }
+        return match;
+    }
+
+    // The methods any route matching `path` accepts, comma separated, for
+    // the Allow header of a 405 response.
+    std::string allowedMethods(std::string_view path) const {
+        std::vector<std::string_view> allowed;
+        auto collect = [&](const Methods& methods) {
+            for (const auto& route : methods) {
+                if (std::find(allowed.begin(), allowed.end(), route.first) == allowed.end()) {
+                    allowed.push_back(route.first);
+                }
+            }
+        };
+        const Node* exact = walk(path, [&](const Node& node) { collect(node.prefixRoutes); });
+        if (exact != nullptr) collect(exact->exactRoutes);
+
+        std::string out;
+        for (std::string_view method : allowed) {
+            if (!out.empty()) out += ", ";
+            out += method;
+        }
+        return out;
+    }
+
+    size_t size() const {
+        return size_;
+    }
+
+private:
+    using Methods = std::vector<std::pair<std::string, Handler>>;
+
+    struct Node {
+        std::string label;
+        // Sorted by the first byte of the child's label.
+        std::vector<std::unique_ptr<Node>> children;
+        Methods exactRoutes;
+        Methods prefixRoutes;
+    };
+
+    Node root_;
+    size_t size_ = 0;
+
+    static const Handler* findMethod(const Methods& methods, std::string_view method) {
+        for (const auto& route : methods) {
+            if (route.first == method) return &route.second;
+        }
+        return nullptr;
+    }
+
+    template <typename NodeRef>
+    static auto childSlot(NodeRef& node, char first) {
+        return std::lower_bound(node.children.begin(), node.children.end(), first,
+                                [](const std::unique_ptr<Node>& child, char c) {
+                                    return (unsigned char)child->label[0] < (unsigned char)c;
+                                });
+    }
+
+    static const Node* child(const Node& node, char first) {
+        auto slot = childSlot(node, first);
+        if (slot == node.children.end() || (*slot)->label[0] != first) return nullptr;
+        return slot->get();
+    }
+
+    // Follows `path` from the root, calling onNode for every node whose full
+    // prefix is a prefix of the path. Returns the node spelling exactly
+    // `path`, or nullptr.
+    template <typename Visit>
+    const Node* walk(std::string_view path, Visit&& onNode) const {
+        const Node* node = &root_;
+        while (true) {
+            onNode(*node);
+            if (path.empty()) return node;
+            const Node* next = child(*node, path[0]);
+            if (next == nullptr || path.compare(0, next->label.size(), next->label) != 0) return nullptr;
+            path.remove_prefix(next->label.size());
+            node = next;
+        }
+    }
+
+    static Node* insert(Node& root, std::string_view path) {
+        Node* node = &root;
+        while (!path.empty()) {
+            auto slot = childSlot(*node, path[0]);
+            if (slot == node->children.end() || (*slot)->label[0] != path[0]) {
+                auto leaf = std::make_unique<Node>();
+                leaf->label = std::string(path);
+                return node->children.insert(slot, std::move(leaf))->get();
+            }
+
+            Node* next = slot->get();
+            size_t common = 0;
+            while (common < next->label.size() && common < path.size() && next->label[common] == path[common]) {
+                ++common;
+            }
+            if (common < next->label.size()) {
+                // Split the edge: the shared part becomes a new parent.
+                auto parent = std::make_unique<Node>();
+                parent->label = next->label.substr(0, common);
+                next->label.erase(0, common);
+                parent->children.push_back(std::move(*slot));
+                *slot = std::move(parent);
+                next = slot->get();
+            }
+            path.remove_prefix(common);
+            node = next;
+        }
+        return node;
+    }
+};
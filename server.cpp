@@ -1,29 +1,1145 @@
 #include <iostream>
 #include <sys/socket.h>
+#include <sys/epoll.h>
+#include <sys/resource.h>
+#include <sys/uio.h>
+#include <sys/sendfile.h>
+#include <sys/eventfd.h>
+#include <sys/wait.h>
+#include <poll.h>
 #include <netinet/in.h>
 #include <unistd.h>
-#include <fstream>
-#include <sstream>
+#include <fcntl.h>
+#include <csignal>
+#include <climits>
+#include <cstdlib>
+#include <cerrno>
 #include <cstring>
+#include <string>
+#include <string_view>
+#include <charconv>
+#include <vector>
+#include <thread>
+#include <atomic>
+#include <chrono>
+#include <unordered_map>
 #include <algorithm>
-#include <cctype>
+#include "http.h"
+#include "metrics.h"
+#include "log.h"
+#include "timer.h"
+#include "static.h"
+#include "router.h"
+#include "pool.h"
+#include "uring.h"
 
 using std::cout;
 using std::cin;
 
+const int MAX_EVENTS = 1024;
+// A compressed echo stops reading the request body while this much
+// compressed output is still unsent, the same back-pressure an uncompressed
+// echo gets from its pending span.
+const size_t COMPRESS_HIGH_WATER = 64 * 1024;
+// Read size when a static file is compressed on the fly.
+const size_t FILE_READ_SIZE = 64 * 1024;
+// io_uring backend: submission queue entries per worker, and the buffers
+// each worker provides to the kernel for receives.
+const unsigned RING_ENTRIES = 4096;
+const unsigned RING_BUFFER_COUNT = 512;
+const unsigned RING_BUFFER_SIZE = 16 * 1024;
+const uint16_t RING_BUFFER_GROUP = 0;
 
-int startServer(int port, int backlog) {
-    int serverSocket = socket(AF_INET, SOCK_STREAM, 0);
+// How a worker waits for its sockets. io_uring is used only if the kernel
+// has everything the event loop needs; otherwise the server stays on epoll.
+enum class IoBackend {
+    Epoll,
+    Uring,
+};
+
+static const char* ioBackendName(IoBackend backend) {
+    return backend == IoBackend::Uring ? "io_uring" : "epoll";
+}
+
+struct ServerConfig {
+    int port = 8080;
+    int backlog = SOMAXCONN;
+    int workers = 1;
+    int keepAliveTimeout = 5;
+    int maxRequests = 1000;
+    int streamBufferSize = 256 * 1024;
+    int maxHeaderSize = 16 * 1024;
+    // 0 disables the limit; bodies are streamed, so size is not a memory risk.
+    int maxBodySize = 0;
+    int maxConnections = 0;
+    int headerTimeout = 10;
+    int ioTimeout = 30;
+    // Serve GET/HEAD from this directory when set. The cache budget is split
+    // evenly between workers.
+    std::string staticDir;
+    int cacheSize = 64 * 1024 * 1024;
+    int cacheMaxFile = 256 * 1024;
+    // Registers GET /synthetic/0 .. /synthetic/N-1, answering "OK", to
+    // measure dispatch cost against a large routing table.
+    int syntheticRoutes = 0;
+    // zlib level for gzip/deflate responses, 0 to never compress, and the
+    // smallest body worth compressing.
+    int compressionLevel = 1;
+    int compressMinSize = 1024;
+    // Idle connection buffers kept for reuse, split evenly between workers.
+    int bufferPoolSize = 64 * 1024 * 1024;
+    // On SIGTERM, and in the old process after a reload, in-flight requests
+    // get this many seconds to finish before the remaining connections are
+    // closed.
+    int drainTimeout = 10;
+    IoBackend ioBackend = IoBackend::Epoll;
+    LogLevel logLevel = LogLevel::Access;
+    int logSample = 1;
+};
+
+using Clock = std::chrono::steady_clock;
+
+const std::string_view ECHO_PREFIX = "Echo: ";
+const size_t INITIAL_BUFFER_SIZE = 4096;
+const auto TIMER_RESOLUTION = std::chrono::milliseconds(100);
+const size_t TIMER_SLOTS = 1024;
+
+// A reload (SIGHUP or SIGUSR2) execs the server binary again and hands it
+// the listening sockets through these environment variables: the socket fds,
+// and a pipe the new process writes one byte to once it is serving.
+const char* const LISTEN_FDS_ENV = "SERVER_LISTEN_FDS";
+const char* const READY_FD_ENV = "SERVER_READY_FD";
+// How long the old process waits for that byte before giving up on the
+// reload and carrying on by itself.
+const int RELOAD_TIMEOUT_MS = 10'000;
+
+// Written with a single send() to connections that are shed or timed out.
+const std::string_view SERVICE_UNAVAILABLE =
+    "HTTP/1.1 503 Service Unavailable\r\nContent-Type: text/plain\r\nContent-Length: 19\r\n"
+    "Retry-After: 1\r\nConnection: close\r\n\r\nService Unavailable";
+const std::string_view REQUEST_TIMEOUT =
+    "HTTP/1.1 408 Request Timeout\r\nContent-Type: text/plain\r\nContent-Length: 15\r\n"
+    "Connection: close\r\n\r\nRequest Timeout";
+
+enum class BodyFraming {
+    Length,
+    Chunked,
+    Close,
+    // The request body is read and dropped; the response is fully built.
+    Discard,
+};
+
+struct Connection {
+    int fd;
+    // Input buffer from the worker's pool: bytes [inStart, inEnd) are
+    // received but not yet consumed. It never holds more than
+    // streamBufferSize unconsumed bytes and goes back to the pool whenever
+    // the connection has nothing left to parse, as does `out` after each
+    // response, so idle keep-alive connections hold no buffers.
+    std::string in;
+    size_t inStart = 0;
+    size_t inEnd = 0;
+    bool readPaused = false;
+    RequestParser parser;
+    HttpRequest request;
+    Clock::time_point acceptedAt;
+    bool receivedAny = false;
+    // Set while a request head is partially buffered; the whole head has to
+    // arrive within headerTimeout of its first byte.
+    bool headPending = false;
+    Clock::time_point headStarted;
+    Clock::duration parseTime{};
+    // Response in flight. It starts as soon as the request head is parsed and
+    // streams the body back while it is still arriving: framing bytes (status
+    // line, headers, chunk sizes) are staged in `out`, body bytes go out with
+    // writev straight from the input buffer.
+    bool responding = false;
+    BodyFraming framing = BodyFraming::Length;
+    BodyDecoder body;
+    bool bodyDone = false;
+    size_t spanRemaining = 0;
+    std::string out;
+    size_t outSent = 0;
+    // Static responses: bytes [fixedSent, fixedEnd) of a cached response
+    // follow `out`, or fileRemaining bytes of fileFd are sent with sendfile().
+    std::shared_ptr<const std::string> fixed;
+    size_t fixedSent = 0;
+    size_t fixedEnd = 0;
+    int fileFd = -1;
+    off_t fileOffset = 0;
+    size_t fileRemaining = 0;
+    // Set while the response body is compressed on the fly. The output goes
+    // through `out`, as chunks unless the client speaks HTTP/1.0.
+    std::unique_ptr<Compressor> compressor;
+    bool compressChunked = false;
+    size_t responseBytes = 0;
+    Clock::time_point responseStarted;
+    std::string_view status;
+    size_t bodyReceived = 0;
+    // Access log line of a sampled request, completed once it is answered.
+    bool logAccess = false;
+    std::string accessLine;
+    int requestsServed = 0;
+    bool closeAfterWrite = false;
+    bool peerClosed = false;
+    Timer timer;
+    // Index in Worker::connections.
+    size_t slot = 0;
+    // io_uring backend: the receive and the writability poll in flight, if
+    // any. A closed connection stays allocated until both have completed,
+    // since their completions still point at it.
+    bool recvArmed = false;
+    bool writeArmed = false;
+    int ringOps = 0;
+    bool closed = false;
+};
+
+// Set by the main thread when a signal asks the server to stop. The deadline
+// is written before the flag, so a worker that sees the flag also sees it.
+struct ServerControl {
+    std::atomic<bool> draining{false};
+    Clock::time_point drainDeadline;
+    // Connections the workers closed unfinished at the deadline.
+    std::atomic<int> cutOff{0};
+};
+
+struct Worker;
+
+// What an io_uring completion is for. The tag is kept in the low bits of
+// user_data, next to the Worker or Connection it belongs to.
+enum class RingOp : uint64_t {
+    Ignore = 0,
+    Accept = 1,
+    Wake = 2,
+    Recv = 3,
+    Writable = 4,
+};
+const uint64_t RING_OP_MASK = 7;
+
+static uint64_t ringTag(const void* owner, RingOp op) {
+    return reinterpret_cast<uint64_t>(owner) | (uint64_t)op;
+}
+
+// Starts the response to conn.request. Called once the head is parsed and
+// the request passed the size limits; the handler fills conn.out, picks a
+// body framing and may attach a cached body or a file.
+using RequestHandler = void (*)(Worker&, Connection&);
+using RequestRouter = Router<RequestHandler>;
+
+struct Worker {
+    const ServerConfig* config;
+    const RequestRouter* router;
+    const MetricsRegistry* registry;
+    WorkerMetrics* metrics;
+    WorkerLog* log;
+    StaticFiles* files;
+    BufferPool* buffers;
+    // Scratch space for compressing, reused by every connection.
+    std::string compressed;
+    std::vector<char> fileBuffer;
+    // Open connections across all workers, for --max-connections.
+    std::atomic<int>* openConnections;
+    int epollFd = -1;
+    // Set instead of epollFd when the worker runs on io_uring.
+    IoRing* ring = nullptr;
+    // Closed connections still waiting for ring completions.
+    size_t zombies = 0;
+    int serverSocket = -1;
+    // The main thread writes to this eventfd to wake the worker when
+    // control->draining is set.
+    ServerControl* control;
+    int wakeFd = -1;
+    bool draining = false;
+    std::vector<Connection*> connections;
+    // Every open connection has exactly one deadline scheduled here.
+    TimerWheel timers{TIMER_RESOLUTION, TIMER_SLOTS};
+};
+
+static bool setNonBlocking(int fd) {
+    int flags = fcntl(fd, F_GETFL, 0);
+    if (flags < 0) return false;
+    return fcntl(fd, F_SETFL, flags | O_NONBLOCK) == 0;
+}
+
+static void raiseFileLimit() {
+    rlimit limit;
+    if (getrlimit(RLIMIT_NOFILE, &limit) == 0 && limit.rlim_cur < limit.rlim_max) {
+        limit.rlim_cur = limit.rlim_max;
+        setrlimit(RLIMIT_NOFILE, &limit);
+    }
+}
+
+static void appendNumber(std::string& out, size_t value) {
+    char digits[24];
+    auto result = std::to_chars(digits, digits + sizeof(digits), value);
+    out.append(digits, result.ptr);
+}
+
+static void appendHex(std::string& out, size_t value) {
+    char digits[24];
+    auto result = std::to_chars(digits, digits + sizeof(digits), value, 16);
+    out.append(digits, result.ptr);
+}
+
+static void appendConnectionHeader(Connection& conn) {
+    conn.out += conn.closeAfterWrite ? "Connection: close\r\n\r\n" : "Connection: keep-alive\r\n\r\n";
+}
+
+// Answers with `status` and its reason phrase as the body. Any request body
+// is read and dropped.
+static void startStatusResponse(Connection& conn, const char* status, std::string_view headers = {}) {
+    conn.fixed.reset();
+    conn.compressor.reset();
+    if (conn.fileFd >= 0) {
+        close(conn.fileFd);
+        conn.fileFd = -1;
+        conn.fileRemaining = 0;
+    }
+    std::string_view reason(status);
+    conn.status = reason.substr(0, 3);
+    conn.framing = BodyFraming::Discard;
+    conn.out.clear();
+    conn.out += "HTTP/1.1 ";
+    conn.out += reason;
+    conn.out += "\r\nContent-Type: text/plain\r\nContent-Length: ";
+    appendNumber(conn.out, reason.size() - 4);
+    conn.out += "\r\n";
+    conn.out += headers;
+    appendConnectionHeader(conn);
+    conn.out.append(reason.substr(4));
+    conn.outSent = 0;
+    conn.responding = true;
+}
+
+// Like startStatusResponse, but the request cannot be trusted any further:
+// its body is not read and the connection closes after the answer.
+static void startErrorResponse(Connection& conn, const char* status) {
+    conn.closeAfterWrite = true;
+    startStatusResponse(conn, status);
+    conn.bodyDone = true;
+    conn.spanRemaining = 0;
+    conn.responseBytes = 0;
+}
+
+// Decides whether this request is sampled for the access log and, if so,
+// copies the request line fields before the head is consumed.
+static void beginAccessLog(Worker& worker, Connection& conn, const HttpRequest* request) {
+    conn.logAccess = worker.log->sampleAccess();
+    if (!conn.logAccess) return;
+    conn.accessLine.clear();
+    conn.accessLine += "method=";
+    conn.accessLine += request ? request->method : "-";
+    conn.accessLine += " path=";
+    conn.accessLine += request ? request->path : "-";
+    conn.accessLine += " version=";
+    conn.accessLine += request ? request->version : "-";
+}
+
+static void startMetricsResponse(Worker& worker, Connection& conn) {
+    std::string body = worker.registry->render();
+    conn.framing = BodyFraming::Discard;
+    conn.out.clear();
+    conn.out += "HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: ";
+    appendNumber(conn.out, body.size());
+    conn.out += "\r\n";
+    appendConnectionHeader(conn);
+    conn.out += body;
+}
+
+// The encoding to compress this response with, if compression is on.
+static Encoding acceptedEncoding(const Worker& worker, const HttpRequest& request) {
+    if (worker.config->compressionLevel == 0) return Encoding::Identity;
+    return negotiateEncoding(request.acceptEncoding);
+}
+
+// Prepares on-the-fly compression and adds the matching headers; false if
+// zlib could not be set up, in which case nothing has been added.
+static bool startCompression(Worker& worker, Connection& conn, Encoding encoding) {
+    auto compressor = std::make_unique<Compressor>(encoding, worker.config->compressionLevel);
+    if (!compressor->ok()) {
+        worker.log->error("event=compress_init_failed message=\"zlib could not allocate a stream\"");
+        return false;
+    }
+    conn.compressor = std::move(compressor);
+    conn.out += "Content-Encoding: ";
+    conn.out += encodingName(encoding);
+    conn.out += "\r\nVary: Accept-Encoding\r\n";
+    // HTTP/1.0 clients cannot read chunks; closing ends the body instead.
+    conn.compressChunked = conn.request.version != "HTTP/1.0";
+    if (conn.compressChunked) {
+        conn.out += "Transfer-Encoding: chunked\r\n";
+    } else {
+        conn.closeAfterWrite = true;
+    }
+    bump(worker.metrics->compressedResponses);
+    return true;
+}
+
+// Compresses body bytes into `out`, framed as a chunk when needed. With
+// finish set the stream and the response body are closed.
+static void appendCompressed(Worker& worker, Connection& conn, const char* data, size_t size, bool finish) {
+    std::string& compressed = worker.compressed;
+    compressed.clear();
+    conn.compressor->write(data, size, compressed, finish);
+    bump(worker.metrics->compressionInput, size);
+    bump(worker.metrics->compressionOutput, compressed.size());
+    if (!compressed.empty()) {
+        if (conn.compressChunked) {
+            appendHex(conn.out, compressed.size());
+            conn.out += "\r\n";
+        }
+        conn.out += compressed;
+        if (conn.compressChunked) conn.out += "\r\n";
+    }
+    if (finish && conn.compressChunked) conn.out += "0\r\n\r\n";
+}
+
+// The request path without its query string.
+static std::string_view requestRoute(const HttpRequest& request) {
+    return request.path.substr(0, request.path.find('?'));
+}
+
+static void startStaticResponse(Worker& worker, Connection& conn) {
+    bool headOnly = conn.request.method == "HEAD";
+    StaticResponse file = worker.files->lookup(requestRoute(conn.request), conn.request.ifNoneMatch,
+                                               acceptedEncoding(worker, conn.request));
+    if (file.compressionInput > 0) {
+        bump(worker.metrics->compressionInput, file.compressionInput);
+        bump(worker.metrics->compressionOutput, file.compressionOutput);
+    }
+    if (file.kind == StaticResponse::Kind::NotFound) {
+        startStatusResponse(conn, "404 Not Found");
+        return;
+    }
+    bump(file.cacheHit ? worker.metrics->staticCacheHits : worker.metrics->staticCacheMisses);
+    conn.framing = BodyFraming::Discard;
+    conn.out.clear();
+    if (file.kind == StaticResponse::Kind::NotModified) {
+        conn.status = "304";
+        conn.out += "HTTP/1.1 304 Not Modified\r\nETag: ";
+        conn.out += file.etag;
+        conn.out += "\r\n";
+        appendConnectionHeader(conn);
+        return;
+    }
+
+    conn.status = "200";
+    if (file.kind == StaticResponse::Kind::Cached) {
+        // Only the short head is copied; the body goes out of the shared
+        // cached string.
+        if (file.encoding != Encoding::Identity) bump(worker.metrics->compressedResponses);
+        conn.out.append(*file.data, 0, file.headerLength);
+        appendConnectionHeader(conn);
+        if (!headOnly) {
+            conn.fixed = std::move(file.data);
+            conn.fixedSent = file.headerLength;
+            conn.fixedEnd = conn.fixed->size();
+        }
+        return;
+    }
+
+    conn.out += file.head;
+    if (file.encoding != Encoding::Identity && !startCompression(worker, conn, file.encoding)) {
+        close(file.fd);
+        startStatusResponse(conn, "500 Internal Server Error");
+        return;
+    }
+    appendConnectionHeader(conn);
+    if (headOnly) {
+        conn.compressor.reset();
+        close(file.fd);
+        return;
+    }
+    conn.fileFd = file.fd;
+    conn.fileOffset = 0;
+    conn.fileRemaining = file.size;
+}
+
+// Answers with "Echo: " followed by the request body, streamed back as it
+// arrives.
+static void startEchoResponse(Worker& worker, Connection& conn) {
+    conn.out.clear();
+    conn.out += "HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n";
+    // A chunked request body has no length yet, so it always qualifies.
+    Encoding encoding = acceptedEncoding(worker, conn.request);
+    bool bigEnough = conn.framing != BodyFraming::Length ||
+                     ECHO_PREFIX.size() + conn.request.contentLength >= (size_t)worker.config->compressMinSize;
+    if (encoding != Encoding::Identity && bigEnough && startCompression(worker, conn, encoding)) {
+        appendConnectionHeader(conn);
+        appendCompressed(worker, conn, ECHO_PREFIX.data(), ECHO_PREFIX.size(), false);
+        return;
+    }
+    if (conn.framing == BodyFraming::Length) {
+        conn.out += "Content-Length: ";
+        appendNumber(conn.out, ECHO_PREFIX.size() + conn.request.contentLength);
+        conn.out += "\r\n";
+    } else if (conn.framing == BodyFraming::Chunked) {
+        conn.out += "Transfer-Encoding: chunked\r\n";
+    }
+    appendConnectionHeader(conn);
+    if (conn.framing == BodyFraming::Chunked) {
+        appendHex(conn.out, ECHO_PREFIX.size());
+        conn.out += "\r\n";
+        conn.out += ECHO_PREFIX;
+        conn.out += "\r\n";
+    } else {
+        conn.out += ECHO_PREFIX;
+    }
+}
+
+// Answers the --synthetic-routes padding with an empty 200.
+static void startSyntheticResponse(Worker&, Connection& conn) {
+    startStatusResponse(conn, "200 OK");
+}
+
+// Every route the server answers. Handlers only build the response; reading
+// the body and writing everything out stays in pumpResponse.
+static void addRoutes(RequestRouter& router, const ServerConfig& config) {
+    router.add("GET", "/metrics", startMetricsResponse);
+    for (int i = 0; i < config.syntheticRoutes; ++i) {
+        router.add("GET", "/synthetic/" + std::to_string(i), startSyntheticResponse);
+    }
+    if (!config.staticDir.empty()) {
+        router.add("GET", "/*", startStaticResponse);
+        router.add("HEAD", "/*", startStaticResponse);
+    }
+    router.add("POST", "/*", startEchoResponse);
+    router.add("PUT", "/*", startEchoResponse);
+}
+
+// Parses the next request head out of the input buffer and starts its
+// response. Returns false while the head is still incomplete.
+static bool startResponse(Worker& worker, Connection& conn) {
+    const ServerConfig& config = *worker.config;
+    size_t available = conn.inEnd - conn.inStart;
+    if (available == 0) return false;
+    Clock::time_point parseStart = Clock::now();
+    RequestParser::Status status = conn.parser.parse(conn.in.data() + conn.inStart, available, conn.request);
+    Clock::time_point parseEnd = Clock::now();
+    conn.parseTime += parseEnd - parseStart;
+    conn.responseStarted = parseEnd;
+    if (status == RequestParser::Status::Incomplete && available < (size_t)config.maxHeaderSize) {
+        return false;
+    }
+    if (conn.out.capacity() < INITIAL_BUFFER_SIZE) {
+        conn.out = worker.buffers->acquire(INITIAL_BUFFER_SIZE);
+    }
+    if (status == RequestParser::Status::Incomplete) {
+        conn.headPending = false;
+        bump(worker.metrics->parseErrors);
+        beginAccessLog(worker, conn, nullptr);
+        startErrorResponse(conn, "431 Request Header Fields Too Large");
+        return true;
+    }
+    if (status == RequestParser::Status::Error) {
+        conn.headPending = false;
+        bump(worker.metrics->parseErrors);
+        beginAccessLog(worker, conn, nullptr);
+        startErrorResponse(conn, "400 Bad Request");
+        return true;
+    }
+    conn.headPending = false;
+    bump(worker.metrics->requests);
+    worker.metrics->parse.record(conn.parseTime);
+
+    const HttpRequest& request = conn.request;
+    beginAccessLog(worker, conn, &request);
+    if (request.headerLength > (size_t)config.maxHeaderSize) {
+        startErrorResponse(conn, "431 Request Header Fields Too Large");
+        return true;
+    }
+    if (config.maxBodySize > 0 && request.contentLength > (size_t)config.maxBodySize) {
+        startErrorResponse(conn, "413 Content Too Large");
+        return true;
+    }
+    conn.status = "200";
+    conn.bodyReceived = 0;
+
+    ++conn.requestsServed;
+    bool keepAlive = request.keepAlive && !conn.peerClosed && !worker.draining &&
+                     (config.maxRequests == 0 || conn.requestsServed < config.maxRequests);
+    conn.framing = BodyFraming::Length;
+    if (request.chunked) {
+        // HTTP/1.0 clients cannot parse a chunked response, so the end of
+        // the body is signalled by closing the connection instead.
+        conn.framing = request.version == "HTTP/1.0" ? BodyFraming::Close : BodyFraming::Chunked;
+    }
+    if (!keepAlive || conn.framing == BodyFraming::Close) {
+        conn.closeAfterWrite = true;
+    }
+
+    conn.inStart += request.headerLength;
+    conn.body.start(request);
+    conn.bodyDone = false;
+    conn.spanRemaining = 0;
+    conn.outSent = 0;
+    conn.responseBytes = 0;
+    conn.responding = true;
+
+    std::string_view route = requestRoute(request);
+    Clock::time_point routeStart = Clock::now();
+    RequestRouter::Match match = worker.router->find(request.method, route);
+    worker.metrics->route.record(Clock::now() - routeStart);
+    if (match.status == RequestRouter::Status::Found) {
+        (*match.handler)(worker, conn);
+    } else if (match.status == RequestRouter::Status::MethodNotAllowed) {
+        std::string allow = "Allow: " + worker.router->allowedMethods(route) + "\r\n";
+        startStatusResponse(conn, "405 Method Not Allowed", allow);
+    } else {
+        startStatusResponse(conn, "404 Not Found");
+    }
+    return true;
+}
+
+static void finishResponse(Worker& worker, Connection& conn) {
+    Clock::duration elapsed = Clock::now() - conn.responseStarted;
+    worker.metrics->send.record(elapsed);
+    if (conn.logAccess) {
+        conn.accessLine += " status=";
+        conn.accessLine += conn.status;
+        conn.accessLine += " bytes=";
+        appendNumber(conn.accessLine, conn.responseBytes);
+        conn.accessLine += " duration_us=";
+        appendNumber(conn.accessLine, (size_t)std::chrono::duration_cast<std::chrono::microseconds>(elapsed).count());
+        worker.log->access(conn.accessLine);
+    }
+    if (conn.inStart == conn.inEnd) {
+        conn.inStart = conn.inEnd = 0;
+        worker.buffers->release(conn.in);
+    }
+    worker.buffers->release(conn.out);
+    conn.outSent = 0;
+    conn.fixed.reset();
+    conn.compressor.reset();
+    if (conn.fileFd >= 0) {
+        close(conn.fileFd);
+        conn.fileFd = -1;
+    }
+    conn.parser.reset();
+    conn.parseTime = Clock::duration::zero();
+    conn.responding = false;
+}
+
+enum class IoResult {
+    Done,
+    NeedInput,
+    Blocked,
+    Failed,
+};
+
+// Sends the rest of a static file straight from the page cache.
+static IoResult sendFile(Worker& worker, Connection& conn) {
+    while (conn.fileRemaining > 0) {
+        ssize_t sent = sendfile(conn.fd, conn.fileFd, &conn.fileOffset, conn.fileRemaining);
+        if (sent < 0) {
+            if (errno == EINTR) continue;
+            if (errno == EAGAIN || errno == EWOULDBLOCK) return IoResult::Blocked;
+            worker.log->error("sendfile", errno);
+            return IoResult::Failed;
+        }
+        if (sent == 0) {
+            // The file shrank after its length went out in the headers.
+            worker.log->error("event=file_truncated message=\"Static file shrank while being sent\"");
+            return IoResult::Failed;
+        }
+        conn.fileRemaining -= (size_t)sent;
+        conn.responseBytes += (size_t)sent;
+        bump(worker.metrics->bytesSent, (uint64_t)sent);
+    }
+    return IoResult::Done;
+}
+
+// Reads the next block of a static file and compresses it into `out`.
+static IoResult compressFile(Worker& worker, Connection& conn) {
+    std::vector<char>& buffer = worker.fileBuffer;
+    buffer.resize(FILE_READ_SIZE);
+    ssize_t n = pread(conn.fileFd, buffer.data(), std::min(buffer.size(), conn.fileRemaining), conn.fileOffset);
+    if (n < 0 && errno == EINTR) return IoResult::Done;
+    if (n < 0) {
+        worker.log->error("pread", errno);
+        return IoResult::Failed;
+    }
+    if (n == 0) {
+        worker.log->error("event=file_truncated message=\"Static file shrank while being sent\"");
+        return IoResult::Failed;
+    }
+    conn.fileOffset += n;
+    conn.fileRemaining -= (size_t)n;
+    appendCompressed(worker, conn, buffer.data(), (size_t)n, conn.fileRemaining == 0);
+    return IoResult::Done;
+}
+
+// Forwards as much of the response as the socket accepts. Request body bytes
+// leave the input buffer only once they have been written back.
+static IoResult pumpResponse(Worker& worker, Connection& conn) {
+    while (true) {
+        bool outputFull = conn.compressor && conn.out.size() - conn.outSent >= COMPRESS_HIGH_WATER;
+        if (conn.spanRemaining == 0 && !conn.bodyDone && !outputFull) {
+            size_t consumed = 0, span = 0;
+            BodyDecoder::Status status = conn.body.next(conn.in.data() + conn.inStart,
+                                                        conn.inEnd - conn.inStart, consumed, span);
+            conn.inStart += consumed;
+            if (status == BodyDecoder::Status::Error) {
+                // Nothing of the echo has left yet, so the client can still
+                // get a proper error; otherwise the response is cut short.
+                bump(worker.metrics->parseErrors);
+                if (conn.responseBytes == 0) {
+                    startErrorResponse(conn, "400 Bad Request");
+                    continue;
+                }
+                worker.log->error("event=bad_chunk message=\"Malformed chunked request body, dropping connection\"");
+                return IoResult::Failed;
+            }
+            if (status == BodyDecoder::Status::Data) {
+                // Only chunked bodies can grow past a limit checked up front.
+                conn.bodyReceived += span;
+                int limit = worker.config->maxBodySize;
+                if (limit > 0 && conn.bodyReceived > (size_t)limit) {
+                    if (conn.responseBytes == 0) {
+                        startErrorResponse(conn, "413 Content Too Large");
+                        continue;
+                    }
+                    worker.log->error("event=body_too_large message=\"Chunked body over --max-body-size, dropping connection\"");
+                    return IoResult::Failed;
+                }
+            }
+            if (status == BodyDecoder::Status::Data && conn.framing == BodyFraming::Discard) {
+                conn.inStart += span;
+                conn.body.advance(span);
+                continue;
+            }
+            if (status == BodyDecoder::Status::Data && conn.compressor) {
+                appendCompressed(worker, conn, conn.in.data() + conn.inStart, span, false);
+                conn.inStart += span;
+                conn.body.advance(span);
+                continue;
+            }
+            if (status == BodyDecoder::Status::Data) {
+                conn.spanRemaining = span;
+                if (conn.framing == BodyFraming::Chunked) {
+                    appendHex(conn.out, span);
+                    conn.out += "\r\n";
+                }
+            } else if (status == BodyDecoder::Status::Done) {
+                conn.bodyDone = true;
+                if (conn.compressor && conn.framing != BodyFraming::Discard) {
+                    appendCompressed(worker, conn, nullptr, 0, true);
+                } else if (conn.framing == BodyFraming::Chunked) {
+                    conn.out += "0\r\n\r\n";
+                }
+            }
+        }
+
+        size_t pending = conn.out.size() - conn.outSent;
+        size_t fixedPending = conn.fixed ? conn.fixedEnd - conn.fixedSent : 0;
+        if (pending == 0 && conn.spanRemaining == 0 && fixedPending == 0) {
+            if (conn.fileRemaining > 0) {
+                IoResult result = conn.compressor ? compressFile(worker, conn) : sendFile(worker, conn);
+                if (result != IoResult::Done) return result;
+                continue;
+            }
+            return conn.bodyDone ? IoResult::Done : IoResult::NeedInput;
+        }
+
+        iovec iov[2];
+        int count = 0;
+        if (pending > 0) {
+            iov[count].iov_base = conn.out.data() + conn.outSent;
+            iov[count].iov_len = pending;
+            ++count;
+        }
+        if (conn.spanRemaining > 0) {
+            iov[count].iov_base = conn.in.data() + conn.inStart;
+            iov[count].iov_len = conn.spanRemaining;
+            ++count;
+        } else if (fixedPending > 0) {
+            iov[count].iov_base = const_cast<char*>(conn.fixed->data()) + conn.fixedSent;
+            iov[count].iov_len = fixedPending;
+            ++count;
+        }
+
+        ssize_t sent = writev(conn.fd, iov, count);
+        if (sent < 0) {
+            if (errno == EINTR) continue;
+            if (errno == EAGAIN || errno == EWOULDBLOCK) return IoResult::Blocked;
+            worker.log->error("writev", errno);
+            return IoResult::Failed;
+        }
+        conn.responseBytes += (size_t)sent;
+        bump(worker.metrics->bytesSent, (uint64_t)sent);
+
+        size_t fromOut = std::min((size_t)sent, pending);
+        conn.outSent += fromOut;
+        if (conn.outSent == conn.out.size()) {
+            conn.out.clear();
+            conn.outSent = 0;
+        }
+        size_t fromBody = (size_t)sent - fromOut;
+        if (fromBody > 0 && conn.spanRemaining == 0) {
+            conn.fixedSent += fromBody;
+        } else if (fromBody > 0) {
+            conn.inStart += fromBody;
+            conn.spanRemaining -= fromBody;
+            conn.body.advance(fromBody);
+            if (conn.spanRemaining == 0 && conn.framing == BodyFraming::Chunked) {
+                conn.out += "\r\n";
+            }
+        }
+    }
+}
+
+// Makes room for `need` bytes at the end of the input buffer, first by
+// dropping consumed bytes and only then by growing it, never beyond `limit`.
+static void reserveInput(Worker& worker, Connection& conn, size_t limit, size_t need = 1) {
+    if (conn.inStart > 0) {
+        std::memmove(conn.in.data(), conn.in.data() + conn.inStart, conn.inEnd - conn.inStart);
+        conn.inEnd -= conn.inStart;
+        conn.inStart = 0;
+    }
+    if (conn.in.size() - conn.inEnd < need && conn.in.size() < limit) {
+        size_t size = std::max({INITIAL_BUFFER_SIZE, conn.in.size() * 2, conn.inEnd + need});
+        std::string bigger = worker.buffers->acquire(std::min(limit, size));
+        bigger.resize(std::min(limit, bigger.capacity()));
+        std::memcpy(bigger.data(), conn.in.data(), conn.inEnd);
+        worker.buffers->release(conn.in);
+        conn.in = std::move(bigger);
+    }
+}
+
+static void noteReceived(Worker& worker, Connection& conn, size_t n) {
+    conn.inEnd += n;
+    bump(worker.metrics->bytesReceived, (uint64_t)n);
+    if (!conn.receivedAny) {
+        conn.receivedAny = true;
+        worker.metrics->firstByte.record(Clock::now() - conn.acceptedAt);
+    }
+}
+
+// Reads until the socket is drained or the input buffer is full; in the
+// latter case reading resumes once the response has caught up, which pushes
+// back on the sender through TCP flow control. Returns false when the
+// connection has to be closed.
+static bool handleRead(Worker& worker, Connection& conn) {
+    size_t limit = (size_t)worker.config->streamBufferSize;
+    while (true) {
+        if (conn.inEnd - conn.inStart >= limit) {
+            conn.readPaused = true;
+            return true;
+        }
+        if (conn.inEnd == conn.in.size()) {
+            reserveInput(worker, conn, limit);
+        }
+        size_t room = std::min(conn.in.size() - conn.inEnd, limit - (conn.inEnd - conn.inStart));
+        ssize_t n = recv(conn.fd, conn.in.data() + conn.inEnd, room, 0);
+        if (n > 0) {
+            noteReceived(worker, conn, (size_t)n);
+            continue;
+        }
+        conn.readPaused = false;
+        if (n == 0) {
+            conn.peerClosed = true;
+            return true;
+        }
+        if (errno == EINTR) continue;
+        if (errno == EAGAIN || errno == EWOULDBLOCK) return true;
+        worker.log->error("recv", errno);
+        return false;
+    }
+}
+
+// Answers requests from the input buffer one after another, in order, so
+// pipelined requests come back in the sequence they arrived. Returns false
+// when the connection has to be closed.
+static bool processRequests(Worker& worker, Connection& conn) {
+    while (true) {
+        if (conn.readPaused && conn.inEnd - conn.inStart < (size_t)worker.config->streamBufferSize) {
+            if (!handleRead(worker, conn)) return false;
+        }
+        if (!conn.responding && !startResponse(worker, conn)) {
+            if (conn.readPaused) continue;
+            return !conn.peerClosed;
+        }
+        IoResult result = pumpResponse(worker, conn);
+        if (result == IoResult::Failed) return false;
+        if (result == IoResult::Blocked) return true;
+        if (result == IoResult::NeedInput) {
+            if (conn.readPaused) continue;
+            return !conn.peerClosed;
+        }
+        finishResponse(worker, conn);
+        if (conn.closeAfterWrite) return false;
+        // A draining worker closes connections as soon as they go idle.
+        if (worker.draining && conn.inStart == conn.inEnd) return false;
+    }
+}
+
+// Picks the deadline that applies to the connection's current state: a
+// partially received request head must complete within headerTimeout of its
+// first byte however slowly it trickles in, a response in flight must make
+// progress every ioTimeout, and an idle keep-alive connection is closed after
+// keepAliveTimeout.
+static void scheduleDeadline(Worker& worker, Connection* conn) {
+    const ServerConfig& config = *worker.config;
+    Clock::time_point now = Clock::now();
+    Clock::time_point deadline;
+    if (conn->responding) {
+        deadline = now + std::chrono::seconds(config.ioTimeout);
+    } else if (conn->inEnd > conn->inStart) {
+        if (!conn->headPending) {
+            conn->headPending = true;
+            conn->headStarted = now;
+        }
+        deadline = conn->headStarted + std::chrono::seconds(config.headerTimeout);
+    } else {
+        deadline = now + std::chrono::seconds(config.keepAliveTimeout);
+    }
+    worker.timers.schedule(conn->timer, deadline);
+}
+
+// Best effort: the socket is about to be closed, so a short write is simply
+// dropped.
+static void sendFinalResponse(int fd, std::string_view response) {
+    ssize_t sent = send(fd, response.data(), response.size(), MSG_NOSIGNAL | MSG_DONTWAIT);
+    (void)sent;
+}
+
+static void queueCancel(IoRing& ring, uint64_t userData) {
+    io_uring_sqe* sqe = ring.next();
+    sqe->opcode = IORING_OP_ASYNC_CANCEL;
+    sqe->addr = userData;
+    sqe->flags = IOSQE_IO_HARDLINK;
+}
+
+// Sends finalResponse, if any, and closes the socket. On io_uring both are
+// queued as one linked chain, led by cancels for what `conn` still has in
+// flight on the socket, so nothing is left holding it open.
+static void closeSocket(Worker& worker, int fd, std::string_view finalResponse, const Connection* conn = nullptr) {
+    bool recvArmed = conn != nullptr && conn->recvArmed;
+    bool writeArmed = conn != nullptr && conn->writeArmed;
+    if (worker.ring != nullptr && worker.ring->reserve(4)) {
+        IoRing& ring = *worker.ring;
+        if (recvArmed) queueCancel(ring, ringTag(conn, RingOp::Recv));
+        if (writeArmed) queueCancel(ring, ringTag(conn, RingOp::Writable));
+        if (!finalResponse.empty()) {
+            io_uring_sqe* sqe = ring.next();
+            sqe->opcode = IORING_OP_SEND;
+            sqe->fd = fd;
+            sqe->addr = reinterpret_cast<uint64_t>(finalResponse.data());
+            sqe->len = (uint32_t)finalResponse.size();
+            sqe->msg_flags = MSG_NOSIGNAL | MSG_DONTWAIT;
+            sqe->flags = IOSQE_IO_HARDLINK;
+        }
+        io_uring_sqe* sqe = ring.next();
+        sqe->opcode = IORING_OP_CLOSE;
+        sqe->fd = fd;
+        return;
+    }
+    if (!finalResponse.empty()) sendFinalResponse(fd, finalResponse);
+    // With the ring full, shutdown() is what ends the pending operations.
+    if (recvArmed || writeArmed) shutdown(fd, SHUT_RDWR);
+    close(fd);
+}
+
+static void closeConnection(Worker& worker, Connection* conn, std::string_view finalResponse = {}) {
+    worker.timers.cancel(conn->timer);
+    worker.openConnections->fetch_sub(1, std::memory_order_relaxed);
+    bump(worker.metrics->connectionsClosed);
+    Connection* last = worker.connections.back();
+    last->slot = conn->slot;
+    worker.connections[conn->slot] = last;
+    worker.connections.pop_back();
+    if (conn->fileFd >= 0) close(conn->fileFd);
+    closeSocket(worker, conn->fd, finalResponse, conn);
+    worker.buffers->release(conn->in);
+    worker.buffers->release(conn->out);
+    if (conn->ringOps > 0) {
+        conn->closed = true;
+        ++worker.zombies;
+        return;
+    }
+    delete conn;
+}
+
+static void handleEvent(Worker& worker, Connection* conn, uint32_t events) {
+    bool keep = true;
+    if (events & (EPOLLIN | EPOLLRDHUP | EPOLLHUP | EPOLLERR)) {
+        keep = handleRead(worker, *conn);
+    }
+    if (keep) {
+        keep = processRequests(worker, *conn);
+    }
+    if (keep) {
+        scheduleDeadline(worker, conn);
+    } else {
+        closeConnection(worker, conn);
+    }
+}
+
+static bool hasPendingOutput(const Connection& conn) {
+    return conn.out.size() > conn.outSent || conn.spanRemaining > 0 ||
+           (conn.fixed && conn.fixedEnd > conn.fixedSent) || conn.fileRemaining > 0;
+}
+
+// Queues what the connection waits for on io_uring: a receive into one of
+// the provided buffers while its input buffer has room, and a poll for
+// writability while a response is stuck behind a full socket. Writes
+// themselves stay direct writev() and sendfile() calls. Returns false if
+// the ring had no room.
+static bool armConnection(Worker& worker, Connection& conn) {
+    IoRing& ring = *worker.ring;
+    if (!conn.writeArmed && hasPendingOutput(conn)) {
+        io_uring_sqe* sqe = ring.next();
+        if (sqe == nullptr) return false;
+        sqe->opcode = IORING_OP_POLL_ADD;
+        sqe->fd = conn.fd;
+        sqe->poll32_events = POLLOUT;
+        sqe->user_data = ringTag(&conn, RingOp::Writable);
+        conn.writeArmed = true;
+        ++conn.ringOps;
+    }
+    if (conn.recvArmed || conn.peerClosed || conn.readPaused) return true;
+    size_t limit = (size_t)worker.config->streamBufferSize;
+    size_t unconsumed = conn.inEnd - conn.inStart;
+    if (unconsumed >= limit) {
+        // processRequests reads the rest directly once the response has
+        // caught up.
+        conn.readPaused = true;
+        return true;
+    }
+    io_uring_sqe* sqe = ring.next();
+    if (sqe == nullptr) return false;
+    sqe->opcode = IORING_OP_RECV;
+    sqe->fd = conn.fd;
+    sqe->len = (uint32_t)std::min(limit - unconsumed, (size_t)ring.bufferSize());
+    sqe->flags = IOSQE_BUFFER_SELECT;
+    sqe->buf_group = RING_BUFFER_GROUP;
+    sqe->user_data = ringTag(&conn, RingOp::Recv);
+    conn.recvArmed = true;
+    ++conn.ringOps;
+    return true;
+}
+
+// Copies what a ring receive brought into the input buffer and gives the
+// provided buffer back. Returns false when the connection has to be closed.
+static bool receiveCompleted(Worker& worker, Connection& conn, int result, uint32_t flags) {
+    if (flags & IORING_CQE_F_BUFFER) {
+        uint16_t id = (uint16_t)(flags >> IORING_CQE_BUFFER_SHIFT);
+        if (result > 0) {
+            if (conn.in.size() - conn.inEnd < (size_t)result) {
+                reserveInput(worker, conn, (size_t)worker.config->streamBufferSize, (size_t)result);
+            }
+            std::memcpy(conn.in.data() + conn.inEnd, worker.ring->buffer(id), (size_t)result);
+            noteReceived(worker, conn, (size_t)result);
+        }
+        worker.ring->recycle(id, ringTag(nullptr, RingOp::Ignore));
+    }
+    if (result == 0) {
+        conn.peerClosed = true;
+        return true;
+    }
+    // Every provided buffer is taken; read into the connection's own.
+    if (result == -ENOBUFS) return handleRead(worker, conn);
+    if (result < 0 && result != -EINTR && result != -EAGAIN) {
+        worker.log->error("recv", -result);
+        return false;
+    }
+    return true;
+}
+
+static void expireConnections(Worker& worker) {
+    worker.timers.expire(Clock::now(), [&](Timer& timer) {
+        Connection* conn = static_cast<Connection*>(timer.data);
+        if (conn->headPending || conn->responding) {
+            bump(worker.metrics->timeouts);
+        }
+        closeConnection(worker, conn, conn->headPending ? REQUEST_TIMEOUT : std::string_view());
+    });
+}
+
+// Takes on a freshly accepted socket, or sheds it straight away when
+// --max-connections is reached.
+static void acceptConnection(Worker& worker, int clientSocket) {
+    int limit = worker.config->maxConnections;
+    int open = worker.openConnections->fetch_add(1, std::memory_order_relaxed);
+    if (limit > 0 && open >= limit) {
+        // Shed load before spending anything on the connection.
+        worker.openConnections->fetch_sub(1, std::memory_order_relaxed);
+        bump(worker.metrics->connectionsRejected);
+        closeSocket(worker, clientSocket, SERVICE_UNAVAILABLE);
+        return;
+    }
+
+    bump(worker.metrics->connectionsAccepted);
+    Connection* conn = new Connection();
+    conn->fd = clientSocket;
+    conn->acceptedAt = Clock::now();
+    conn->timer.data = conn;
+    conn->slot = worker.connections.size();
+    worker.connections.push_back(conn);
+    scheduleDeadline(worker, conn);
+
+    if (worker.ring != nullptr) {
+        if (!armConnection(worker, *conn)) {
+            worker.log->error("event=ring_full message=\"No room on the io_uring submission queue\"");
+            closeConnection(worker, conn);
+        }
+        return;
+    }
+    epoll_event ev;
+    ev.events = EPOLLIN | EPOLLOUT | EPOLLRDHUP | EPOLLET;
+    ev.data.ptr = conn;
+    if (epoll_ctl(worker.epollFd, EPOLL_CTL_ADD, clientSocket, &ev) < 0) {
+        worker.log->error("epoll_ctl", errno);
+        closeConnection(worker, conn);
+    }
+}
+
+static void acceptConnections(Worker& worker) {
+    while (true) {
+        int clientSocket = accept4(worker.serverSocket, nullptr, nullptr, SOCK_NONBLOCK | SOCK_CLOEXEC);
+        if (clientSocket < 0) {
+            if (errno == EINTR) continue;
+            if (errno != EAGAIN && errno != EWOULDBLOCK) worker.log->error("accept", errno);
+            return;
+        }
+        acceptConnection(worker, clientSocket);
+    }
+}
+
+// One multishot accept stays queued on the listener and completes once per
+// new connection.
+static void armAccept(Worker& worker) {
+    io_uring_sqe* sqe = worker.ring->next();
+    if (sqe == nullptr) return;
+    sqe->opcode = IORING_OP_ACCEPT;
+    sqe->fd = worker.serverSocket;
+    sqe->ioprio = IORING_ACCEPT_MULTISHOT;
+    sqe->accept_flags = SOCK_NONBLOCK | SOCK_CLOEXEC;
+    sqe->user_data = ringTag(&worker, RingOp::Accept);
+}
+
+static void armWake(Worker& worker) {
+    io_uring_sqe* sqe = worker.ring->next();
+    if (sqe == nullptr) return;
+    sqe->opcode = IORING_OP_POLL_ADD;
+    sqe->fd = worker.wakeFd;
+    sqe->poll32_events = POLLIN;
+    sqe->user_data = ringTag(&worker, RingOp::Wake);
+}
+
+static int createListener(int port, int backlog) {
+    int serverSocket = socket(AF_INET, SOCK_STREAM | SOCK_CLOEXEC, 0);
     if (serverSocket < 0) {
         perror("socket");
-        return 1;
+        return -1;
     }
 
     int opt = 1;
-    if (setsockopt(serverSocket, SOL_SOCKET, SO_REUSEADDR, &opt, sizeof(opt)) < 0) {
+    if (setsockopt(serverSocket, SOL_SOCKET, SO_REUSEADDR, &opt, sizeof(opt)) < 0 ||
+        setsockopt(serverSocket, SOL_SOCKET, SO_REUSEPORT, &opt, sizeof(opt)) < 0) {
         perror("setsockopt");
         close(serverSocket);
-        return 1;
+        return -1;
     }
 
     sockaddr_in serverAddress;
@@ -35,122 +1151,550 @@ int startServer(int port, int backlog) {
     if (bind(serverSocket, (struct sockaddr*)&serverAddress, sizeof(serverAddress)) < 0) {
         perror("bind");
         close(serverSocket);
-        return 1;
+        return -1;
     }
 
     if (listen(serverSocket, backlog) < 0) {
         perror("listen");
         close(serverSocket);
-        return 1;
+        return -1;
     }
 
-    cout << "Server is listening on port " << port << "...\n" << std::flush;
+    if (!setNonBlocking(serverSocket)) {
+        perror("fcntl");
+        close(serverSocket);
+        return -1;
+    }
+    return serverSocket;
+}
 
+static int boundPort(int serverSocket) {
+    sockaddr_in address;
+    socklen_t length = sizeof(address);
+    if (getsockname(serverSocket, (struct sockaddr*)&address, &length) < 0) {
+        perror("getsockname");
+        return -1;
+    }
+    return ntohs(address.sin_port);
+}
+
+// Stops accepting and lets the open connections finish: idle keep-alive
+// connections are closed now, the rest after their current response. What
+// is already in the accept queue is still taken; after a reload the new
+// process accepts everything that arrives later on the same sockets.
+static void startDrain(Worker& worker) {
+    worker.draining = true;
+    if (worker.ring != nullptr && worker.ring->reserve(1)) {
+        queueCancel(*worker.ring, ringTag(&worker, RingOp::Accept));
+    }
+    acceptConnections(worker);
+    if (worker.ring == nullptr) epoll_ctl(worker.epollFd, EPOLL_CTL_DEL, worker.serverSocket, nullptr);
+    std::vector<Connection*> idle;
+    for (Connection* conn : worker.connections) {
+        if (!conn->responding && conn->inStart == conn->inEnd && conn->requestsServed > 0) idle.push_back(conn);
+    }
+    for (Connection* conn : idle) {
+        closeConnection(worker, conn);
+    }
+}
+
+static void handleCompletion(Worker& worker, uint64_t userData, int result, uint32_t flags) {
+    RingOp op = (RingOp)(userData & RING_OP_MASK);
+    if (op == RingOp::Ignore) return;
+    if (op == RingOp::Accept) {
+        if (result >= 0) {
+            acceptConnection(worker, result);
+        } else if (result != -ECANCELED && result != -EAGAIN && result != -EINTR) {
+            worker.log->error("accept", -result);
+        }
+        if (!(flags & IORING_CQE_F_MORE) && !worker.draining) armAccept(worker);
+        return;
+    }
+    if (op == RingOp::Wake) {
+        uint64_t count;
+        ssize_t got = read(worker.wakeFd, &count, sizeof(count));
+        (void)got;
+        if (!worker.draining && worker.control->draining.load(std::memory_order_acquire)) startDrain(worker);
+        if (!worker.draining) armWake(worker);
+        return;
+    }
+
+    Connection* conn = reinterpret_cast<Connection*>(userData & ~RING_OP_MASK);
+    --conn->ringOps;
+    if (op == RingOp::Recv) {
+        conn->recvArmed = false;
+    } else {
+        conn->writeArmed = false;
+    }
+    if (conn->closed) {
+        if (flags & IORING_CQE_F_BUFFER) {
+            worker.ring->recycle((uint16_t)(flags >> IORING_CQE_BUFFER_SHIFT), ringTag(nullptr, RingOp::Ignore));
+        }
+        if (conn->ringOps == 0) {
+            --worker.zombies;
+            delete conn;
+        }
+        return;
+    }
+    bool keep = true;
+    if (op == RingOp::Recv) {
+        keep = receiveCompleted(worker, *conn, result, flags);
+    }
+    if (keep) {
+        keep = processRequests(worker, *conn);
+    }
+    if (keep) {
+        keep = armConnection(worker, *conn);
+        if (!keep) worker.log->error("event=ring_full message=\"No room on the io_uring submission queue\"");
+    }
+    if (keep) {
+        scheduleDeadline(worker, conn);
+    } else {
+        closeConnection(worker, conn);
+    }
+}
+
+// Sets up a ring with every opcode the uring backend uses, but no buffers.
+static bool initRing(IoRing& ring, unsigned entries) {
+    // Multishot accept cannot be probed for; IORING_OP_SOCKET arrived in the
+    // same kernel release (5.19) and stands in for it.
+    return ring.init(entries, {IORING_OP_ACCEPT, IORING_OP_RECV, IORING_OP_SEND, IORING_OP_CLOSE,
+                               IORING_OP_ASYNC_CANCEL, IORING_OP_POLL_ADD, IORING_OP_PROVIDE_BUFFERS,
+                               IORING_OP_SOCKET});
+}
+
+// Sets up the worker's ring, or explains why it cannot have one.
+static std::unique_ptr<IoRing> createRing(std::string& error) {
+    auto ring = std::make_unique<IoRing>();
+    if (!initRing(*ring, RING_ENTRIES) ||
+        !ring->provideBuffers(RING_BUFFER_GROUP, RING_BUFFER_COUNT, RING_BUFFER_SIZE)) {
+        error = ring->error();
+        return nullptr;
+    }
+    return ring;
+}
+
+static int runWorker(const ServerConfig* config, const RequestRouter* router, const MetricsRegistry* registry,
+                     WorkerMetrics* metrics, const Logger* logger, LogRing* ring, std::atomic<int>* openConnections,
+                     ServerControl* control, int serverSocket, int wakeFd) {
+    WorkerLog log(*logger, *ring);
+    std::unique_ptr<StaticFiles> files;
+    if (!config->staticDir.empty()) {
+        CompressionConfig compression{config->compressionLevel, (size_t)config->compressMinSize};
+        files = std::make_unique<StaticFiles>(config->staticDir, (size_t)config->cacheSize / config->workers,
+                                              (size_t)config->cacheMaxFile, compression);
+    }
+    BufferPool buffers((size_t)config->bufferPoolSize / config->workers, metrics->bufferPool);
+    Worker worker;
+    worker.files = files.get();
+    worker.buffers = &buffers;
+    worker.config = config;
+    worker.router = router;
+    worker.registry = registry;
+    worker.metrics = metrics;
+    worker.log = &log;
+    worker.openConnections = openConnections;
+    worker.control = control;
+    worker.serverSocket = serverSocket;
+    worker.wakeFd = wakeFd;
+    std::unique_ptr<IoRing> ioRing;
+    if (config->ioBackend == IoBackend::Uring) {
+        std::string error;
+        ioRing = createRing(error);
+        if (ioRing == nullptr) {
+            log.error("event=io_uring_unavailable message=\"" + error + ", falling back to epoll\"");
+        }
+    }
+    if (ioRing != nullptr) {
+        worker.ring = ioRing.get();
+        armAccept(worker);
+        armWake(worker);
+    } else {
+        worker.epollFd = epoll_create1(EPOLL_CLOEXEC);
+        if (worker.epollFd < 0) {
+            perror("epoll_create1");
+            return 1;
+        }
+
+        // The listener is tagged with nullptr and the wake eventfd with the
+        // worker itself; everything else is a Connection.
+        epoll_event listenEvent;
+        listenEvent.events = EPOLLIN | EPOLLET;
+        listenEvent.data.ptr = nullptr;
+        epoll_event wakeEvent;
+        wakeEvent.events = EPOLLIN;
+        wakeEvent.data.ptr = &worker;
+        if (epoll_ctl(worker.epollFd, EPOLL_CTL_ADD, serverSocket, &listenEvent) < 0 ||
+            epoll_ctl(worker.epollFd, EPOLL_CTL_ADD, wakeFd, &wakeEvent) < 0) {
+            perror("epoll_ctl");
+            close(worker.epollFd);
+            return 1;
+        }
+    }
+    // The drain may have started before this worker got here.
+    if (control->draining.load(std::memory_order_acquire)) startDrain(worker);
+
+    epoll_event events[MAX_EVENTS];
+    int result = 1;
     while (true) {
-        int clientSocket = accept(serverSocket, nullptr, nullptr);
-        if (clientSocket < 0) {
-            perror("accept");
+        Clock::time_point now = Clock::now();
+        int timeout = worker.timers.nextTimeout(now);
+        if (worker.draining) {
+            if (worker.connections.empty() || now >= control->drainDeadline) {
+                control->cutOff.fetch_add((int)worker.connections.size(), std::memory_order_relaxed);
+                result = 0;
+                break;
+            }
+            auto left = std::chrono::duration_cast<std::chrono::milliseconds>(control->drainDeadline - now);
+            if (timeout < 0 || left.count() + 1 < timeout) timeout = (int)left.count() + 1;
+        }
+        if (worker.ring != nullptr) {
+            // One io_uring_enter() submits everything queued since the last
+            // one and waits for completions.
+            if (!worker.ring->submitAndWait(timeout)) {
+                perror("io_uring_enter");
+                break;
+            }
+            worker.ring->forEachCompletion([&](uint64_t userData, int res, uint32_t flags) {
+                handleCompletion(worker, userData, res, flags);
+            });
+            expireConnections(worker);
             continue;
         }
+        int ready = epoll_wait(worker.epollFd, events, MAX_EVENTS, timeout);
+        if (ready < 0) {
+            if (errno == EINTR) continue;
+            perror("epoll_wait");
+            break;
+        }
 
-        std::string request;
-        char buf[4096];
-        ssize_t n;
-        size_t headerEnd = std::string::npos;
-        int contentLength = 0;
-
-        while ((n = recv(clientSocket, buf, sizeof(buf), 0)) > 0) {
-            request.append(buf, (size_t)n);
-            if (headerEnd == std::string::npos) {
-                headerEnd = request.find("\r\n\r\n");
-                if (headerEnd != std::string::npos) {
-                    std::string headers = request.substr(0, headerEnd);
-                    std::string lower = headers;
-                    std::transform(lower.begin(), lower.end(), lower.begin(), ::tolower);
-                    size_t pos = lower.find("content-length:");
-                    if (pos != std::string::npos) {
-                        pos += strlen("content-length:");
-                        while (pos < lower.size() && isspace((unsigned char)lower[pos])) ++pos;
-                        size_t endpos = pos;
-                        while (endpos < lower.size() && isdigit((unsigned char)lower[endpos])) ++endpos;
-                        if (endpos > pos) {
-                            contentLength = std::stoi(lower.substr(pos, endpos - pos));
-                        }
-                    }
-                }
-            }
-            if (headerEnd != std::string::npos) {
-                size_t totalNeeded = headerEnd + 4 + (size_t)contentLength;
-                if (request.size() >= totalNeeded) break;
+        for (int i = 0; i < ready; ++i) {
+            void* tag = events[i].data.ptr;
+            if (tag == nullptr) {
+                acceptConnections(worker);
+            } else if (tag == &worker) {
+                uint64_t count;
+                ssize_t got = read(wakeFd, &count, sizeof(count));
+                (void)got;
+                if (!worker.draining && control->draining.load(std::memory_order_acquire)) startDrain(worker);
+            } else {
+                handleEvent(worker, static_cast<Connection*>(tag), events[i].events);
             }
         }
+        expireConnections(worker);
+    }
+    worker.timers.expire(Clock::now() + std::chrono::hours(24), [&](Timer& timer) {
+        closeConnection(worker, static_cast<Connection*>(timer.data));
+    });
+    // Closed connections are freed as their cancelled operations complete.
+    Clock::time_point zombieDeadline = Clock::now() + std::chrono::seconds(1);
+    while (worker.zombies > 0 && Clock::now() < zombieDeadline && worker.ring->submitAndWait(100)) {
+        worker.ring->forEachCompletion([&](uint64_t userData, int res, uint32_t flags) {
+            handleCompletion(worker, userData, res, flags);
+        });
+    }
+    // The closes and final sends queued last still need to reach the kernel.
+    if (worker.ring != nullptr) worker.ring->submitAndWait(0);
+    if (worker.epollFd >= 0) close(worker.epollFd);
+    return result;
+}
 
-        if (n < 0) {
-            perror("recv");
-            close(clientSocket);
-            continue;
+// Listening sockets handed over by the process this one replaces. Empty
+// unless the server was started by a reload.
+static std::vector<int> inheritedListeners() {
+    std::vector<int> listeners;
+    const char* value = getenv(LISTEN_FDS_ENV);
+    if (value == nullptr) return listeners;
+    std::string_view fds(value);
+    while (!fds.empty()) {
+        size_t comma = std::min(fds.find(','), fds.size());
+        int fd = -1;
+        std::from_chars(fds.data(), fds.data() + comma, fd);
+        int listening = 0;
+        socklen_t length = sizeof(listening);
+        if (fd >= 0 && getsockopt(fd, SOL_SOCKET, SO_ACCEPTCONN, &listening, &length) == 0 && listening) {
+            fcntl(fd, F_SETFD, FD_CLOEXEC);
+            setNonBlocking(fd);
+            listeners.push_back(fd);
         }
+        fds.remove_prefix(std::min(comma + 1, fds.size()));
+    }
+    unsetenv(LISTEN_FDS_ENV);
+    return listeners;
+}
+
+// Tells the process that started this one through a reload that it can
+// begin draining.
+static void reportReady() {
+    const char* value = getenv(READY_FD_ENV);
+    if (value == nullptr) return;
+    int fd = std::atoi(value);
+    unsetenv(READY_FD_ENV);
+    ssize_t written = write(fd, "1", 1);
+    (void)written;
+    close(fd);
+}
+
+// Starts a new process from the server binary that serves on the same
+// listening sockets, and returns its pid once it is accepting, or -1. The
+// sockets are shared rather than reopened, so connections queued during
+// the switch are not reset.
+static pid_t startSuccessor(const std::string& executable, char** argv, const std::vector<int>& listeners) {
+    int ready[2];
+    if (pipe2(ready, O_CLOEXEC) < 0) {
+        perror("pipe2");
+        return -1;
+    }
 
-        size_t firstLineEnd = request.find("\r\n");
-        if (firstLineEnd == std::string::npos) {
-            firstLineEnd = request.find("\n");
+    // Only async-signal-safe calls are allowed between fork() and exec() in
+    // a threaded process, so the child's environment is built up front.
+    std::string listenFds = std::string(LISTEN_FDS_ENV) + "=";
+    for (size_t i = 0; i < listeners.size(); ++i) {
+        if (i > 0) listenFds += ',';
+        listenFds += std::to_string(listeners[i]);
+    }
+    std::string readyFd = std::string(READY_FD_ENV) + "=" + std::to_string(ready[1]);
+    std::vector<char*> env;
+    for (char** entry = environ; *entry != nullptr; ++entry) {
+        std::string_view name(*entry);
+        name = name.substr(0, name.find('='));
+        if (name != LISTEN_FDS_ENV && name != READY_FD_ENV) env.push_back(*entry);
+    }
+    env.push_back(listenFds.data());
+    env.push_back(readyFd.data());
+    env.push_back(nullptr);
+
+    pid_t pid = fork();
+    if (pid == 0) {
+        for (int fd : listeners) fcntl(fd, F_SETFD, 0);
+        fcntl(ready[1], F_SETFD, 0);
+        execve(executable.c_str(), argv, env.data());
+        _exit(127);
+    }
+    close(ready[1]);
+    if (pid < 0) {
+        perror("fork");
+        close(ready[0]);
+        return -1;
+    }
+
+    pollfd waitReady = {ready[0], POLLIN, 0};
+    char byte = 0;
+    bool started = poll(&waitReady, 1, RELOAD_TIMEOUT_MS) == 1 && read(ready[0], &byte, 1) == 1;
+    close(ready[0]);
+    if (!started) {
+        std::cerr << "Reload failed: pid " << pid << " did not start serving\n";
+        kill(pid, SIGKILL);
+        waitpid(pid, nullptr, 0);
+        return -1;
+    }
+    return pid;
+}
+
+// Where to exec from on reload. Resolved at startup so a binary replaced at
+// the same path by a deploy is the one that gets started.
+static std::string executablePath(const char* argv0) {
+    char path[PATH_MAX];
+    if (std::strchr(argv0, '/') != nullptr && realpath(argv0, path) != nullptr) return path;
+    ssize_t length = readlink("/proc/self/exe", path, sizeof(path) - 1);
+    return std::string(path, length > 0 ? (size_t)length : 0);
+}
+
+int startServer(ServerConfig config, char** argv) {
+    // Signals are taken synchronously by the main thread below; every thread
+    // started from here on inherits the mask.
+    sigset_t signals;
+    sigemptyset(&signals);
+    for (int signal : {SIGTERM, SIGINT, SIGHUP, SIGUSR2}) sigaddset(&signals, signal);
+    pthread_sigmask(SIG_BLOCK, &signals, nullptr);
+    std::string executable = executablePath(argv[0]);
+
+    std::vector<int> listeners = inheritedListeners();
+    int port = listeners.empty() ? config.port : boundPort(listeners[0]);
+    while ((int)listeners.size() < config.workers) {
+        int serverSocket = createListener(port, config.backlog);
+        if (serverSocket < 0) {
+            for (int fd : listeners) close(fd);
+            return 1;
         }
-        std::string requestLine = request.substr(0, firstLineEnd);
-        
-        std::istringstream iss(requestLine);
-        std::string method, path, version;
-        iss >> method >> path >> version;
-        
-        cout << "Request: " << method << " " << path << " " << version << "\n" << std::flush;
+        listeners.push_back(serverSocket);
+        if (port == 0) {
+            port = boundPort(serverSocket);
+        }
+    }
+    // A reload keeps every socket it was handed, even if --workers shrank,
+    // so nothing queued on them is reset.
+    config.workers = (int)listeners.size();
 
-        std::string body;
-        if (headerEnd != std::string::npos) {
-            size_t bodyStart = headerEnd + 4;
-            if (bodyStart < request.size()) {
-                body = request.substr(bodyStart, contentLength);
-            }
+    // A one-entry ring is enough to learn whether the kernel can run the
+    // backend; each worker allocates its own buffers.
+    if (config.ioBackend == IoBackend::Uring) {
+        IoRing probe;
+        if (!initRing(probe, 1)) {
+            std::cerr << "io_uring unavailable (" << probe.error() << "), using epoll\n";
+            config.ioBackend = IoBackend::Epoll;
         }
+    }
 
-        std::string responseBody = "Echo: " + body;
-        std::ostringstream resp;
-        resp << "HTTP/1.1 200 OK\r\n";
-        resp << "Content-Type: text/plain\r\n";
-        resp << "Content-Length: " << responseBody.size() << "\r\n";
-        resp << "Connection: close\r\n";
-        resp << "\r\n";
-        resp << responseBody;
-        std::string response = resp.str();
-
-        ssize_t totalSent = 0;
-        ssize_t toSend = (ssize_t)response.size();
-        const char* sendPtr = response.c_str();
-        while (totalSent < toSend) {
-            ssize_t sent = send(clientSocket, sendPtr + totalSent, toSend - totalSent, 0);
-            if (sent < 0) {
-                perror("send");
-                break;
-            }
-            totalSent += sent;
+    RequestRouter router;
+    addRoutes(router, config);
+    MetricsRegistry registry;
+    Logger logger(config.logLevel, config.logSample);
+    std::vector<WorkerMetrics*> metrics;
+    std::vector<LogRing*> rings;
+    std::vector<int> wakeFds;
+    for (size_t i = 0; i < listeners.size(); ++i) {
+        metrics.push_back(&registry.addWorker());
+        rings.push_back(&logger.addWorker());
+        int wakeFd = eventfd(0, EFD_CLOEXEC | EFD_NONBLOCK);
+        if (wakeFd < 0) {
+            perror("eventfd");
+            return 1;
+        }
+        wakeFds.push_back(wakeFd);
+    }
+    logger.start();
+    std::atomic<int> openConnections{0};
+    ServerControl control;
+    std::vector<std::thread> workers;
+    for (size_t i = 0; i < listeners.size(); ++i) {
+        workers.emplace_back(runWorker, &config, &router, &registry, metrics[i], &logger, rings[i],
+                             &openConnections, &control, listeners[i], wakeFds[i]);
+    }
+
+    cout << "Server is listening on port " << port << " with " << config.workers << " worker(s) on " << ioBackendName(config.ioBackend) << " (pid " << getpid()
+         << ")...\n"
+         << std::flush;
+    reportReady();
+
+    // SIGTERM and SIGINT stop the server. SIGHUP and SIGUSR2 reload it: a
+    // new process takes over the listening sockets and this one stops once
+    // that process is serving.
+    while (true) {
+        int signal = 0;
+        if (sigwait(&signals, &signal) != 0) continue;
+        if (signal != SIGHUP && signal != SIGUSR2) break;
+        pid_t successor = startSuccessor(executable, argv, listeners);
+        if (successor > 0) {
+            cout << "Handed listeners to pid " << successor << "\n";
+            break;
         }
-        cout << "Sent " << totalSent << " bytes back to client.\n" << std::flush;
+    }
 
-        close(clientSocket);
+    cout << "Draining " << openConnections.load(std::memory_order_relaxed) << " connection(s) for up to "
+         << config.drainTimeout << "s...\n"
+         << std::flush;
+    control.drainDeadline = Clock::now() + std::chrono::seconds(config.drainTimeout);
+    control.draining.store(true, std::memory_order_release);
+    for (int wakeFd : wakeFds) {
+        uint64_t one = 1;
+        ssize_t written = write(wakeFd, &one, sizeof(one));
+        (void)written;
+    }
+    for (std::thread& worker : workers) {
+        worker.join();
+    }
+    int left = control.cutOff.load(std::memory_order_relaxed);
+    logger.stop();
+    for (int serverSocket : listeners) {
+        close(serverSocket);
     }
-    close(serverSocket);
+    for (int wakeFd : wakeFds) {
+        close(wakeFd);
+    }
+    cout << "Server stopped";
+    if (left > 0) cout << ", " << left << " connection(s) closed at the drain deadline";
+    cout << "\n" << std::flush;
     return 0;
 }
 
+static void printUsage(const char* program) {
+    std::cerr << "Usage: " << program << " [port] [backlog] [--workers N]"
+              << " [--keepalive-timeout SECONDS] [--max-requests N] [--stream-buffer BYTES]"
+              << " [--log-level off|error|access] [--log-sample N]"
+              << " [--max-header-size BYTES] [--max-body-size BYTES] [--max-connections N]"
+              << " [--header-timeout SECONDS] [--io-timeout SECONDS]"
+              << " [--static-dir DIR] [--cache-size BYTES] [--cache-max-file BYTES]"
+              << " [--synthetic-routes N] [--compression-level 0-9] [--compress-min-size BYTES]"
+              << " [--buffer-pool-size BYTES] [--drain-timeout SECONDS] [--io-backend epoll|uring]\n";
+}
+
 int main(int argc, char* argv[]) {
-    int port = 8080;
-    int backlog = 5;
+    ServerConfig config;
+    std::vector<std::string> positional;
+    std::unordered_map<std::string, int*> intOptions = {
+        {"--workers", &config.workers},
+        {"--keepalive-timeout", &config.keepAliveTimeout},
+        {"--max-requests", &config.maxRequests},
+        {"--stream-buffer", &config.streamBufferSize},
+        {"--log-sample", &config.logSample},
+        {"--max-header-size", &config.maxHeaderSize},
+        {"--max-body-size", &config.maxBodySize},
+        {"--max-connections", &config.maxConnections},
+        {"--header-timeout", &config.headerTimeout},
+        {"--io-timeout", &config.ioTimeout},
+        {"--cache-size", &config.cacheSize},
+        {"--cache-max-file", &config.cacheMaxFile},
+        {"--synthetic-routes", &config.syntheticRoutes},
+        {"--compression-level", &config.compressionLevel},
+        {"--compress-min-size", &config.compressMinSize},
+        {"--buffer-pool-size", &config.bufferPoolSize},
+        {"--drain-timeout", &config.drainTimeout},
+    };
+
+    std::unordered_map<std::string, std::string*> stringOptions = {
+        {"--static-dir", &config.staticDir},
+    };
 
-    if (argc > 1) {
-        port = std::stoi(argv[1]);
-        if (argc > 2) {
-            backlog = std::stoi(argv[2]);
+    for (int i = 1; i < argc; ++i) {
+        std::string arg = argv[i];
+        auto option = intOptions.find(arg);
+        auto stringOption = stringOptions.find(arg);
+        if (option != intOptions.end() && i + 1 < argc) {
+            *option->second = std::stoi(argv[++i]);
+        } else if (stringOption != stringOptions.end() && i + 1 < argc) {
+            *stringOption->second = argv[++i];
+        } else if (arg == "--log-level" && i + 1 < argc) {
+            if (!parseLogLevel(argv[++i], config.logLevel)) {
+                printUsage(argv[0]);
+                return 1;
+            }
+        } else if (arg == "--io-backend" && i + 1 < argc) {
+            std::string backend = argv[++i];
+            if (backend == "epoll") {
+                config.ioBackend = IoBackend::Epoll;
+            } else if (backend == "uring") {
+                config.ioBackend = IoBackend::Uring;
+            } else {
+                printUsage(argv[0]);
+                return 1;
+            }
+        } else if (arg.rfind("--", 0) == 0) {
+            printUsage(argv[0]);
+            return 1;
+        } else {
+            positional.push_back(arg);
         }
     }
 
-    return startServer(port, backlog);
-}
+    if (positional.size() > 0) {
+        config.port = std::stoi(positional[0]);
+        if (positional.size() > 1) {
+            config.backlog = std::stoi(positional[1]);
+        }
+    }
+    if (config.workers < 1 || config.keepAliveTimeout < 0 || config.maxRequests < 0 ||
+        config.streamBufferSize < 1024 || config.logSample < 1 || config.maxHeaderSize < 256 ||
+        config.maxHeaderSize > config.streamBufferSize || config.maxBodySize < 0 || config.maxConnections < 0 ||
+        config.headerTimeout < 1 || config.ioTimeout < 1 || config.cacheSize < 0 || config.cacheMaxFile < 0 ||
+        config.syntheticRoutes < 0 || config.compressionLevel < 0 || config.compressionLevel > 9 ||
+        config.compressMinSize < 0 || config.bufferPoolSize < 0 || config.drainTimeout < 0) {
+        printUsage(argv[0]);
+        return 1;
+    }
 
+    signal(SIGPIPE, SIG_IGN);
+    raiseFileLimit();
+
+    return startServer(config, argv);
+}
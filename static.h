@@ -0,0 +1,349 @@
+#pragma once
+
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <chrono>
+#include <cerrno>
+#include <cstdio>
+#include <list>
+#include <memory>
+#include <string>
+#include <string_view>
+#include <unordered_map>
+#include "http.h"
+#include "compress.h"
+
+// Static file serving for --static-dir. Every worker owns a StaticFiles with
+// its own LRU cache, so lookups never lock. Small files are kept as fully
+// serialized responses (headers and body in one string) within a byte
+// budget; bigger files, and small ones that do not fit the budget, are sent
+// straight from the file with sendfile(). Cached entries are checked
+// against the file's mtime and size at most once per REVALIDATE_INTERVAL.
+//
+// Compressible files are served in the negotiated encoding. Cached entries
+// build a gzip or deflate copy the first time it is asked for and keep it
+// next to the original; uncached files are compressed by the caller while
+// they are sent.
+
+struct StaticResponse {
+    enum class Kind {
+        NotFound,
+        NotModified,
+        Cached,
+        File,
+    };
+
+    Kind kind = Kind::NotFound;
+    bool cacheHit = false;
+    // Cached: the encoding of `data`. File: the encoding the caller must
+    // compress the file with; `head` then leaves out Content-Length and the
+    // caller adds the encoding headers.
+    Encoding encoding = Encoding::Identity;
+    // Bytes compressed while building a cached variant for this lookup.
+    size_t compressionInput = 0;
+    size_t compressionOutput = 0;
+    std::string etag;
+    // Cached: the serialized response; its first headerLength bytes are the
+    // status line and headers, without Connection and the final CRLF.
+    std::shared_ptr<const std::string> data;
+    size_t headerLength = 0;
+    // File: an open descriptor the caller must close, plus the same headers.
+    int fd = -1;
+    size_t size = 0;
+    std::string head;
+};
+
+inline std::string_view contentTypeFor(std::string_view path) {
+    static const std::pair<std::string_view, std::string_view> TYPES[] = {
+        {".html", "text/html; charset=utf-8"},
+        {".htm", "text/html; charset=utf-8"},
+        {".css", "text/css"},
+        {".js", "application/javascript"},
+        {".json", "application/json"},
+        {".txt", "text/plain; charset=utf-8"},
+        {".svg", "image/svg+xml"},
+        {".png", "image/png"},
+        {".jpg", "image/jpeg"},
+        {".jpeg", "image/jpeg"},
+        {".gif", "image/gif"},
+        {".ico", "image/x-icon"},
+        {".wasm", "application/wasm"},
+    };
+    size_t dot = path.rfind('.');
+    if (dot != std::string_view::npos && path.find('/', dot) == std::string_view::npos) {
+        std::string_view extension = path.substr(dot);
+        for (const auto& type : TYPES) {
+            if (equalsIgnoreCase(extension, type.first)) return type.second;
+        }
+    }
+    return "application/octet-stream";
+}
+
+// Rejects anything that could leave the root: empty or non-absolute paths,
+// NUL bytes, backslashes and "." or ".." segments.
+inline bool isSafePath(std::string_view path) {
+    if (path.empty() || path.front() != '/') return false;
+    if (path.find('\0') != std::string_view::npos || path.find('\\') != std::string_view::npos) return false;
+    size_t start = 1;
+    while (start <= path.size()) {
+        size_t end = path.find('/', start);
+        if (end == std::string_view::npos) end = path.size();
+        std::string_view segment = path.substr(start, end - start);
+        if (segment == "." || segment == "..") return false;
+        start = end + 1;
+    }
+    return true;
+}
+
+class StaticFiles {
+public:
+    using Clock = std::chrono::steady_clock;
+    static constexpr std::chrono::seconds REVALIDATE_INTERVAL{1};
+
+    StaticFiles(std::string root, size_t cacheBudget, size_t maxCachedFile, CompressionConfig compression)
+        : root_(std::move(root)), budget_(cacheBudget), maxCachedFile_(maxCachedFile), compression_(compression) {}
+
+    // Resolves a request path (without the query string). With a matching
+    // ifNoneMatch the answer is NotModified and no body is prepared.
+    // `accepted` is the encoding negotiated with the client; it is used only
+    // for compressible files of at least the minimum size.
+    StaticResponse lookup(std::string_view path, std::string_view ifNoneMatch, Encoding accepted) {
+        StaticResponse response;
+        if (!isSafePath(path)) return response;
+        std::string key(path);
+        if (key.back() == '/') key += "index.html";
+
+        auto found = index_.find(key);
+        if (found != index_.end()) {
+            Entry& entry = *found->second;
+            if (Clock::now() - entry.checkedAt < REVALIDATE_INTERVAL || stillValid(entry)) {
+                entries_.splice(entries_.begin(), entries_, found->second);
+                StaticResponse cached = fromEntry(entry, ifNoneMatch, accepted);
+                cached.cacheHit = true;
+                return cached;
+            }
+            evict(found->second);
+        }
+
+        std::string filePath = root_ + key;
+        int fd = open(filePath.c_str(), O_RDONLY | O_CLOEXEC);
+        if (fd < 0) return response;
+        struct stat info;
+        if (fstat(fd, &info) < 0 || !S_ISREG(info.st_mode)) {
+            close(fd);
+            return response;
+        }
+
+        response.size = (size_t)info.st_size;
+        bool compressible = shouldCompress(key, response.size);
+        Encoding encoding = compressible ? accepted : Encoding::Identity;
+        std::string etag = makeEtag(info);
+        if (matches(ifNoneMatch, variantEtag(etag, encoding))) {
+            close(fd);
+            response.kind = StaticResponse::Kind::NotModified;
+            response.etag = variantEtag(etag, encoding);
+            return response;
+        }
+        response.etag = etag;
+        response.head = makeHead(key, response.size, etag, Encoding::Identity, compressible);
+        if (response.size <= maxCachedFile_ && response.size + response.head.size() <= budget_) {
+            if (Entry* entry = load(key, fd, info, response, compressible)) {
+                close(fd);
+                return fromEntry(*entry, ifNoneMatch, accepted);
+            }
+        }
+        if (encoding != Encoding::Identity) {
+            response.etag = variantEtag(etag, encoding);
+            response.head = makeHead(key, std::string::npos, response.etag, Encoding::Identity, false);
+            response.encoding = encoding;
+        }
+        response.kind = StaticResponse::Kind::File;
+        response.fd = fd;
+        return response;
+    }
+
+private:
+    struct Entry {
+        std::string key;
+        std::shared_ptr<const std::string> data;
+        size_t headerLength;
+        std::string etag;
+        timespec mtime;
+        off_t size;
+        Clock::time_point checkedAt;
+        bool compressible;
+        // Gzip and deflate copies, built on first use. An attempted slot
+        // stays empty when compressing did not pay off or did not fit.
+        std::shared_ptr<const std::string> variants[2];
+        size_t variantHeaderLength[2] = {0, 0};
+        bool variantTried[2] = {false, false};
+    };
+
+    std::string root_;
+    size_t budget_;
+    size_t maxCachedFile_;
+    CompressionConfig compression_;
+    size_t used_ = 0;
+    // Most recently used first.
+    std::list<Entry> entries_;
+    std::unordered_map<std::string, std::list<Entry>::iterator> index_;
+
+    static std::string makeEtag(const struct stat& info) {
+        char etag[64];
+        long long nanos = (long long)info.st_mtim.tv_sec * 1000000000LL + info.st_mtim.tv_nsec;
+        snprintf(etag, sizeof(etag), "\"%llx-%llx\"", (unsigned long long)info.st_size, (unsigned long long)nanos);
+        return etag;
+    }
+
+    // Variants get their own ETag so a cached gzip copy is never confused
+    // with the original.
+    static std::string variantEtag(const std::string& etag, Encoding encoding) {
+        if (encoding == Encoding::Identity) return etag;
+        std::string variant = etag.substr(0, etag.size() - 1);
+        variant += '-';
+        variant += encodingName(encoding);
+        variant += '"';
+        return variant;
+    }
+
+    // A length of npos leaves out Content-Length, for bodies compressed on
+    // the fly.
+    static std::string makeHead(std::string_view key, size_t length, const std::string& etag, Encoding encoding,
+                                bool vary) {
+        std::string head = "HTTP/1.1 200 OK\r\nContent-Type: ";
+        head += contentTypeFor(key);
+        if (length != std::string::npos) {
+            head += "\r\nContent-Length: ";
+            head += std::to_string(length);
+        }
+        if (encoding != Encoding::Identity) {
+            head += "\r\nContent-Encoding: ";
+            head += encodingName(encoding);
+        }
+        if (vary) {
+            head += "\r\nVary: Accept-Encoding";
+        }
+        head += "\r\nETag: ";
+        head += etag;
+        head += "\r\n";
+        return head;
+    }
+
+    bool shouldCompress(std::string_view key, size_t size) const {
+        return compression_.level > 0 && size >= compression_.minSize && isCompressible(contentTypeFor(key));
+    }
+
+    static bool matches(std::string_view ifNoneMatch, std::string_view etag) {
+        if (ifNoneMatch.empty()) return false;
+        if (trim(ifNoneMatch) == "*") return true;
+        size_t start = 0;
+        while (start < ifNoneMatch.size()) {
+            size_t end = ifNoneMatch.find(',', start);
+            if (end == std::string_view::npos) end = ifNoneMatch.size();
+            std::string_view candidate = trim(ifNoneMatch.substr(start, end - start));
+            if (candidate.substr(0, 2) == "W/") candidate.remove_prefix(2);
+            if (candidate == etag) return true;
+            start = end + 1;
+        }
+        return false;
+    }
+
+    StaticResponse fromEntry(Entry& entry, std::string_view ifNoneMatch, Encoding accepted) {
+        StaticResponse response;
+        response.etag = entry.etag;
+        response.data = entry.data;
+        response.headerLength = entry.headerLength;
+        if (entry.compressible && accepted != Encoding::Identity) {
+            int slot = accepted == Encoding::Gzip ? 0 : 1;
+            if (!entry.variantTried[slot]) buildVariant(entry, accepted, response);
+            if (entry.variants[slot]) {
+                response.etag = variantEtag(entry.etag, accepted);
+                response.data = entry.variants[slot];
+                response.headerLength = entry.variantHeaderLength[slot];
+                response.encoding = accepted;
+            }
+        }
+        response.kind = matches(ifNoneMatch, response.etag) ? StaticResponse::Kind::NotModified
+                                                            : StaticResponse::Kind::Cached;
+        response.size = response.data->size() - response.headerLength;
+        return response;
+    }
+
+    void buildVariant(Entry& entry, Encoding encoding, StaticResponse& response) {
+        int slot = encoding == Encoding::Gzip ? 0 : 1;
+        entry.variantTried[slot] = true;
+        std::string_view body(*entry.data);
+        body.remove_prefix(entry.headerLength);
+        std::string compressed = compressAll(body, encoding);
+        response.compressionInput = body.size();
+        response.compressionOutput = compressed.size();
+        if (compressed.empty() || compressed.size() >= body.size()) return;
+
+        std::string etag = variantEtag(entry.etag, encoding);
+        auto data = std::make_shared<std::string>(makeHead(entry.key, compressed.size(), etag, encoding, true));
+        size_t headerLength = data->size();
+        *data += compressed;
+        // The entry was just moved to the front, so evicting from the back
+        // never drops it.
+        while (used_ + data->size() > budget_ && entries_.size() > 1) {
+            evict(std::prev(entries_.end()));
+        }
+        if (used_ + data->size() > budget_) return;
+        used_ += data->size();
+        entry.variants[slot] = std::move(data);
+        entry.variantHeaderLength[slot] = headerLength;
+    }
+
+    bool stillValid(Entry& entry) {
+        struct stat info;
+        std::string filePath = root_ + entry.key;
+        if (stat(filePath.c_str(), &info) < 0) return false;
+        if (info.st_size != entry.size || info.st_mtim.tv_sec != entry.mtime.tv_sec ||
+            info.st_mtim.tv_nsec != entry.mtime.tv_nsec) {
+            return false;
+        }
+        entry.checkedAt = Clock::now();
+        return true;
+    }
+
+    Entry* load(const std::string& key, int fd, const struct stat& info, const StaticResponse& response,
+                bool compressible) {
+        auto data = std::make_shared<std::string>(response.head);
+        data->resize(response.head.size() + response.size);
+        size_t done = 0;
+        while (done < response.size) {
+            ssize_t n = pread(fd, data->data() + response.head.size() + done, response.size - done, (off_t)done);
+            if (n <= 0) {
+                if (n < 0 && errno == EINTR) continue;
+                return nullptr;
+            }
+            done += (size_t)n;
+        }
+
+        used_ += data->size();
+        while (used_ > budget_ && !entries_.empty()) {
+            evict(std::prev(entries_.end()));
+        }
+        Entry& entry = entries_.emplace_front();
+        entry.key = key;
+        entry.data = std::move(data);
+        entry.headerLength = response.head.size();
+        entry.etag = response.etag;
+        entry.mtime = info.st_mtim;
+        entry.size = info.st_size;
+        entry.checkedAt = Clock::now();
+        entry.compressible = compressible;
+        index_[key] = entries_.begin();
+        return &entry;
+    }
+
+    void evict(std::list<Entry>::iterator entry) {
+        used_ -= entry->data->size();
+        for (const auto& variant : entry->variants) {
+            if (variant) used_ -= variant->size();
+        }
+        index_.erase(entry->key);
+        entries_.erase(entry);
+    }
+};
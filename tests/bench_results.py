@@ -0,0 +1,145 @@
+import json
+import os
+import platform
+import socket
+import subprocess
+import time
+from config import PERFORMANCE_BUDGETS, NETWORK_PROFILES
+from resource_sampler import busiest_window, format_summary
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ["git", *args],
+            capture_output=True,
+            text=True,
+            timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def collect_environment():
+    return {
+        'git_sha': _git("rev-parse", "HEAD") or "unknown",
+        'git_dirty': bool(_git("status", "--porcelain", "--untracked-files=no")),
+        'host': {
+            'hostname': socket.gethostname(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+        },
+    }
+
+
+def latency_summary(latency):
+    return {
+        'count': latency.count,
+        'mean': latency.mean(),
+        'min': latency.min(),
+        'p50': latency.percentile(50),
+        'p90': latency.percentile(90),
+        'p99': latency.percentile(99),
+        'p99_9': latency.percentile(99.9),
+        'max': latency.max(),
+    }
+
+
+def make_record(scenario, stats, connections, **extra):
+    total_time = stats['total_time']
+    record = {
+        'scenario': scenario,
+        'connections': connections,
+        'payload_size': stats['payload_size'],
+        'requests': stats['total'],
+        'successful': stats['successful'],
+        'failed': stats['failed'],
+        'success_ratio': stats['successful'] / stats['total'] if stats['total'] else 0.0,
+        'total_time': total_time,
+        'rps': stats['successful'] / total_time if total_time else 0.0,
+        'throughput_mb_s': stats['successful'] * stats['payload_size'] / 1024 / 1024 / total_time if total_time else 0.0,
+        'latency': latency_summary(stats['latency']),
+        'errors': dict(stats['errors']),
+    }
+    record.update(extra)
+    return record
+
+
+def network_budget(scenario, budgets=PERFORMANCE_BUDGETS):
+    """The budget of a scenario run over a network profile ("c10k_1k@wan"):
+    the direct run's, less the connections the profile resets on purpose.
+    Latency there is the profile's more than the server's, so p99 is not
+    checked."""
+    base, _, network = scenario.partition("@")
+    budget = dict(budgets.get(base) or {})
+    budget.pop('max_p99', None)
+    if 'min_success_ratio' in budget:
+        budget['min_success_ratio'] -= NETWORK_PROFILES.get(network, {}).get('reset_ratio', 0)
+    return budget
+
+
+def check_budget(record, budgets=PERFORMANCE_BUDGETS):
+    budget = budgets.get(record['scenario'])
+    if budget is None and "@" in record['scenario']:
+        budget = network_budget(record['scenario'], budgets)
+    if not budget:
+        return []
+    violations = []
+    if 'min_success_ratio' in budget and record['success_ratio'] < budget['min_success_ratio']:
+        violations.append(
+            f"success ratio {record['success_ratio']:.4f} < {budget['min_success_ratio']} "
+            f"({record['failed']}/{record['requests']} failed)"
+        )
+    if 'min_rps' in budget and record['rps'] < budget['min_rps']:
+        violations.append(f"RPS {record['rps']:.2f} < {budget['min_rps']}")
+    if 'max_p99' in budget and record['latency']['p99'] > budget['max_p99']:
+        violations.append(f"p99 {record['latency']['p99']:.4f}s > {budget['max_p99']}s")
+    return violations
+
+
+class BenchmarkResults:
+    def __init__(self, directory):
+        self.directory = directory
+        self.environment = collect_environment()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        name = f"{stamp}-{self.environment['git_sha'][:10]}"
+        # Parallel pytest-xdist workers each get their own file.
+        worker = os.environ.get("PYTEST_XDIST_WORKER")
+        if worker:
+            name += f"-{worker}"
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        self.count = 0
+        # Set when each test starts; records attach the server resource
+        # samples taken since then, or during the load itself when the
+        # stats say when it ran.
+        self.window_start = None
+
+    def write(self, record):
+        os.makedirs(self.directory, exist_ok=True)
+        line = dict(record, timestamp=time.time(), **self.environment)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(line) + "\n")
+        self.count += 1
+        return record
+
+    def record(self, scenario, stats, connections, **extra):
+        if 'resources' not in extra and self.window_start is not None:
+            resources = busiest_window(stats.get('started', self.window_start), stats.get('finished'))
+            if resources:
+                extra['resources'] = resources
+                print(f"\n[RESOURCES] {scenario}: {format_summary(resources['summary'])}")
+        return self.write(make_record(scenario, stats, connections, **extra))
+
+
+def load_results(path):
+    results = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                results[record['scenario']] = record
+    return results
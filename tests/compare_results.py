@@ -0,0 +1,87 @@
+import argparse
+import sys
+from bench_results import load_results
+
+
+def _git_sha(results):
+    return next(iter(results.values()), {}).get('git_sha', 'unknown')[:10]
+
+
+def compare(baseline, candidate, max_rps_drop, max_p99_increase):
+    rows = []
+    regressions = []
+    for scenario in sorted(set(baseline) & set(candidate)):
+        old, new = baseline[scenario], candidate[scenario]
+        rps_change = (new['rps'] - old['rps']) / old['rps'] if old['rps'] else 0.0
+        old_p99, new_p99 = old['latency']['p99'], new['latency']['p99']
+        p99_change = (new_p99 - old_p99) / old_p99 if old_p99 else 0.0
+        rows.append((scenario, old['rps'], new['rps'], rps_change, old_p99, new_p99, p99_change))
+        if rps_change < -max_rps_drop:
+            regressions.append(f"{scenario}: RPS dropped {-rps_change * 100:.1f}% "
+                               f"({old['rps']:.2f} -> {new['rps']:.2f})")
+        if p99_change > max_p99_increase:
+            regressions.append(f"{scenario}: p99 grew {p99_change * 100:.1f}% "
+                               f"({old_p99:.4f}s -> {new_p99:.4f}s)")
+    return rows, regressions
+
+
+def resource_rows(baseline, candidate):
+    # Where the server's time and memory went, for scenarios both runs
+    # sampled: mean CPU, peak RSS and voluntary context switches per second.
+    rows = []
+    for scenario in sorted(set(baseline) & set(candidate)):
+        old = baseline[scenario].get('resources', {}).get('summary')
+        new = candidate[scenario].get('resources', {}).get('summary')
+        if old and new:
+            rows.append((scenario,
+                         old['cpu_percent']['mean'], new['cpu_percent']['mean'],
+                         old['rss']['peak'] / 1024 / 1024, new['rss']['peak'] / 1024 / 1024,
+                         old['voluntary_switches']['per_second'], new['voluntary_switches']['per_second']))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline", help="JSONL results of the reference run")
+    parser.add_argument("candidate", help="JSONL results of the run to check")
+    parser.add_argument("--max-rps-drop", type=float, default=0.10,
+                        help="allowed relative RPS drop before failing (default: 0.10)")
+    parser.add_argument("--max-p99-increase", type=float, default=0.20,
+                        help="allowed relative p99 growth before failing (default: 0.20)")
+    args = parser.parse_args()
+
+    baseline = load_results(args.baseline)
+    candidate = load_results(args.candidate)
+    rows, regressions = compare(baseline, candidate, args.max_rps_drop, args.max_p99_increase)
+
+    print(f"Baseline:  {args.baseline} ({_git_sha(baseline)})")
+    print(f"Candidate: {args.candidate} ({_git_sha(candidate)})")
+    print("=" * 100)
+    print(f"{'Scenario':<36} {'RPS old':>10} {'RPS new':>10} {'Δ':>8} "
+          f"{'p99 old':>9} {'p99 new':>9} {'Δ':>8}")
+    for scenario, old_rps, new_rps, rps_change, old_p99, new_p99, p99_change in rows:
+        print(f"{scenario:<36} {old_rps:>10.2f} {new_rps:>10.2f} {rps_change * 100:>7.1f}% "
+              f"{old_p99:>9.4f} {new_p99:>9.4f} {p99_change * 100:>7.1f}%")
+    for scenario in sorted(set(baseline) ^ set(candidate)):
+        print(f"{scenario:<36} only in {'baseline' if scenario in baseline else 'candidate'}")
+    print("=" * 100)
+
+    resources = resource_rows(baseline, candidate)
+    if resources:
+        print(f"{'Server resources':<36} {'CPU% old':>9} {'CPU% new':>9} {'RSS MB old':>11} {'RSS MB new':>11} "
+              f"{'csw/s old':>10} {'csw/s new':>10}")
+        for scenario, old_cpu, new_cpu, old_rss, new_rss, old_csw, new_csw in resources:
+            print(f"{scenario:<36} {old_cpu:>9.1f} {new_cpu:>9.1f} {old_rss:>11.1f} {new_rss:>11.1f} "
+                  f"{old_csw:>10.0f} {new_csw:>10.0f}")
+        print("=" * 100)
+
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
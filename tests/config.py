@@ -1,8 +1,210 @@
+import os
+
 SERVER_EXECUTABLE = "../server"
 DEFAULT_HOST = "127.0.0.1"
-DEFAULT_PORT = 8080
-STARTUP_TIMEOUT = 2
+# Port 0 lets the OS pick a free port for every server instance, so several
+# sessions (e.g. pytest-xdist workers) can run side by side.
+DEFAULT_PORT = int(os.environ.get("SERVER_PORT", "0"))
+# Upper bound on how long ServerManager waits for the server to accept
+# connections; startup normally finishes in milliseconds.
+STARTUP_TIMEOUT = 5
+# How long ServerManager waits for a stopped or reloaded server process to
+# drain and exit; the server's own --drain-timeout defaults to 10s.
+SHUTDOWN_TIMEOUT = 15
 REQUEST_TIMEOUT = 5
 
+# Server logging: level is off, error or access; access lines are sampled
+# one in SERVER_LOG_SAMPLE. ServerManager keeps the last SERVER_LOG_TAIL
+# lines of each stream.
+SERVER_LOG_LEVEL = "access"
+SERVER_LOG_SAMPLE = 100
+SERVER_LOG_TAIL = 1000
+
+# Event loop backend of every server ServerManager starts: epoll or uring.
+# The server falls back to epoll where the kernel lacks io_uring support.
+SERVER_IO_BACKEND = os.environ.get("SERVER_IO_BACKEND", "epoll")
+
 RUN_LARGE_PAYLOAD_TESTS = False
 RUN_C10K_TESTS = True
+RUN_OPEN_LOOP_TESTS = False
+RUN_SCALING_TESTS = False
+RUN_STATIC_BENCHMARKS = False
+RUN_ROUTER_BENCHMARKS = False
+RUN_NETWORK_PROFILE_TESTS = False
+RUN_SCENARIO_TESTS = False
+RUN_BACKEND_BENCHMARKS = False
+
+LOAD_WORKERS = os.cpu_count() or 1
+
+OPEN_LOOP_RATE = 5000
+OPEN_LOOP_DURATION = 60
+OPEN_LOOP_SWEEP_RATES = [500, 1000, 2000, 5000, 10000, 20000]
+OPEN_LOOP_SWEEP_DURATION = 10
+OPEN_LOOP_KNEE_FACTOR = 3
+OPEN_LOOP_MAX_IN_FLIGHT = 10000
+
+# Load scenarios test_scenarios.py runs, each a list of phases executed in
+# order and reported separately:
+#   ramp     open-loop arrivals going linearly from start_rate to end_rate
+#            req/s over `duration` seconds
+#   plateau  `connections` clients each sending requests back to back for
+#            `duration` seconds
+#   spike    `connections` clients sending `requests` (default 1) requests
+#            each, all at once
+# A ramp or plateau may carry `spikes`: every `every` seconds a burst of
+# `connections` clients is fired on top of it, reported as "<phase>:spike".
+# payload_sizes maps body sizes to weights and keepalive_ratio is the share
+# of requests that reuse an idle connection; both can be set per scenario
+# and per phase. A phase's `budget` is checked like PERFORMANCE_BUDGETS.
+# Workers start the first phase SCENARIO_START_DELAY seconds after the run
+# begins.
+LOAD_SCENARIOS = {
+    "ramp_spike_recovery": {
+        "payload_sizes": {100: 0.9, 16 * 1024: 0.1},
+        "keepalive_ratio": 0.8,
+        "phases": [
+            {"name": "ramp", "kind": "ramp", "start_rate": 100, "end_rate": 5000, "duration": 30,
+             "budget": {"min_success_ratio": 0.99}},
+            {"name": "plateau", "kind": "plateau", "connections": 1000, "duration": 60,
+             "budget": {"min_success_ratio": 0.99, "max_p99": 2.0}},
+            {"name": "spike", "kind": "spike", "connections": 10000, "keepalive_ratio": 0,
+             "budget": {"min_success_ratio": 0.99}},
+            {"name": "recovery", "kind": "plateau", "connections": 1000, "duration": 30,
+             "budget": {"min_success_ratio": 0.99, "max_p99": 2.0}},
+        ],
+    },
+    "soak": {
+        "payload_sizes": {512: 0.7, 4 * 1024: 0.25, 256 * 1024: 0.05},
+        "keepalive_ratio": 0.9,
+        "phases": [
+            {"name": "warmup", "kind": "ramp", "start_rate": 100, "end_rate": 2000, "duration": 60},
+            {"name": "soak", "kind": "plateau", "connections": 500, "duration": 30 * 60,
+             "spikes": {"every": 10 * 60, "connections": 5000},
+             "budget": {"min_success_ratio": 0.999, "max_p99": 2.0}},
+        ],
+    },
+}
+SCENARIO_START_DELAY = 2
+
+KEEPALIVE_TEST_TIMEOUT = 1
+KEEPALIVE_TEST_MAX_REQUESTS = 3
+
+STREAMING_PAYLOAD_SIZE = 100 * 1024 * 1024
+STREAMING_CONCURRENCY = 4
+STREAMING_MAX_RSS = 32 * 1024 * 1024
+
+# TestCompression echoes COMPRESSION_REQUESTS bodies of this size with each
+# encoding; gzip and deflate must shrink the text bodies at least this much.
+COMPRESSION_PAYLOAD_SIZE = 4 * 1024 * 1024
+COMPRESSION_REQUESTS = 10
+COMPRESSION_MIN_TEXT_RATIO = 5
+
+# test_sustained_load fails when the server's RSS after any wave exceeds its
+# RSS after the first wave by more than this.
+C10K_MAX_RSS_GROWTH = 8 * 1024 * 1024
+
+# test_reload.py gives the servers of its drain tests this --drain-timeout,
+# and keeps RELOAD_CONNECTIONS connections of load running while a server
+# is reloaded every RELOAD_INTERVAL seconds.
+RELOAD_DRAIN_TIMEOUT = 2
+RELOAD_CONNECTIONS = 10000
+RELOAD_PAYLOAD_SIZE = 512
+RELOAD_INTERVAL = 0.5
+
+# Network profiles the C10k and large-payload suites run over; only "direct"
+# runs unless RUN_NETWORK_PROFILE_TESTS is set. Every other profile puts a
+# FaultProxy between the clients and the server that adds `latency` seconds
+# each way, caps each direction of a connection at `bandwidth` bytes/s,
+# forwards data in TCP segments of at most `segment_size` bytes and resets
+# `reset_ratio` of the connections halfway through their first response
+# chunk. Profiles with resets are left out of the large-payload suite, which
+# expects every echo back.
+NETWORK_PROFILES = {
+    "direct": {},
+    "wan": {"latency": 0.025},
+    "slow_client": {"latency": 0.005, "bandwidth": 1024 * 1024},
+    "fragmented": {"segment_size": 64},
+    "lossy": {"latency": 0.005, "reset_ratio": 0.01},
+}
+# The proxy reads up to PROXY_READ_SIZE bytes at a time and holds at most
+# PROXY_QUEUE_CHUNKS reads per direction of a connection.
+PROXY_READ_SIZE = 64 * 1024
+PROXY_QUEUE_CHUNKS = 16
+
+SCALING_CONNECTIONS = 5000
+SCALING_WORKER_COUNTS = sorted({1 << i for i in range((os.cpu_count() or 1).bit_length())} | {os.cpu_count() or 1})
+
+# Limits of the server started by test_guardrails.py, kept small so the
+# abusive clients hit them quickly.
+GUARDRAIL_HEADER_TIMEOUT = 1
+GUARDRAIL_IO_TIMEOUT = 2
+GUARDRAIL_MAX_HEADER_SIZE = 4096
+GUARDRAIL_MAX_BODY_SIZE = 1024 * 1024
+GUARDRAIL_MAX_CONNECTIONS = 20
+GUARDRAIL_SLOW_CONNECTIONS = 300
+GUARDRAIL_NORMAL_CONNECTIONS = 1000
+
+# Files written for test_static.py: STATIC_SMALL_FILES files of
+# STATIC_SMALL_FILE_SIZE bytes fit the cache, STATIC_LARGE_FILE_SIZE is
+# always sent with sendfile(). The benchmarks fetch every file
+# STATIC_BENCH_REQUESTS times over each of STATIC_BENCH_CONNECTIONS
+# keep-alive connections (the large file uses the STATIC_LARGE_BENCH_*
+# counts).
+STATIC_SMALL_FILES = 16
+STATIC_SMALL_FILE_SIZE = 4096
+STATIC_LARGE_FILE_SIZE = 8 * 1024 * 1024
+STATIC_BENCH_CONNECTIONS = 200
+STATIC_BENCH_REQUESTS = 50
+STATIC_LARGE_BENCH_CONNECTIONS = 8
+STATIC_LARGE_BENCH_REQUESTS = 10
+
+# test_router.py starts one server per entry of ROUTER_BENCH_ROUTE_COUNTS
+# (registered with --synthetic-routes) and checks that the mean dispatch time
+# with the most routes stays within ROUTER_MAX_DISPATCH_RATIO of the time
+# with the fewest, plus ROUTER_DISPATCH_SLACK seconds of timer noise.
+ROUTER_BENCH_ROUTE_COUNTS = [1, 1000, 10000, 50000]
+ROUTER_BENCH_CONNECTIONS = 100
+ROUTER_BENCH_REQUESTS = 100
+ROUTER_MAX_DISPATCH_RATIO = 2.0
+ROUTER_DISPATCH_SLACK = 0.000001
+
+# Backend comparison: the same closed-loop load against an epoll and an
+# io_uring server. Where strace is installed, a second, shorter run under
+# `strace -c` counts the system calls each backend makes per request.
+BACKEND_BENCH_CONNECTIONS = 1000
+BACKEND_BENCH_REQUESTS = 100
+BACKEND_BENCH_PAYLOAD_SIZE = 512
+BACKEND_STRACE_REQUESTS = 10
+
+BENCH_RESULTS_DIR = os.environ.get("BENCH_RESULTS_DIR", "results")
+
+# ServerManager samples the server's CPU, RSS, open fds and context switches
+# from /proc every RESOURCE_SAMPLE_INTERVAL seconds (0 turns sampling off);
+# benchmark records carry the samples taken while their test ran.
+RESOURCE_SAMPLE_INTERVAL = 0.1
+RESOURCE_MAX_SAMPLES = 36000
+# PERF_RECORD=1 also runs `perf record -g` on every server ServerManager
+# starts and leaves <pid>.perf.data under BENCH_RESULTS_DIR/perf for
+# flamegraphs.
+PERF_RECORD = os.environ.get("PERF_RECORD") == "1"
+PERF_FREQUENCY = 99
+
+# Per-scenario limits checked after every benchmark: min_success_ratio,
+# min_rps (req/s) and max_p99 (seconds). Missing keys are not checked.
+PERFORMANCE_BUDGETS = {
+    "c10k_1k": {"min_success_ratio": 0.99, "max_p99": 5.0},
+    "c10k_5k": {"min_success_ratio": 0.99, "max_p99": 8.0},
+    "c10k_10k_small": {"min_success_ratio": 0.99, "max_p99": 10.0},
+    "c10k_10k_medium": {"min_success_ratio": 0.99, "max_p99": 10.0},
+    "c10k_sustained": {"min_success_ratio": 0.99, "max_p99": 8.0},
+    "c10k_connection_reuse": {"min_success_ratio": 0.99, "max_p99": 5.0},
+    "large_payload_sequential": {"min_success_ratio": 1.0},
+    "large_payload_async": {"min_success_ratio": 1.0},
+    "open_loop_constant_rate": {"min_success_ratio": 0.95},
+    "guardrails_normal_under_abuse": {"min_success_ratio": 0.99, "max_p99": 2.0},
+    "static_hot_cache": {"min_success_ratio": 1.0},
+    "static_cold_cache": {"min_success_ratio": 1.0},
+    "static_large_file": {"min_success_ratio": 1.0},
+    "router_dispatch": {"min_success_ratio": 1.0},
+    "c10k_reload": {"min_success_ratio": 1.0},
+}
@@ -1,4 +1,9 @@
+import time
 import pytest
+from bench_results import BenchmarkResults
+from config import BENCH_RESULTS_DIR, NETWORK_PROFILES
+from fault_proxy import FaultProxy, Network, active_profiles
+from payload_corpus import PayloadCorpus
 from server_manager import ServerManager
 
 
@@ -15,3 +20,37 @@ def server():
 @pytest.fixture
 def base_url(server):
     return server.get_base_url()
+
+
+@pytest.fixture(scope="module", params=active_profiles())
+def network(request, server):
+    profile = NETWORK_PROFILES[request.param]
+    if not profile:
+        yield Network(request.param, server.get_base_url())
+        return
+    with FaultProxy(server.host, server.port, profile) as proxy:
+        yield Network(request.param, proxy.get_base_url(), proxy)
+        print(f"\n[PROXY] {request.param}: {proxy.stats}")
+
+
+@pytest.fixture(scope="session")
+def payload_corpus():
+    # Bodies are generated once per size for the whole session.
+    return PayloadCorpus()
+
+
+@pytest.fixture(scope="session")
+def bench_results():
+    results = BenchmarkResults(BENCH_RESULTS_DIR)
+    yield results
+    if results.count:
+        print(f"\nBenchmark results written to {results.path}")
+
+
+@pytest.fixture(autouse=True)
+def resource_window(bench_results):
+    # Benchmarks recorded by this test carry the server's resource samples
+    # from this point on.
+    bench_results.window_start = time.time()
+    yield
+    bench_results.window_start = None
@@ -0,0 +1,206 @@
+import asyncio
+import random
+import socket
+import struct
+import threading
+from config import (
+    DEFAULT_HOST,
+    STARTUP_TIMEOUT,
+    SHUTDOWN_TIMEOUT,
+    NETWORK_PROFILES,
+    RUN_NETWORK_PROFILE_TESTS,
+    PROXY_READ_SIZE,
+    PROXY_QUEUE_CHUNKS,
+)
+from load_generator import _raise_fd_limit
+
+
+def active_profiles(with_resets=True):
+    """Names of the network profiles the suites run over."""
+    names = NETWORK_PROFILES if RUN_NETWORK_PROFILE_TESTS else ["direct"]
+    return [name for name in names if with_resets or not NETWORK_PROFILES[name].get('reset_ratio')]
+
+
+class InjectedReset(ConnectionResetError):
+    pass
+
+
+class FaultProxy:
+    """Forwards TCP connections to the server through the faults of one
+    network profile. The proxy runs its own event loop on a background
+    thread, so sync tests, async tests and the load generator's worker
+    processes can all connect to it."""
+
+    def __init__(self, target_host, target_port, profile, host=DEFAULT_HOST, port=0, seed=0):
+        self.target = (target_host, target_port)
+        self.host = host
+        self.port = port
+        self.latency = profile.get('latency', 0)
+        self.bandwidth = profile.get('bandwidth')
+        self.segment_size = profile.get('segment_size')
+        self.reset_ratio = profile.get('reset_ratio', 0)
+        # Seeded, so a run resets the same connections every time.
+        self.random = random.Random(seed)
+        self.stats = {'connections': 0, 'resets': 0, 'upstream_errors': 0}
+        self.loop = None
+        self.thread = None
+        self.listener = None
+        self.tasks = set()
+
+    def start(self):
+        _raise_fd_limit()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        future = asyncio.run_coroutine_threadsafe(self._listen(), self.loop)
+        try:
+            future.result(STARTUP_TIMEOUT)
+        except Exception:
+            self._stop_loop()
+            raise
+
+    async def _listen(self):
+        self.listener = await asyncio.start_server(self._handle, self.host, self.port, backlog=socket.SOMAXCONN)
+        self.port = self.listener.sockets[0].getsockname()[1]
+
+    async def _shutdown(self):
+        self.listener.close()
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def _stop_loop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(SHUTDOWN_TIMEOUT)
+        self.loop.close()
+        self.loop = self.thread = None
+
+    def stop(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(SHUTDOWN_TIMEOUT)
+        self._stop_loop()
+
+    def get_base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @staticmethod
+    def _abort(writer):
+        # SO_LINGER with a zero timeout turns the close into a RST.
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            except OSError:
+                pass
+        writer.transport.abort()
+
+    async def _handle(self, client_reader, client_writer):
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        self.stats['connections'] += 1
+        try:
+            await self._forward(client_reader, client_writer)
+        finally:
+            self.tasks.discard(task)
+
+    async def _forward(self, client_reader, client_writer):
+        try:
+            server_reader, server_writer = await asyncio.open_connection(*self.target)
+        except OSError:
+            self.stats['upstream_errors'] += 1
+            self._abort(client_writer)
+            return
+        writers = (client_writer, server_writer)
+        if self.segment_size:
+            # drain() then waits until the kernel has taken each segment,
+            # so segments are not coalesced in our buffer.
+            for writer in writers:
+                writer.transport.set_write_buffer_limits(high=0)
+        reset = self.random.random() < self.reset_ratio
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(self._pipe(client_reader, server_writer, False))
+                group.create_task(self._pipe(server_reader, client_writer, reset))
+        except* OSError as errors:
+            if errors.subgroup(InjectedReset):
+                self.stats['resets'] += 1
+            for writer in writers:
+                self._abort(writer)
+        except* asyncio.CancelledError:
+            for writer in writers:
+                self._abort(writer)
+            raise
+        else:
+            for writer in writers:
+                writer.close()
+
+    async def _pipe(self, reader, writer, reset):
+        """Copies one direction of a connection. Each chunk read is held
+        back by the profile's latency, then written out in segments no
+        faster than its bandwidth. With reset, half of the first chunk goes
+        through before the connection is reset."""
+        loop = asyncio.get_running_loop()
+        # Bounded like a link buffer, so a slow link pushes back on the
+        # sender instead of the proxy reading the whole body into memory.
+        queue = asyncio.Queue(PROXY_QUEUE_CHUNKS)
+
+        async def receive():
+            while True:
+                data = await reader.read(PROXY_READ_SIZE)
+                await queue.put((loop.time() + self.latency, data))
+                if not data:
+                    return
+
+        async def send():
+            free_at = 0.0
+            while True:
+                due, data = await queue.get()
+                if not data:
+                    if writer.can_write_eof():
+                        writer.write_eof()
+                    return
+                if reset:
+                    writer.write(data[:len(data) // 2])
+                    await writer.drain()
+                    raise InjectedReset("injected reset")
+                step = self.segment_size or len(data)
+                for start in range(0, len(data), step):
+                    segment = data[start:start + step]
+                    send_at = max(due, free_at)
+                    if send_at > loop.time():
+                        await asyncio.sleep(send_at - loop.time())
+                    writer.write(segment)
+                    await writer.drain()
+                    if self.bandwidth:
+                        free_at = send_at + len(segment) / self.bandwidth
+
+        async with asyncio.TaskGroup() as group:
+            group.create_task(receive())
+            group.create_task(send())
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class Network:
+    """Where a test sends its load: straight to the server for the "direct"
+    profile, through a FaultProxy for any other."""
+
+    def __init__(self, name, url, proxy=None):
+        self.name = name
+        self.url = url
+        self.proxy = proxy
+
+    @property
+    def resets(self):
+        return self.proxy.stats['resets'] if self.proxy else 0
+
+    def scenario(self, scenario):
+        # Results over each profile are recorded and compared apart from
+        # the direct ones.
+        return scenario if self.proxy is None else f"{scenario}@{self.name}"
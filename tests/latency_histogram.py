@@ -0,0 +1,93 @@
+import math
+from array import array
+
+SUB_BUCKET_BITS = 8
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT // 2
+MAX_SHIFT = 32  # up to ~2**40 us, about 12 days
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram with ~0.8% relative precision.
+
+    Values are stored as integer microseconds: the first 256 buckets are
+    linear, every following power of two is split into 128 sub-buckets.
+    Recording is O(1) and memory is fixed regardless of the sample count.
+    """
+
+    def __init__(self):
+        self.counts = array('Q', bytes(8 * (SUB_BUCKET_COUNT + MAX_SHIFT * SUB_BUCKET_HALF)))
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+        self.min_value = 0
+        self.max_value = 0
+
+    @staticmethod
+    def _index(value):
+        if value < SUB_BUCKET_COUNT:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        if shift > MAX_SHIFT:
+            shift, value = MAX_SHIFT, (SUB_BUCKET_COUNT << MAX_SHIFT) - 1
+        return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + (value >> shift) - SUB_BUCKET_HALF
+
+    @staticmethod
+    def _highest_equivalent(index):
+        if index < SUB_BUCKET_COUNT:
+            return index
+        shift, sub = divmod(index - SUB_BUCKET_COUNT, SUB_BUCKET_HALF)
+        shift += 1
+        return ((sub + SUB_BUCKET_HALF + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = int(seconds * 1_000_000)
+        self.counts[self._index(value)] += 1
+        if self.count == 0 or value < self.min_value:
+            self.min_value = value
+        if value > self.max_value:
+            self.max_value = value
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        if self.count == 0 or other.min_value < self.min_value:
+            self.min_value = other.min_value
+        self.max_value = max(self.max_value, other.max_value)
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        return self
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(self.count * pct / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._highest_equivalent(index), self.max_value) / 1_000_000
+        return self.max_value / 1_000_000
+
+    def mean(self):
+        return self.total / self.count / 1_000_000 if self.count else 0.0
+
+    def stdev(self):
+        if self.count < 2:
+            return 0.0
+        variance = (self.total_sq - self.total * self.total / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0.0)) / 1_000_000
+
+    def min(self):
+        return self.min_value / 1_000_000
+
+    def max(self):
+        return self.max_value / 1_000_000
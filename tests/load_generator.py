@@ -0,0 +1,566 @@
+import asyncio
+import math
+import multiprocessing
+import random
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+from config import (
+    REQUEST_TIMEOUT,
+    LOAD_WORKERS,
+    OPEN_LOOP_MAX_IN_FLIGHT,
+    OPEN_LOOP_KNEE_FACTOR,
+    SCENARIO_START_DELAY,
+)
+from latency_histogram import LatencyHistogram
+from payload_corpus import EchoDigest, Payload, PayloadCorpus
+
+# Largest read while a response body is hashed.
+READ_CHUNK = 64 * 1024
+
+
+def request_head(host, port, path, content_length, method="POST"):
+    if method in ("GET", "HEAD"):
+        return f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n".encode()
+    return (
+        f"{method} {path} HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        f"Content-Type: text/plain\r\n"
+        f"Content-Length: {content_length}\r\n"
+        f"\r\n"
+    ).encode()
+
+
+def build_request(host, port, path, body, method="POST"):
+    head = request_head(host, port, path, len(body), method)
+    return head if method in ("GET", "HEAD") else head + body
+
+
+async def read_response(reader, echo=None):
+    """Reads one response and returns (status, body, close). With an
+    EchoDigest, a sized body is hashed into it as it arrives instead of
+    being returned."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.split(b"\r\n")
+    status = int(lines[0].split(b" ", 2)[1])
+    length = None
+    close = lines[0].startswith(b"HTTP/1.0")
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"connection":
+            close = value.strip().lower() == b"close"
+    if length is None:
+        body = await reader.read()
+        close = True
+    elif echo is not None:
+        body = None
+        while length:
+            chunk = await reader.read(min(length, READ_CHUNK))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", length)
+            echo.update(chunk)
+            length -= len(chunk)
+    else:
+        body = await reader.readexactly(length)
+    return status, body, close
+
+
+def _raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def _new_stats():
+    return {
+        'successful': 0,
+        'failed': 0,
+        'latency': LatencyHistogram(),
+        'errors': {},
+        'connections_opened': 0,
+        'max_send_lag': 0.0,
+    }
+
+
+def _record_error(stats, error):
+    stats['failed'] += 1
+    stats['errors'][error] = stats['errors'].get(error, 0) + 1
+
+
+async def _run_connections(host, port, requests, timeout):
+    stats = _new_stats()
+
+    async def connection(conn_requests):
+        reader = writer = None
+        for head, payload in conn_requests:
+            start = time.perf_counter()
+            echo = None if payload is None else EchoDigest()
+            try:
+                async with asyncio.timeout(timeout):
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection(host, port)
+                        stats['connections_opened'] += 1
+                    writer.writelines((head,) if payload is None else (head, *payload.chunks()))
+                    status, _, close = await read_response(reader, echo)
+                elapsed = time.perf_counter() - start
+            except Exception as e:
+                _record_error(stats, str(e) or type(e).__name__)
+                close = True
+            else:
+                if status != 200:
+                    _record_error(stats, f"HTTP {status}")
+                elif echo is not None and not echo.matches(payload):
+                    _record_error(stats, "echo mismatch")
+                else:
+                    stats['successful'] += 1
+                    stats['latency'].record(elapsed)
+            if close and writer is not None:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    await asyncio.gather(*(connection(r) for r in requests))
+    return stats
+
+
+def _worker(host, port, path, conn_ids, body_prefix, payload_size, requests_per_connection, timeout, method):
+    _raise_fd_limit()
+    # Each request is its head and a payload: a unique body prefix, then a
+    # view of the one block every request shares. Echo digests are worked
+    # out here, before any timing starts.
+    body = PayloadCorpus().block(payload_size)
+    with_body = method not in ("GET", "HEAD")
+
+    def parts(conn_id, req_num):
+        if not with_body:
+            return request_head(host, port, path, 0, method), None
+        payload = Payload(body_prefix.format(conn=conn_id, req=req_num).encode(), body)
+        payload.echo_digest
+        return request_head(host, port, path, payload.size, method), payload
+
+    requests = [
+        [parts(conn_id, req_num) for req_num in range(requests_per_connection)]
+        for conn_id in conn_ids
+    ]
+    started = time.time()
+    stats = asyncio.run(_run_connections(host, port, requests, timeout))
+    stats['started'] = started
+    stats['finished'] = time.time()
+    return stats
+
+
+async def _run_open_loop(host, port, data, payload, rate, duration, timeout, max_in_flight):
+    stats = _new_stats()
+    in_flight = 0
+
+    async def request(intended):
+        nonlocal in_flight
+        writer = None
+        echo = EchoDigest()
+        try:
+            async with asyncio.timeout(timeout):
+                reader, writer = await asyncio.open_connection(host, port)
+                stats['connections_opened'] += 1
+                writer.write(data)
+                status, _, _ = await read_response(reader, echo)
+            # Latency is taken from the scheduled send time, not the actual one,
+            # so a stalled server cannot hide the requests it delayed.
+            elapsed = time.perf_counter() - intended
+        except Exception as e:
+            _record_error(stats, str(e) or type(e).__name__)
+        else:
+            if status != 200:
+                _record_error(stats, f"HTTP {status}")
+            elif not echo.matches(payload):
+                _record_error(stats, "echo mismatch")
+            else:
+                stats['successful'] += 1
+                stats['latency'].record(elapsed)
+        finally:
+            in_flight -= 1
+            if writer is not None:
+                writer.close()
+
+    interval = 1.0 / rate
+    count = int(rate * duration)
+    tasks = []
+    t0 = time.perf_counter()
+    for i in range(count):
+        intended = t0 + i * interval
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            stats['max_send_lag'] = max(stats['max_send_lag'], -delay)
+        if in_flight >= max_in_flight:
+            _record_error(stats, "client in-flight limit reached")
+            continue
+        in_flight += 1
+        tasks.append(asyncio.create_task(request(intended)))
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def _open_loop_worker(host, port, path, payload_size, rate, duration, timeout, max_in_flight):
+    _raise_fd_limit()
+    payload = Payload(b"", PayloadCorpus().block(payload_size))
+    payload.echo_digest
+    data = build_request(host, port, path, payload.tail.tobytes())
+    started = time.time()
+    stats = asyncio.run(_run_open_loop(host, port, data, payload, rate, duration, timeout, max_in_flight))
+    stats['started'] = started
+    stats['finished'] = time.time()
+    return stats
+
+
+def merge_results(parts):
+    merged = _new_stats()
+    for part in parts:
+        merged['successful'] += part['successful']
+        merged['failed'] += part['failed']
+        merged['latency'].merge(part['latency'])
+        merged['connections_opened'] += part['connections_opened']
+        for error, count in part['errors'].items():
+            merged['errors'][error] = merged['errors'].get(error, 0) + count
+        merged['max_send_lag'] = max(merged['max_send_lag'], part['max_send_lag'])
+    merged['total'] = merged['successful'] + merged['failed']
+    merged['started'] = min(p['started'] for p in parts)
+    merged['finished'] = max(p['finished'] for p in parts)
+    merged['total_time'] = merged['finished'] - merged['started']
+    return merged
+
+
+def _parse_url(url):
+    parsed = urlsplit(url)
+    return parsed.hostname, parsed.port or 80, parsed.path or "/"
+
+
+async def _run_in_workers(workers, fn, args_list):
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [loop.run_in_executor(pool, fn, *args) for args in args_list]
+        return await asyncio.gather(*futures)
+
+
+async def run_load(url, num_connections, payload_size, requests_per_connection=1,
+                   body_prefix="Conn-{conn}-", workers=None, timeout=REQUEST_TIMEOUT * 2,
+                   method="POST"):
+    host, port, path = _parse_url(url)
+    workers = max(1, min(workers or LOAD_WORKERS, num_connections))
+    shards = [range(i, num_connections, workers) for i in range(workers)]
+
+    parts = await _run_in_workers(workers, _worker, [
+        (host, port, path, shard, body_prefix, payload_size, requests_per_connection, timeout, method)
+        for shard in shards
+    ])
+
+    stats = merge_results(parts)
+    stats['payload_size'] = payload_size
+    stats['workers'] = workers
+    return stats
+
+
+async def run_open_loop(url, rate, duration, payload_size, workers=None,
+                        timeout=REQUEST_TIMEOUT * 2, max_in_flight=OPEN_LOOP_MAX_IN_FLIGHT):
+    host, port, path = _parse_url(url)
+    workers = max(1, min(workers or LOAD_WORKERS, int(rate)))
+
+    parts = await _run_in_workers(workers, _open_loop_worker, [
+        (host, port, path, payload_size, rate / workers, duration, timeout, max(1, max_in_flight // workers))
+        for _ in range(workers)
+    ])
+
+    stats = merge_results(parts)
+    stats['payload_size'] = payload_size
+    stats['workers'] = workers
+    stats['target_rate'] = rate
+    stats['duration'] = duration
+    stats['achieved_rate'] = stats['successful'] / stats['total_time'] if stats['total_time'] else 0.0
+    stats['p50'] = stats['latency'].percentile(50)
+    stats['p99'] = stats['latency'].percentile(99)
+    return stats
+
+
+async def sweep_rates(url, rates, duration, payload_size, knee_factor=OPEN_LOOP_KNEE_FACTOR,
+                      min_success_ratio=0.99, workers=None):
+    results = []
+    baseline_p99 = None
+    knee_rate = None
+    for rate in sorted(rates):
+        stats = await run_open_loop(url, rate, duration, payload_size, workers=workers)
+        results.append(stats)
+        success_ratio = stats['successful'] / stats['total'] if stats['total'] else 0.0
+        if baseline_p99 is None:
+            baseline_p99 = stats['p99']
+        if success_ratio < min_success_ratio or stats['p99'] > baseline_p99 * knee_factor:
+            knee_rate = rate
+            break
+    sustainable = [s['target_rate'] for s in results if s['target_rate'] != knee_rate]
+    return {
+        'results': results,
+        'knee_rate': knee_rate,
+        'capacity': max(sustainable) if sustainable else None,
+    }
+
+
+# Required keys of each phase kind in a load scenario (see LOAD_SCENARIOS in
+# config.py).
+PHASE_KINDS = {
+    'ramp': ('start_rate', 'end_rate', 'duration'),
+    'plateau': ('connections', 'duration'),
+    'spike': ('connections',),
+}
+
+
+def validate_scenario(scenario):
+    """Raises ValueError for a scenario run_scenario cannot execute."""
+    phases = scenario.get('phases')
+    if not phases:
+        raise ValueError("scenario has no phases")
+    names = set()
+    for phase in phases:
+        name = phase.get('name')
+        kind = phase.get('kind')
+        if not name or name in names:
+            raise ValueError(f"phase names must be unique and non-empty, got {name!r}")
+        names.add(name)
+        if kind not in PHASE_KINDS:
+            raise ValueError(f"phase {name!r}: unknown kind {kind!r}, expected one of {', '.join(PHASE_KINDS)}")
+        missing = [key for key in PHASE_KINDS[kind] if key not in phase]
+        if missing:
+            raise ValueError(f"phase {name!r}: missing {', '.join(missing)}")
+        if kind == 'ramp' and max(phase['start_rate'], phase['end_rate']) <= 0:
+            raise ValueError(f"phase {name!r}: ramp needs a positive rate")
+        sizes = phase.get('payload_sizes', scenario.get('payload_sizes', {}))
+        if any(weight < 0 for weight in sizes.values()) or (sizes and not sum(sizes.values())):
+            raise ValueError(f"phase {name!r}: payload size weights must be non-negative and not all zero")
+        if not 0 <= phase.get('keepalive_ratio', scenario.get('keepalive_ratio', 1.0)) <= 1:
+            raise ValueError(f"phase {name!r}: keepalive_ratio must be between 0 and 1")
+        spikes = phase.get('spikes')
+        if spikes and (kind == 'spike' or spikes.get('every', 0) <= 0 or 'connections' not in spikes):
+            raise ValueError(f"phase {name!r}: spikes need a timed phase, a positive 'every' and 'connections'")
+
+
+def _phase_slices(scenario):
+    # Spike bursts fired during a phase are reported apart from it.
+    for phase in scenario['phases']:
+        yield phase['name']
+        if phase.get('spikes'):
+            yield f"{phase['name']}:spike"
+
+
+def _share(total, index, workers):
+    return total // workers + (1 if index < total % workers else 0)
+
+
+class _ScenarioClient:
+    """Sends one worker's share of a scenario. Idle keep-alive connections
+    are pooled: each request reuses one with the phase's keep-alive ratio
+    and opens its own otherwise."""
+
+    def __init__(self, host, port, path, timeout, worker_index, seed):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.timeout = timeout
+        self.worker_index = worker_index
+        self.random = random.Random(seed)
+        self.corpus = PayloadCorpus()
+        self.idle = []
+        self.sent = 0
+
+    def _payload(self, size):
+        self.sent += 1
+        prefix = f"Scn-{self.worker_index}-{self.sent}-".encode()
+        return Payload(prefix, self.corpus.block(size))
+
+    async def _exchange(self, conn, payload, echo):
+        conn[1].writelines((request_head(self.host, self.port, self.path, payload.size), *payload.chunks()))
+        status, _, close = await read_response(conn[0], echo)
+        return status, close
+
+    async def request(self, stats, mix, intended=None):
+        sizes, weights, keepalive = mix
+        start = intended if intended is not None else time.perf_counter()
+        payload = self._payload(self.random.choices(sizes, weights)[0])
+        echo = EchoDigest()
+        keep = self.random.random() < keepalive
+        conn = self.idle.pop() if keep and self.idle else None
+        try:
+            async with asyncio.timeout(self.timeout):
+                if conn is not None:
+                    try:
+                        status, close = await self._exchange(conn, payload, echo)
+                    except (ConnectionError, asyncio.IncompleteReadError):
+                        # The server may have closed an idle connection just
+                        # as it was reused; a real client retries those once.
+                        conn[1].close()
+                        conn = None
+                        echo = EchoDigest()
+                if conn is None:
+                    conn = await asyncio.open_connection(self.host, self.port)
+                    stats['connections_opened'] += 1
+                    status, close = await self._exchange(conn, payload, echo)
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            _record_error(stats, str(e) or type(e).__name__)
+            if conn is not None:
+                conn[1].close()
+            return
+        if status != 200:
+            _record_error(stats, f"HTTP {status}")
+        elif not echo.matches(payload):
+            _record_error(stats, "echo mismatch")
+        else:
+            stats['successful'] += 1
+            stats['latency'].record(elapsed)
+        if keep and not close:
+            self.idle.append(conn)
+        else:
+            conn[1].close()
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+
+async def _run_ramp(client, stats, mix, phase, rate_share, max_in_flight):
+    # Arrival k of a rate going linearly from r0 to r1 over the phase is due
+    # where r0*t + (r1 - r0)*t^2 / (2*duration) reaches k.
+    r0 = phase['start_rate'] * rate_share
+    r1 = phase['end_rate'] * rate_share
+    duration = phase['duration']
+    slope = (r1 - r0) / duration
+    count = int((r0 + r1) / 2 * duration)
+    in_flight = 0
+    tasks = []
+
+    async def send(intended):
+        nonlocal in_flight
+        try:
+            await client.request(stats, mix, intended)
+        finally:
+            in_flight -= 1
+
+    t0 = time.perf_counter()
+    for k in range(count):
+        offset = k / r0 if slope == 0 else (math.sqrt(r0 * r0 + 2 * slope * k) - r0) / slope
+        intended = t0 + offset
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            stats['max_send_lag'] = max(stats['max_send_lag'], -delay)
+        if in_flight >= max_in_flight:
+            _record_error(stats, "client in-flight limit reached")
+            continue
+        in_flight += 1
+        tasks.append(asyncio.create_task(send(intended)))
+    await asyncio.gather(*tasks)
+
+
+async def _run_plateau(client, stats, mix, phase, connections):
+    deadline = time.perf_counter() + phase['duration']
+
+    async def loop():
+        while time.perf_counter() < deadline:
+            await client.request(stats, mix)
+
+    await asyncio.gather(*(loop() for _ in range(connections)))
+
+
+async def _run_burst(client, stats, mix, connections, requests):
+    async def burst_connection():
+        for _ in range(requests):
+            await client.request(stats, mix)
+
+    await asyncio.gather(*(burst_connection() for _ in range(connections)))
+
+
+async def _run_spikes(client, stats, mix, spikes, duration, connections):
+    bursts = []
+    t0 = time.perf_counter()
+    k = 1
+    while k * spikes['every'] < duration:
+        await asyncio.sleep(max(0.0, t0 + k * spikes['every'] - time.perf_counter()))
+        bursts.append(asyncio.create_task(
+            _run_burst(client, stats, mix, connections, spikes.get('requests', 1))))
+        k += 1
+    await asyncio.gather(*bursts)
+
+
+def _phase_mix(scenario, phase):
+    sizes = phase.get('payload_sizes', scenario.get('payload_sizes')) or {100: 1}
+    keepalive = phase.get('keepalive_ratio', scenario.get('keepalive_ratio', 1.0))
+    return list(sizes), list(sizes.values()), keepalive
+
+
+async def _run_scenario_phases(client, scenario, index, workers, start_at, max_in_flight):
+    results = {name: _new_stats() for name in _phase_slices(scenario)}
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    for phase in scenario['phases']:
+        name, kind = phase['name'], phase['kind']
+        mix = _phase_mix(scenario, phase)
+        stats = results[name]
+        stats['started'] = time.time()
+        running = []
+        if phase.get('spikes'):
+            spike_stats = results[f"{name}:spike"]
+            spike_stats['started'] = stats['started']
+            running.append(_run_spikes(client, spike_stats, mix, phase['spikes'], phase['duration'],
+                                       _share(phase['spikes']['connections'], index, workers)))
+        if kind == 'ramp':
+            running.append(_run_ramp(client, stats, mix, phase, 1 / workers, max_in_flight))
+        elif kind == 'plateau':
+            running.append(_run_plateau(client, stats, mix, phase, _share(phase['connections'], index, workers)))
+        else:
+            running.append(_run_burst(client, stats, mix, _share(phase['connections'], index, workers),
+                                      phase.get('requests', 1)))
+        await asyncio.gather(*running)
+        stats['finished'] = time.time()
+        if phase.get('spikes'):
+            results[f"{name}:spike"]['finished'] = stats['finished']
+    client.close()
+    return results
+
+
+def _scenario_worker(host, port, path, scenario, index, workers, start_at, timeout, max_in_flight, seed):
+    _raise_fd_limit()
+    client = _ScenarioClient(host, port, path, timeout, index, seed + index)
+    return asyncio.run(_run_scenario_phases(client, scenario, index, workers, start_at, max_in_flight))
+
+
+async def run_scenario(url, scenario, workers=None, timeout=REQUEST_TIMEOUT * 2,
+                       max_in_flight=OPEN_LOOP_MAX_IN_FLIGHT, seed=0):
+    """Runs the phases of a load scenario in order and returns, per phase
+    and per phase's spike bursts, (name, stats) with the latency and errors
+    of the requests sent in it."""
+    validate_scenario(scenario)
+    host, port, path = _parse_url(url)
+    workers = max(1, workers or LOAD_WORKERS)
+    # Every worker waits for this moment, so phases line up across workers
+    # however long each took to spawn.
+    start_at = time.time() + SCENARIO_START_DELAY
+
+    parts = await _run_in_workers(workers, _scenario_worker, [
+        (host, port, path, scenario, index, workers, start_at, timeout, max(1, max_in_flight // workers), seed)
+        for index in range(workers)
+    ])
+
+    phases = []
+    for phase in scenario['phases']:
+        sizes, weights, _ = _phase_mix(scenario, phase)
+        names = [phase['name'], f"{phase['name']}:spike"] if phase.get('spikes') else [phase['name']]
+        for name in names:
+            stats = merge_results([part[name] for part in parts])
+            # The mean body size, for the MB/s of the phase's record.
+            stats['payload_size'] = sum(size * weight for size, weight in zip(sizes, weights)) / sum(weights)
+            stats['achieved_rate'] = stats['successful'] / stats['total_time'] if stats['total_time'] else 0.0
+            phases.append((name, stats))
+    return phases
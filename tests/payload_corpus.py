@@ -0,0 +1,95 @@
+import hashlib
+from functools import cached_property
+
+ECHO_PREFIX = b"Echo: "
+# Cycled through every body so that dropped, repeated or reordered bytes
+# change the digest; a run of one letter would hide them.
+PATTERN = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+# Echo benchmarks measure the echo itself; compression has its own tests.
+IDENTITY = {"Accept-Encoding": "identity"}
+
+
+class Payload:
+    """One request body: a short unique prefix followed by a view into a
+    block shared with every other body of the same size."""
+
+    def __init__(self, prefix, tail):
+        self.prefix = prefix
+        self.tail = tail
+        self.size = len(prefix) + len(tail)
+
+    def chunks(self):
+        """The body as httpx `content`, sent without joining the parts."""
+        return iter((self.prefix, self.tail))
+
+    async def achunks(self):
+        """The same for httpx.AsyncClient, which needs an async iterable."""
+        yield self.prefix
+        yield self.tail
+
+    def headers(self):
+        return {"Content-Length": str(self.size), **IDENTITY}
+
+    @cached_property
+    def echo_digest(self):
+        digest = hashlib.sha256(ECHO_PREFIX + self.prefix)
+        digest.update(self.tail)
+        return digest.hexdigest()
+
+
+class EchoDigest:
+    """Hashes a response body as it arrives."""
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def update(self, chunk):
+        self.digest.update(chunk)
+        self.size += len(chunk)
+
+    def matches(self, payload):
+        return self.size == len(ECHO_PREFIX) + payload.size and self.digest.hexdigest() == payload.echo_digest
+
+
+class PayloadCorpus:
+    """Generates the bytes for each body size once per session."""
+
+    def __init__(self):
+        self.blocks = {}
+
+    def block(self, size):
+        if size not in self.blocks:
+            repeats = size // len(PATTERN) + 1
+            self.blocks[size] = memoryview((PATTERN * repeats)[:size])
+        return self.blocks[size]
+
+    def payload(self, tag, size):
+        prefix = f"{tag}-".encode()[:size]
+        return Payload(prefix, self.block(size)[len(prefix):])
+
+    def payloads(self, tag, count, size):
+        """`count` distinct bodies of `size` bytes. Their expected echo
+        digests are worked out here, before any timing starts."""
+        payloads = [self.payload(f"{tag}-{i}", size) for i in range(count)]
+        for payload in payloads:
+            payload.echo_digest
+        return payloads
+
+
+def post_payload(client, url, payload):
+    """Posts a payload with httpx and checks the echo while it streams in.
+    Returns (status, echo matches)."""
+    echo = EchoDigest()
+    with client.stream("POST", url, content=payload.chunks(), headers=payload.headers()) as response:
+        for chunk in response.iter_raw():
+            echo.update(chunk)
+    return response.status_code, echo.matches(payload)
+
+
+async def post_payload_async(client, url, payload):
+    echo = EchoDigest()
+    async with client.stream("POST", url, content=payload.achunks(), headers=payload.headers()) as response:
+        async for chunk in response.aiter_raw():
+            echo.update(chunk)
+    return response.status_code, echo.matches(payload)
@@ -0,0 +1,32 @@
+import socket
+from config import DEFAULT_HOST, REQUEST_TIMEOUT
+
+
+def make_request(body, headers="", version="HTTP/1.1"):
+    data = body.encode()
+    return (
+        f"POST / {version}\r\n"
+        f"Host: {DEFAULT_HOST}\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        f"{headers}"
+        f"\r\n"
+    ).encode() + data
+
+
+def read_response(stream):
+    status_line = stream.readline()
+    assert status_line, "Connection closed before a response arrived"
+    headers = {}
+    while True:
+        line = stream.readline().rstrip(b"\r\n")
+        if not line:
+            break
+        name, _, value = line.partition(b":")
+        headers[name.strip().lower().decode()] = value.strip().decode()
+    body = stream.read(int(headers["content-length"]))
+    return int(status_line.split()[1]), headers, body.decode()
+
+
+def open_connection(port):
+    sock = socket.create_connection((DEFAULT_HOST, port), timeout=REQUEST_TIMEOUT)
+    return sock, sock.makefile("rb")
@@ -0,0 +1,283 @@
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import weakref
+from collections import deque
+from config import RESOURCE_SAMPLE_INTERVAL, RESOURCE_MAX_SAMPLES, PERF_FREQUENCY
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+SERIES_FIELDS = ('cpu_percent', 'rss', 'fds', 'voluntary_switches', 'involuntary_switches')
+
+# Every sampler that still exists, so a benchmark record can find the one
+# that watched the server it drove.
+_samplers = weakref.WeakSet()
+_samplers_lock = threading.Lock()
+
+
+def cpu_seconds(pid):
+    """User plus system CPU time the process has used so far."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rpartition(")")[2].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def read_status(pid, *keys):
+    values = dict.fromkeys(keys, 0)
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in values:
+                values[name] = int(value.split()[0])
+    return values
+
+
+def current_rss(pid):
+    return read_status(pid, "VmRSS")["VmRSS"] * 1024
+
+
+def context_switches(pid):
+    # /proc/<pid>/status only counts the main thread; the workers are
+    # separate tasks, so their sched files are summed.
+    voluntary = involuntary = 0
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/sched") as f:
+                for line in f:
+                    name, _, value = line.partition(":")
+                    name = name.strip()
+                    if name == "nr_voluntary_switches":
+                        voluntary += int(value)
+                    elif name == "nr_involuntary_switches":
+                        involuntary += int(value)
+        except FileNotFoundError:
+            continue
+    return voluntary, involuntary
+
+
+def read_process(pid):
+    """Cumulative counters of one process, or None once it is gone."""
+    try:
+        voluntary, involuntary = context_switches(pid)
+        return {
+            'cpu_seconds': cpu_seconds(pid),
+            'rss': current_rss(pid),
+            'fds': len(os.listdir(f"/proc/{pid}/fd")),
+            'voluntary_switches': voluntary,
+            'involuntary_switches': involuntary,
+        }
+    except (FileNotFoundError, ProcessLookupError, IndexError, ValueError):
+        return None
+
+
+class ResourceSampler:
+    """Polls a process from /proc on a background thread.
+
+    pid_source is called on every tick, so the sampler follows a server
+    that re-execs itself. Each sample holds the CPU use and context
+    switches since the previous tick plus the RSS and open fd count at it.
+    """
+
+    def __init__(self, pid_source, interval=RESOURCE_SAMPLE_INTERVAL, max_samples=RESOURCE_MAX_SAMPLES):
+        self.pid_source = pid_source
+        self.interval = interval
+        self.samples = deque(maxlen=max_samples)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        with _samplers_lock:
+            _samplers.add(self)
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        previous = None
+        while True:
+            pid = self.pid_source()
+            counters = read_process(pid) if pid else None
+            now = time.monotonic()
+            if counters and previous and previous[0] == pid:
+                _, last, last_time = previous
+                elapsed = now - last_time
+                sample = {
+                    't': time.time(),
+                    'pid': pid,
+                    'cpu_percent': (counters['cpu_seconds'] - last['cpu_seconds']) / elapsed * 100,
+                    'rss': counters['rss'],
+                    'fds': counters['fds'],
+                    'voluntary_switches': counters['voluntary_switches'] - last['voluntary_switches'],
+                    'involuntary_switches': counters['involuntary_switches'] - last['involuntary_switches'],
+                }
+                with self.lock:
+                    self.samples.append(sample)
+            previous = (pid, counters, now) if counters else None
+            if self.stopped.wait(self.interval):
+                return
+
+    def window(self, start, end=None):
+        """Samples taken between two time.time() stamps."""
+        end = end if end is not None else time.time()
+        with self.lock:
+            return [s for s in self.samples if start <= s['t'] <= end]
+
+
+def summarize(samples):
+    if not samples:
+        return {}
+    duration = samples[-1]['t'] - samples[0]['t'] if len(samples) > 1 else 0.0
+    summary = {'samples': len(samples), 'pids': sorted({s['pid'] for s in samples})}
+    for field in ('cpu_percent', 'rss', 'fds'):
+        values = [s[field] for s in samples]
+        summary[field] = {'peak': max(values), 'mean': sum(values) / len(values)}
+    for field in ('voluntary_switches', 'involuntary_switches'):
+        values = [s[field] for s in samples]
+        summary[field] = {
+            'total': sum(values),
+            'peak': max(values),
+            'per_second': sum(values) / duration if duration else 0.0,
+        }
+    return summary
+
+
+def resource_profile(samples):
+    """Summary plus the time series, column by column to keep records small."""
+    start = samples[0]['t']
+    series = {'t': [round(s['t'] - start, 3) for s in samples]}
+    for field in SERIES_FIELDS:
+        series[field] = [round(s[field], 2) if field == 'cpu_percent' else s[field] for s in samples]
+    return {'summary': summarize(samples), 'series': series}
+
+
+def busiest_window(start, end=None):
+    """Profile of the busiest process any sampler saw between start and end:
+    with several servers running, that is the one the benchmark drove."""
+    with _samplers_lock:
+        samplers = list(_samplers)
+    best = None
+    for sampler in samplers:
+        samples = sampler.window(start, end)
+        if samples:
+            busy = sum(s['cpu_percent'] for s in samples)
+            if best is None or busy > best[0]:
+                best = (busy, samples)
+    return resource_profile(best[1]) if best else None
+
+
+def format_summary(summary):
+    return (f"CPU peak {summary['cpu_percent']['peak']:.0f}% mean {summary['cpu_percent']['mean']:.0f}% | "
+            f"RSS peak {summary['rss']['peak'] / 1024 / 1024:.1f} MB mean {summary['rss']['mean'] / 1024 / 1024:.1f} MB | "
+            f"fds peak {summary['fds']['peak']} | "
+            f"ctx switches {summary['voluntary_switches']['per_second']:.0f}/s voluntary, "
+            f"{summary['involuntary_switches']['per_second']:.0f}/s involuntary")
+
+
+class PerfRecorder:
+    """Runs `perf record -g` against a process until stopped.
+
+    The output feeds a flamegraph:
+    perf script -i FILE | stackcollapse-perf.pl | flamegraph.pl > out.svg
+    """
+
+    def __init__(self, pid, directory, frequency=PERF_FREQUENCY):
+        self.pid = pid
+        self.path = os.path.join(directory, f"{pid}.perf.data")
+        self.frequency = frequency
+        self.process = None
+        self.directory = directory
+
+    @staticmethod
+    def available():
+        return shutil.which("perf") is not None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.process = subprocess.Popen(
+            ["perf", "record", "-g", "-F", str(self.frequency), "-p", str(self.pid), "-o", self.path],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+
+    def stop(self):
+        if not self.process:
+            return None
+        # perf writes its file out on SIGINT, like after Ctrl-C.
+        self.process.send_signal(signal.SIGINT)
+        try:
+            _, stderr = self.process.communicate(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            _, stderr = self.process.communicate()
+        failed = self.process.returncode not in (0, -signal.SIGINT)
+        self.process = None
+        if failed or not os.path.exists(self.path):
+            print(f"\n[PERF] perf record for pid {self.pid} failed: {stderr.decode(errors='replace').strip()}")
+            return None
+        print(f"\n[PERF] Profile of pid {self.pid} written to {self.path}")
+        return self.path
+
+
+def parse_strace_summary(text):
+    """Calls per system call from the table `strace -c` prints."""
+    calls = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) < 5 or fields[-1] == "total":
+            continue
+        try:
+            float(fields[0])
+            calls[fields[-1]] = int(fields[3])
+        except ValueError:
+            continue
+    return calls
+
+
+class SyscallCounter:
+    """Counts the system calls of a process and all its threads with
+    `strace -c` until stopped. ptrace slows every call down, so the
+    counts are meaningful but timings taken meanwhile are not."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.process = None
+
+    @staticmethod
+    def available():
+        return shutil.which("strace") is not None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            ["strace", "-c", "-f", "-p", str(self.pid)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        # strace announces each thread as it attaches; calls made before
+        # that are missed, so give it a moment.
+        time.sleep(0.5)
+
+    def stop(self):
+        if not self.process:
+            return None
+        # strace detaches and prints its table on SIGINT.
+        self.process.send_signal(signal.SIGINT)
+        try:
+            _, stderr = self.process.communicate(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            _, stderr = self.process.communicate()
+        self.process = None
+        calls = parse_strace_summary(stderr.decode(errors='replace'))
+        if not calls:
+            print(f"\n[STRACE] strace -c for pid {self.pid} failed: {stderr.decode(errors='replace').strip()}")
+            return None
+        return calls
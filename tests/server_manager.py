@@ -1,31 +1,91 @@
+import os
+import re
+import socket
 import subprocess
 import time
 import signal
 import threading
-import queue
-from config import SERVER_EXECUTABLE, DEFAULT_HOST, DEFAULT_PORT, STARTUP_TIMEOUT
+from collections import deque
+from config import (
+    SERVER_EXECUTABLE,
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    STARTUP_TIMEOUT,
+    SHUTDOWN_TIMEOUT,
+    SERVER_LOG_LEVEL,
+    SERVER_LOG_SAMPLE,
+    SERVER_LOG_TAIL,
+    SERVER_IO_BACKEND,
+    BENCH_RESULTS_DIR,
+    RESOURCE_SAMPLE_INTERVAL,
+    PERF_RECORD,
+)
+from resource_sampler import ResourceSampler, PerfRecorder
+
+LISTENING_LINE = re.compile(rb"listening on port (\d+) .*\(pid (\d+)\)")
+
+
+def process_exited(pid):
+    # A process the server re-exec'd on reload is not our child, so it may
+    # linger as a zombie until something reaps it.
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rpartition(")")[2].split()[0] == "Z"
+    except FileNotFoundError:
+        return True
 
 
 class ServerManager:
-    def __init__(self, port=DEFAULT_PORT, host=DEFAULT_HOST):
+    def __init__(self, port=DEFAULT_PORT, host=DEFAULT_HOST, workers=None, extra_args=(),
+                 log_level=SERVER_LOG_LEVEL, log_sample=SERVER_LOG_SAMPLE, executable=SERVER_EXECUTABLE,
+                 io_backend=SERVER_IO_BACKEND):
         self.port = port
+        self.executable = executable
         self.host = host
+        self.workers = workers
+        self.extra_args = list(extra_args)
+        self.log_level = log_level
+        self.log_sample = log_sample
+        self.io_backend = io_backend
+        # `process` is the process start() launched; `pid` is whichever
+        # process is serving now, which changes with every reload().
         self.process = None
-        self.stdout_lines = []
-        self.stderr_lines = []
+        self.pid = None
+        self.stdout_lines = deque(maxlen=SERVER_LOG_TAIL)
+        self.stderr_lines = deque(maxlen=SERVER_LOG_TAIL)
+        self.logs_lock = threading.Lock()
         self.stdout_thread = None
         self.stderr_thread = None
+        # (port, pid) of every listening line seen, in order.
+        self.announced = []
+        self.announced_changed = threading.Condition()
+        self.sampler = None
+        self.perf = None
 
-    def _read_stream(self, stream, lines_list):
+    def _read_stream(self, stream, lines):
+        # Only a bounded tail is kept; lines are decoded lazily in get_logs.
         for line in iter(stream.readline, b''):
-            decoded = line.decode('utf-8', errors='replace').rstrip()
-            lines_list.append(decoded)
-            print(f"[SERVER] {decoded}")
+            # Kept before it is announced, so the listening line is in the
+            # logs by the time start() returns.
+            with self.logs_lock:
+                lines.append(line)
+            match = LISTENING_LINE.search(line)
+            if match:
+                with self.announced_changed:
+                    self.announced.append((int(match.group(1)), int(match.group(2))))
+                    self.announced_changed.notify_all()
         stream.close()
 
     def start(self):
+        args = [self.executable, str(self.port)]
+        if self.workers:
+            args += ["--workers", str(self.workers)]
+        args += ["--log-level", self.log_level, "--log-sample", str(self.log_sample)]
+        args += ["--io-backend", self.io_backend]
+        args += self.extra_args
+        self.announced = []
         self.process = subprocess.Popen(
-            [SERVER_EXECUTABLE, str(self.port)],
+            args,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
         )
@@ -43,36 +103,138 @@ class ServerManager:
         self.stdout_thread.start()
         self.stderr_thread.start()
         
-        time.sleep(STARTUP_TIMEOUT)
-        if self.process.poll() is not None:
-            raise RuntimeError("Server failed to start")
+        try:
+            self._wait_until_ready(self.process.pid)
+        except RuntimeError:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+            raise
+        if RESOURCE_SAMPLE_INTERVAL > 0:
+            self.sampler = ResourceSampler(lambda: self.pid)
+            self.sampler.start()
+        self._start_perf()
+
+    def _start_perf(self):
+        if not PERF_RECORD:
+            return
+        if not PerfRecorder.available():
+            print("\n[PERF] PERF_RECORD is set but perf is not installed")
+            return
+        self.perf = PerfRecorder(self.pid, os.path.join(BENCH_RESULTS_DIR, "perf"))
+        self.perf.start()
+
+    def _stop_perf(self):
+        if self.perf:
+            self.perf.stop()
+            self.perf = None
+
+    def _startup_failed(self, reason):
+        stderr = "\n".join(self._decode(self.stderr_lines)[-20:])
+        raise RuntimeError(f"Server failed to start: {reason}\n{stderr}")
+
+    def _has_exited(self, pid):
+        if self.process and pid == self.process.pid:
+            return self.process.poll() is not None
+        return process_exited(pid)
+
+    def _wait_exit(self, pid, timeout):
+        deadline = time.monotonic() + timeout
+        while not self._has_exited(pid):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _wait_until_ready(self, watched_pid, seen=0):
+        # The server reports the port it actually bound (the OS picks one
+        # for port 0) and its pid; a TCP connect then confirms it accepts
+        # connections. watched_pid is the process whose exit means startup
+        # failed; the first `seen` announcements are from earlier processes.
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        with self.announced_changed:
+            while True:
+                if len(self.announced) > seen:
+                    self.port, self.pid = self.announced[seen]
+                    break
+                if self._has_exited(watched_pid):
+                    code = self.process.returncode if watched_pid == self.process.pid else "unknown"
+                    self._startup_failed(f"exited with code {code}")
+                if time.monotonic() > deadline:
+                    self._startup_failed(f"no listening line within {STARTUP_TIMEOUT}s")
+                self.announced_changed.wait(0.01)
+
+        while True:
+            try:
+                socket.create_connection((self.host, self.port), timeout=STARTUP_TIMEOUT).close()
+                return
+            except OSError as e:
+                if self._has_exited(self.pid) or time.monotonic() > deadline:
+                    self._startup_failed(f"port {self.port} not accepting connections: {e}")
+                time.sleep(0.01)
+
+    def reload(self, sig=signal.SIGUSR2):
+        """Has the server re-exec itself on the same listening sockets.
+
+        Returns once the new process is serving and the old one has drained
+        and exited.
+        """
+        old_pid = self.pid
+        with self.announced_changed:
+            seen = len(self.announced)
+        os.kill(old_pid, sig)
+        self._wait_until_ready(old_pid, seen)
+        # perf follows a pid, so the new process gets its own profile.
+        if self.perf:
+            self._stop_perf()
+            self._start_perf()
+        if not self._wait_exit(old_pid, SHUTDOWN_TIMEOUT):
+            raise RuntimeError(f"Old server process {old_pid} still running {SHUTDOWN_TIMEOUT}s after reload")
+        return self.pid
 
     def stop(self):
-        if self.process:
-            self.process.send_signal(signal.SIGTERM)
-            self.process.wait(timeout=5)
-            self.process = None
+        if self.pid is None:
+            return
+        self._stop_perf()
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+            if not self._wait_exit(self.pid, SHUTDOWN_TIMEOUT):
+                os.kill(self.pid, signal.SIGKILL)
+                self._wait_exit(self.pid, SHUTDOWN_TIMEOUT)
+        except ProcessLookupError:
+            pass
+        if self.process.poll() is None:
+            self.process.wait()
+        if self.sampler:
+            # The samples stay readable for results recorded after stop().
+            self.sampler.stop()
+        self.process = None
+        self.pid = None
 
     def is_running(self):
-        if not self.process:
-            return False
-        return self.process.poll() is None
+        return self.pid is not None and not self._has_exited(self.pid)
 
     def get_base_url(self):
         return f"http://{self.host}:{self.port}"
 
+    def _decode(self, lines):
+        with self.logs_lock:
+            lines = list(lines)
+        return [line.decode('utf-8', errors='replace').rstrip() for line in lines]
+
     def get_logs(self):
         return {
-            "stdout": self.stdout_lines.copy(),
-            "stderr": self.stderr_lines.copy()
+            "stdout": self._decode(self.stdout_lines),
+            "stderr": self._decode(self.stderr_lines)
         }
 
     def print_logs(self):
-        print("\n=== Server stdout ===")
-        for line in self.stdout_lines:
+        logs = self.get_logs()
+        print(f"\n=== Server stdout (last {SERVER_LOG_TAIL} lines) ===")
+        for line in logs["stdout"]:
             print(line)
-        print("\n=== Server stderr ===")
-        for line in self.stderr_lines:
+        print(f"\n=== Server stderr (last {SERVER_LOG_TAIL} lines) ===")
+        for line in logs["stderr"]:
             print(line)
 
     def __enter__(self):
@@ -0,0 +1,106 @@
+import math
+import httpx
+from config import REQUEST_TIMEOUT
+
+STAGES = {
+    'first_byte': "http_accept_to_first_byte_seconds",
+    'parse': "http_parse_seconds",
+    'route': "http_route_seconds",
+    'send': "http_send_seconds",
+}
+
+SCRAPE_COUNTERS = ("http_connections_accepted_total", "http_requests_total")
+
+
+def parse_metrics(text):
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, _, value = line.rpartition(" ")
+        samples[name] = float(value)
+    return samples
+
+
+class MetricsSnapshot:
+    def __init__(self, samples):
+        self.samples = samples
+
+    def value(self, name):
+        return self.samples.get(name, 0.0)
+
+    def buckets(self, name):
+        prefix = f'{name}_bucket{{le="'
+        result = []
+        for key, count in self.samples.items():
+            if key.startswith(prefix):
+                result.append((float(key[len(prefix):-2]), count))
+        return sorted(result)
+
+    def diff(self, before):
+        delta = {name: value - before.value(name) for name, value in self.samples.items()}
+        # Every scrape opens its own connection, which the later snapshot
+        # has already counted.
+        for name in SCRAPE_COUNTERS:
+            delta[name] = max(0.0, delta.get(name, 0.0) - 1)
+        return MetricsSnapshot(delta)
+
+    def mean(self, name):
+        count = self.value(f"{name}_count")
+        return self.value(f"{name}_sum") / count if count else 0.0
+
+    def quantile(self, name, q):
+        """Estimates the q-quantile (0..1) by linear interpolation inside
+        the matching bucket, the same way Prometheus' histogram_quantile
+        does."""
+        buckets = self.buckets(name)
+        if not buckets or buckets[-1][1] == 0:
+            return 0.0
+        rank = q * buckets[-1][1]
+        lower_bound, lower_count = 0.0, 0.0
+        for bound, count in buckets:
+            if count >= rank:
+                if math.isinf(bound):
+                    return lower_bound
+                if count == lower_count:
+                    return bound
+                return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+            lower_bound, lower_count = bound, count
+        return lower_bound
+
+    def summary(self):
+        result = {
+            'connections_accepted': int(self.value("http_connections_accepted_total")),
+            'requests': int(self.value("http_requests_total")),
+            'received_bytes': int(self.value("http_received_bytes_total")),
+            'sent_bytes': int(self.value("http_sent_bytes_total")),
+            'parse_errors': int(self.value("http_parse_errors_total")),
+        }
+        for stage, name in STAGES.items():
+            result[stage] = {
+                'count': int(self.value(f"{name}_count")),
+                'mean': self.mean(name),
+                'p50': self.quantile(name, 0.5),
+                'p99': self.quantile(name, 0.99),
+            }
+        return result
+
+
+def scrape_metrics(base_url):
+    response = httpx.get(base_url.rstrip("/") + "/metrics", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return MetricsSnapshot(parse_metrics(response.text))
+
+
+def print_server_metrics(delta):
+    summary = delta.summary()
+    print(f"\nServer-side metrics:")
+    print(f"  Connections accepted: {summary['connections_accepted']}")
+    print(f"  Requests: {summary['requests']}, parse errors: {summary['parse_errors']}")
+    print(f"  Bytes in/out: {summary['received_bytes']}/{summary['sent_bytes']}")
+    print(f"  {'Stage (us)':<12} {'Count':>8} {'Mean':>10} {'p50':>10} {'p99':>10}")
+    for stage in STAGES:
+        s = summary[stage]
+        print(f"  {stage:<12} {s['count']:>8} {s['mean'] * 1e6:>10.1f} "
+              f"{s['p50'] * 1e6:>10.1f} {s['p99'] * 1e6:>10.1f}")
+    return summary
@@ -1,74 +1,46 @@
-import httpx
 import pytest
 import asyncio
-import time
-from statistics import mean, median, stdev, quantiles
-from config import REQUEST_TIMEOUT, RUN_C10K_TESTS
+from bench_results import check_budget
+from config import REQUEST_TIMEOUT, RUN_C10K_TESTS, C10K_MAX_RSS_GROWTH
+from latency_histogram import LatencyHistogram
+from load_generator import run_load
+from resource_sampler import current_rss
+from server_metrics import scrape_metrics, print_server_metrics
 
 pytestmark = pytest.mark.asyncio
 
 
 @pytest.mark.skipif(not RUN_C10K_TESTS, reason="C10k tests disabled by default - very resource intensive")
 class TestC10kProblem:    
-    async def _stress_test(self, base_url, num_connections, payload_size, duration_info=True):        
-        payload = "X" * payload_size
-        
-        async def send_request(client, conn_id):
-            start = time.perf_counter()
-            try:
-                response = await client.post(
-                    base_url,
-                    content=f"Conn-{conn_id}-{payload}",
-                    timeout=REQUEST_TIMEOUT * 2
-                )
-                elapsed = time.perf_counter() - start
-                return {
-                    'id': conn_id,
-                    'success': response.status_code == 200,
-                    'status': response.status_code,
-                    'time': elapsed,
-                    'error': None
-                }
-            except Exception as e:
-                elapsed = time.perf_counter() - start
-                return {
-                    'id': conn_id,
-                    'success': False,
-                    'status': 0,
-                    'time': elapsed,
-                    'error': str(e)
-                }
-        
+    async def _stress_test(self, base_url, network, num_connections, payload_size, duration_info=True):        
         print(f"\n[C10K TEST] Starting {num_connections} concurrent connections")
-        print(f"[C10K TEST] Payload size: {payload_size} bytes")
-        
-        start_total = time.perf_counter()
-        
-        limits = httpx.Limits(
-            max_keepalive_connections=num_connections,
-            max_connections=num_connections,
-            keepalive_expiry=30
-        )
-        
-        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT * 2, limits=limits) as client:
-            tasks = [send_request(client, i) for i in range(num_connections)]
-            results = await asyncio.gather(*tasks)
-        
-        total_time = time.perf_counter() - start_total
-        
-        successful = [r for r in results if r['success']]
-        failed = [r for r in results if not r['success']]
-        timings = [r['time'] for r in successful]
-        
-        return {
-            'total': len(results),
-            'successful': len(successful),
-            'failed': len(failed),
-            'timings': timings,
-            'total_time': total_time,
-            'results': results,
-            'payload_size': payload_size
-        }
+        print(f"[C10K TEST] Payload size: {payload_size} bytes, network: {network.name}")
+        
+        # Load goes over the network profile; metrics are read from the
+        # server directly.
+        before = scrape_metrics(base_url)
+        stats = await run_load(network.url, num_connections, payload_size)
+        stats['server'] = scrape_metrics(base_url).diff(before)
+        print(f"[C10K TEST] Load generated by {stats['workers']} worker processes")
+        return stats
+    
+    def _check_budget(self, bench_results, network, scenario, stats, connections, **extra):
+        if 'server' in stats:
+            extra.setdefault('server', stats['server'].summary())
+        scenario = network.scenario(scenario)
+        record = bench_results.record(scenario, stats, connections, network=network.name, **extra)
+        violations = check_budget(record)
+        assert not violations, \
+            f"Performance budget exceeded for {scenario}: " + "; ".join(violations)
+    
+    def _print_percentiles(self, latency):
+        print(f"\nPercentiles:")
+        print(f"  50th (median): {latency.percentile(50):.4f}s")
+        print(f"  90th: {latency.percentile(90):.4f}s")
+        print(f"  95th: {latency.percentile(95):.4f}s")
+        print(f"  99th: {latency.percentile(99):.4f}s")
+        print(f"  99.9th: {latency.percentile(99.9):.4f}s")
+        print(f"  Max: {latency.max():.4f}s")
     
     def _print_statistics(self, stats, test_name):
         print("\n" + "="*70)
@@ -79,23 +51,17 @@ class TestC10kProblem:
         print(f"Failed: {stats['failed']} ({stats['failed']/stats['total']*100:.2f}%)")
         print(f"Total execution time: {stats['total_time']:.4f}s")
         
-        if stats['timings']:
-            timings = stats['timings']
+        latency = stats['latency']
+        if latency.count:
             print(f"\nResponse Time Statistics:")
-            print(f"  Average: {mean(timings):.4f}s")
-            print(f"  Median: {median(timings):.4f}s")
-            if len(timings) > 1:
-                print(f"  Std deviation: {stdev(timings):.4f}s")
-            print(f"  Min: {min(timings):.4f}s")
-            print(f"  Max: {max(timings):.4f}s")
+            print(f"  Average: {latency.mean():.4f}s")
+            print(f"  Median: {latency.percentile(50):.4f}s")
+            if latency.count > 1:
+                print(f"  Std deviation: {latency.stdev():.4f}s")
+            print(f"  Min: {latency.min():.4f}s")
+            print(f"  Max: {latency.max():.4f}s")
             
-            if len(timings) >= 4:
-                percentiles = quantiles(timings, n=100)
-                print(f"\nPercentiles:")
-                print(f"  50th (median): {percentiles[49]:.4f}s")
-                print(f"  90th: {percentiles[89]:.4f}s")
-                print(f"  95th: {percentiles[94]:.4f}s")
-                print(f"  99th: {percentiles[98]:.4f}s")
+            self._print_percentiles(latency)
             
             total_data = stats['total'] * stats['payload_size'] / 1024 / 1024  # MB
             throughput = total_data / stats['total_time']
@@ -104,60 +70,56 @@ class TestC10kProblem:
             print(f"  Throughput: {throughput:.2f} MB/s")
             print(f"  Requests per second: {stats['successful'] / stats['total_time']:.2f} req/s")
         
+        if 'server' in stats:
+            print_server_metrics(stats['server'])
+        
         if stats['failed'] > 0:
             print(f"\nErrors encountered:")
-            error_types = {}
-            for r in stats['results']:
-                if not r['success']:
-                    error = r['error'] or f"HTTP {r['status']}"
-                    error_types[error] = error_types.get(error, 0) + 1
-            
-            for error, count in sorted(error_types.items(), key=lambda x: x[1], reverse=True):
+            for error, count in sorted(stats['errors'].items(), key=lambda x: x[1], reverse=True):
                 print(f"  {error}: {count} times")
         
         print("="*70)
     
     @pytest.mark.asyncio
-    async def test_1k_connections(self, base_url, server):
-        stats = await self._stress_test(base_url, 1000, 100)
+    async def test_1k_connections(self, base_url, server, network, bench_results):
+        stats = await self._stress_test(base_url, network, 1000, 100)
         self._print_statistics(stats, "1K Connections")
         
-        assert stats['successful'] >= stats['total'] * 0.95, \
-            f"Too many failed requests: {stats['failed']}/{stats['total']}"
+        self._check_budget(bench_results, network, "c10k_1k", stats, 1000)
     
     @pytest.mark.asyncio
-    async def test_5k_connections(self, base_url, server):
-        stats = await self._stress_test(base_url, 5000, 100)
+    async def test_5k_connections(self, base_url, server, network, bench_results):
+        stats = await self._stress_test(base_url, network, 5000, 100)
         self._print_statistics(stats, "5K Connections")
         
-        assert stats['successful'] >= stats['total'] * 0.90, \
-            f"Too many failed requests: {stats['failed']}/{stats['total']}"
+        self._check_budget(bench_results, network, "c10k_5k", stats, 5000)
     
     @pytest.mark.asyncio
-    async def test_10k_connections_small_payload(self, base_url, server):
-        stats = await self._stress_test(base_url, 10000, 100)
+    async def test_10k_connections_small_payload(self, base_url, server, network, bench_results):
+        stats = await self._stress_test(base_url, network, 10000, 100)
         self._print_statistics(stats, "10K Connections (Small Payload)")
         
-        assert stats['successful'] >= stats['total'] * 0.85, \
-            f"Too many failed requests: {stats['failed']}/{stats['total']}"
+        self._check_budget(bench_results, network, "c10k_10k_small", stats, 10000)
     
     @pytest.mark.asyncio
-    async def test_10k_connections_medium_payload(self, base_url, server):
-        stats = await self._stress_test(base_url, 10000, 1024)
+    async def test_10k_connections_medium_payload(self, base_url, server, network, bench_results):
+        stats = await self._stress_test(base_url, network, 10000, 1024)
         self._print_statistics(stats, "10K Connections (Medium Payload)")
         
-        assert stats['successful'] >= stats['total'] * 0.85, \
-            f"Too many failed requests: {stats['failed']}/{stats['total']}"
+        self._check_budget(bench_results, network, "c10k_10k_medium", stats, 10000)
     
     @pytest.mark.asyncio
-    async def test_sustained_load(self, base_url, server):
+    async def test_sustained_load(self, base_url, server, network, bench_results):
         print("\n[C10K TEST] Sustained load test - 3 waves of 2000 connections each")
         
+        before = scrape_metrics(base_url)
         wave_stats = []
+        wave_rss = []
         for wave in range(3):
             print(f"\n[C10K TEST] Starting wave {wave + 1}/3...")
-            stats = await self._stress_test(base_url, 2000, 512)
+            stats = await self._stress_test(base_url, network, 2000, 512)
             wave_stats.append(stats)
+            wave_rss.append(current_rss(server.pid))
             
             if wave < 2:
                 await asyncio.sleep(1)
@@ -178,73 +140,75 @@ class TestC10kProblem:
         print(f"Cumulative time: {total_time:.4f}s")
         print(f"Average RPS: {total_successful/total_time:.2f} req/s")
         
+        combined = LatencyHistogram()
+        for stats in wave_stats:
+            combined.merge(stats['latency'])
+        self._print_percentiles(combined)
+        
         print(f"\nPer-wave breakdown:")
         for i, stats in enumerate(wave_stats, 1):
-            avg_time = mean(stats['timings']) if stats['timings'] else 0
+            avg_time = stats['latency'].mean()
             print(f"  Wave {i}: {stats['successful']}/{stats['total']} success, "
                   f"avg time: {avg_time:.4f}s, "
-                  f"RPS: {stats['successful']/stats['total_time']:.2f}")
-        
+                  f"RPS: {stats['successful']/stats['total_time']:.2f}, "
+                  f"server RSS after: {wave_rss[i - 1] / 1024 / 1024:.1f} MB")
+        
+        server_delta = scrape_metrics(base_url).diff(before)
+        print_server_metrics(server_delta)
+        print(f"\nBuffer pool: {server_delta.value('http_buffer_pool_hits_total'):.0f} hits, "
+              f"{server_delta.value('http_buffer_pool_misses_total'):.0f} misses, "
+              f"{server_delta.value('http_buffer_pool_discarded_total'):.0f} discarded")
         print("="*70)
         
-        assert total_successful >= total_requests * 0.90, \
-            f"Too many failed requests across all waves: {total_failed}/{total_requests}"
+        errors = {}
+        for stats in wave_stats:
+            for error, count in stats['errors'].items():
+                errors[error] = errors.get(error, 0) + count
+        summary = {
+            'total': total_requests,
+            'successful': total_successful,
+            'failed': total_failed,
+            'total_time': total_time,
+            'latency': combined,
+            'errors': errors,
+            'payload_size': 512,
+            'server': server_delta,
+        }
+        self._check_budget(bench_results, network, "c10k_sustained", summary, 2000, waves=[
+            {'successful': s['successful'], 'total': s['total'], 'total_time': s['total_time'],
+             'p99': s['latency'].percentile(99)}
+            for s in wave_stats
+        ], rss=wave_rss)
+        
+        # Every wave reuses the buffers the previous one returned to the
+        # pool, so memory must not keep climbing from wave to wave.
+        growth = max(wave_rss) - wave_rss[0]
+        assert growth <= C10K_MAX_RSS_GROWTH, \
+            f"Server RSS grew by {growth / 1024 / 1024:.1f} MB across waves: {wave_rss}"
     
     @pytest.mark.asyncio
-    async def test_connection_reuse(self, base_url, server):
+    async def test_connection_reuse(self, base_url, server, network, bench_results):
         print("\n[C10K TEST] Connection reuse test - multiple requests per connection")
         
         num_connections = 1000
         requests_per_connection = 5
-        payload = "Y" * 200
-        
-        async def multiple_requests(client, conn_id):
-            timings = []
-            for req_num in range(requests_per_connection):
-                start = time.perf_counter()
-                try:
-                    response = await client.post(
-                        base_url,
-                        content=f"Conn-{conn_id}-Req-{req_num}-{payload}",
-                        timeout=REQUEST_TIMEOUT
-                    )
-                    elapsed = time.perf_counter() - start
-                    timings.append({
-                        'success': response.status_code == 200,
-                        'time': elapsed
-                    })
-                except Exception as e:
-                    elapsed = time.perf_counter() - start
-                    timings.append({
-                        'success': False,
-                        'time': elapsed
-                    })
-            return timings
-        
-        start_total = time.perf_counter()
-        
-        limits = httpx.Limits(
-            max_keepalive_connections=num_connections,
-            max_connections=num_connections,
-            keepalive_expiry=30
+        before = scrape_metrics(base_url)
+        
+        stats = await run_load(
+            network.url,
+            num_connections,
+            200,
+            requests_per_connection=requests_per_connection,
+            body_prefix="Conn-{conn}-Req-{req}-",
+            timeout=REQUEST_TIMEOUT,
         )
         
-        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT * 2, limits=limits) as client:
-            tasks = [multiple_requests(client, i) for i in range(num_connections)]
-            results = await asyncio.gather(*tasks)
-        
-        total_time = time.perf_counter() - start_total
-        
-        all_timings = []
-        total_requests = 0
-        successful_requests = 0
-        
-        for conn_results in results:
-            for req_result in conn_results:
-                total_requests += 1
-                if req_result['success']:
-                    successful_requests += 1
-                    all_timings.append(req_result['time'])
+        server_delta = scrape_metrics(base_url).diff(before)
+        accepted = server_delta.summary()['connections_accepted']
+        total_requests = stats['total']
+        successful_requests = stats['successful']
+        total_time = stats['total_time']
+        latency = stats['latency']
         
         print("\n" + "="*70)
         print("CONNECTION REUSE TEST RESULTS")
@@ -252,18 +216,32 @@ class TestC10kProblem:
         print(f"Connections: {num_connections}")
         print(f"Requests per connection: {requests_per_connection}")
         print(f"Total requests: {total_requests}")
+        print(f"TCP connections opened: {stats['connections_opened']}")
+        print(f"Connections accepted by server: {accepted}")
         print(f"Successful: {successful_requests} ({successful_requests/total_requests*100:.2f}%)")
         print(f"Total time: {total_time:.4f}s")
         print(f"Requests per second: {successful_requests/total_time:.2f} req/s")
         
-        if all_timings:
+        if latency.count:
             print(f"\nResponse times:")
-            print(f"  Average: {mean(all_timings):.4f}s")
-            print(f"  Median: {median(all_timings):.4f}s")
-            print(f"  Min: {min(all_timings):.4f}s")
-            print(f"  Max: {max(all_timings):.4f}s")
+            print(f"  Average: {latency.mean():.4f}s")
+            print(f"  Median: {latency.percentile(50):.4f}s")
+            print(f"  Min: {latency.min():.4f}s")
+            print(f"  Max: {latency.max():.4f}s")
         
+        print_server_metrics(server_delta)
         print("="*70)
         
-        assert successful_requests >= total_requests * 0.95, \
-            f"Too many failed requests: {total_requests - successful_requests}/{total_requests}"
+        stats['server'] = server_delta
+        self._check_budget(bench_results, network, "c10k_connection_reuse", stats, num_connections,
+                           requests_per_connection=requests_per_connection,
+                           connections_opened=stats['connections_opened'],
+                           accepted=accepted)
+        
+        # Every client connection reaches the server as one connection; only
+        # the ones the network profile resets are opened again.
+        assert accepted == stats['connections_opened'], \
+            f"Server accepted {accepted} connections, clients opened {stats['connections_opened']}"
+        assert stats['connections_opened'] <= num_connections + network.resets, \
+            f"Connections were not reused: {stats['connections_opened']} opened for {num_connections} clients " \
+            f"({network.resets} reset by the network)"
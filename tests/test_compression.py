@@ -0,0 +1,143 @@
+import gzip
+import zlib
+import httpx
+import pytest
+from config import REQUEST_TIMEOUT
+from raw_http import open_connection
+from server_manager import ServerManager
+from server_metrics import scrape_metrics
+
+TEXT = "".join(f"line {i} of a very compressible text file\n" for i in range(2000))
+
+
+@pytest.fixture(scope="module")
+def compress_root(tmp_path_factory):
+    root = tmp_path_factory.mktemp("compress")
+    (root / "page.html").write_text(TEXT)
+    (root / "tiny.txt").write_text("too small to bother")
+    (root / "image.png").write_bytes(TEXT.encode())
+    (root / "big.txt").write_text(TEXT * 50)
+    return root
+
+
+@pytest.fixture(scope="module")
+def compress_server(compress_root):
+    with ServerManager(extra_args=["--static-dir", str(compress_root), "--cache-max-file", "262144"]) as sm:
+        yield sm
+
+
+def raw_get(server, path, accept="gzip", version="HTTP/1.1", method="GET"):
+    sock, stream = open_connection(server.port)
+    with sock, stream:
+        sock.sendall(f"{method} {path} {version}\r\nHost: localhost\r\nAccept-Encoding: {accept}\r\n"
+                     f"Connection: close\r\n\r\n".encode())
+        data = b""
+        while chunk := stream.read(65536):
+            data += chunk
+    head, _, body = data.partition(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return int(lines[0].split()[1]), headers, body
+
+
+def dechunk(body):
+    out = b""
+    while True:
+        size_line, _, body = body.partition(b"\r\n")
+        size = int(size_line, 16)
+        if size == 0:
+            return out
+        out += body[:size]
+        body = body[size + 2:]
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip", "gzip"),
+    ("deflate", "deflate"),
+    ("gzip;q=0.5, deflate", "deflate"),
+    ("gzip, deflate;q=0", "gzip"),
+    ("*", "gzip"),
+    ("gzip;q=0, *;q=0.1", "deflate"),
+    ("identity", None),
+    ("br", None),
+])
+def test_negotiation(compress_server, accept, expected):
+    status, headers, body = raw_get(compress_server, "/page.html", accept)
+    assert status == 200
+    assert headers.get("content-encoding") == expected
+    if expected == "gzip":
+        body = gzip.decompress(body)
+    elif expected == "deflate":
+        body = zlib.decompress(body)
+    assert body == TEXT.encode()
+
+
+def test_small_and_packed_files_are_not_compressed(compress_server):
+    for path in ("/tiny.txt", "/image.png"):
+        _, headers, _ = raw_get(compress_server, path)
+        assert "content-encoding" not in headers
+
+
+def test_static_variant_is_cached_with_own_etag(compress_server):
+    base_url = compress_server.get_base_url()
+    raw_get(compress_server, "/page.html", "deflate")
+    before = scrape_metrics(base_url)
+    status, headers, body = raw_get(compress_server, "/page.html", "deflate")
+    delta = scrape_metrics(base_url).diff(before)
+    assert headers["etag"].endswith('-deflate"')
+    assert headers["vary"] == "Accept-Encoding"
+    assert int(headers["content-length"]) == len(body) < len(TEXT) // 5
+    assert delta.value("http_static_cache_hits_total") == 1
+    assert delta.value("http_compression_input_bytes_total") == 0
+
+    sock, stream = open_connection(compress_server.port)
+    with sock, stream:
+        sock.sendall(f"GET /page.html HTTP/1.1\r\nHost: localhost\r\nAccept-Encoding: deflate\r\n"
+                     f"If-None-Match: {headers['etag']}\r\n\r\n".encode())
+        assert stream.readline().startswith(b"HTTP/1.1 304")
+
+
+@pytest.mark.parametrize("version", ["HTTP/1.1", "HTTP/1.0"])
+def test_large_file_is_compressed_while_streaming(compress_server, compress_root, version):
+    status, headers, body = raw_get(compress_server, "/big.txt", version=version)
+    assert status == 200
+    assert "content-length" not in headers
+    if version == "HTTP/1.1":
+        assert headers["transfer-encoding"] == "chunked"
+        body = dechunk(body)
+    else:
+        assert headers["connection"] == "close"
+    assert gzip.decompress(body) == (compress_root / "big.txt").read_bytes()
+
+
+def test_echo_compression_threshold(compress_server):
+    base_url = compress_server.get_base_url()
+    with httpx.Client(timeout=REQUEST_TIMEOUT) as client:
+        small = client.post(base_url, content="hi", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in small.headers
+        assert small.text == "Echo: hi"
+        large = client.post(base_url, content=TEXT, headers={"Accept-Encoding": "gzip"})
+        assert large.headers["content-encoding"] == "gzip"
+        assert large.num_bytes_downloaded < len(TEXT) // 5
+        assert large.text == "Echo: " + TEXT
+
+
+def test_chunked_echo_is_compressed(compress_server):
+    def body():
+        for _ in range(10):
+            yield TEXT.encode()
+    with httpx.Client(timeout=REQUEST_TIMEOUT) as client:
+        response = client.post(compress_server.get_base_url(), content=body(), headers={"Accept-Encoding": "deflate"})
+    assert response.headers["content-encoding"] == "deflate"
+    assert response.text == "Echo: " + TEXT * 10
+
+
+def test_compression_level_zero_disables(compress_root):
+    with ServerManager(extra_args=["--static-dir", str(compress_root), "--compression-level", "0"]) as sm:
+        _, headers, body = raw_get(sm, "/page.html")
+        assert "content-encoding" not in headers
+        assert "vary" not in headers
+        assert body == TEXT.encode()
@@ -0,0 +1,53 @@
+import time
+import httpx
+import pytest
+from bench_results import network_budget
+from config import REQUEST_TIMEOUT, NETWORK_PROFILES
+from fault_proxy import FaultProxy, Network
+from payload_corpus import post_payload
+
+
+def echo_through(server, profile, payload):
+    with FaultProxy(server.host, server.port, profile) as proxy:
+        with httpx.Client(timeout=REQUEST_TIMEOUT) as client:
+            start = time.perf_counter()
+            result = post_payload(client, proxy.get_base_url(), payload)
+            return result, time.perf_counter() - start, proxy.stats
+
+
+def test_latency_is_added_each_way(server, payload_corpus):
+    # The handshake is with the proxy itself, so only the request and its
+    # echo pay the latency: one round trip.
+    (status, echoed), elapsed, _ = echo_through(server, {"latency": 0.05}, payload_corpus.payload("Latency", 1024))
+    assert (status, echoed) == (200, True)
+    assert elapsed >= 2 * 0.05 * 0.9, f"Round trips took only {elapsed:.3f}s"
+
+
+def test_bandwidth_is_capped(server, payload_corpus):
+    payload = payload_corpus.payload("Bandwidth", 512 * 1024)
+    (status, echoed), elapsed, _ = echo_through(server, {"bandwidth": 1024 * 1024}, payload)
+    assert (status, echoed) == (200, True)
+    assert elapsed >= 0.5 * 0.9, f"512 KB went through a 1 MB/s link in {elapsed:.3f}s"
+
+
+def test_fragmented_segments_still_echo(server, payload_corpus):
+    (status, echoed), _, stats = echo_through(server, {"segment_size": 7}, payload_corpus.payload("Fragments", 64 * 1024))
+    assert (status, echoed) == (200, True)
+    assert stats['connections'] == 1
+
+
+def test_resets_reach_the_client(server, payload_corpus):
+    with pytest.raises(httpx.TransportError):
+        echo_through(server, {"reset_ratio": 1}, payload_corpus.payload("Reset", 64 * 1024))
+
+
+def test_scenario_names_carry_the_profile(server):
+    assert Network("direct", server.get_base_url()).scenario("c10k_1k") == "c10k_1k"
+    with FaultProxy(server.host, server.port, {"latency": 0.01}) as proxy:
+        assert Network("wan", proxy.get_base_url(), proxy).scenario("c10k_1k") == "c10k_1k@wan"
+
+
+def test_network_budget_allows_injected_resets():
+    budgets = {"c10k_1k": {"min_success_ratio": 0.99, "max_p99": 5.0}}
+    assert network_budget("c10k_1k@lossy", budgets) == {"min_success_ratio": 0.99 - NETWORK_PROFILES["lossy"]["reset_ratio"]}
+    assert network_budget("c10k_1k@wan", budgets) == {"min_success_ratio": 0.99}
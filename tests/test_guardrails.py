@@ -0,0 +1,214 @@
+import asyncio
+import socket
+import time
+import pytest
+from bench_results import check_budget
+from config import (
+    DEFAULT_HOST,
+    REQUEST_TIMEOUT,
+    GUARDRAIL_HEADER_TIMEOUT,
+    GUARDRAIL_IO_TIMEOUT,
+    GUARDRAIL_MAX_HEADER_SIZE,
+    GUARDRAIL_MAX_BODY_SIZE,
+    GUARDRAIL_MAX_CONNECTIONS,
+    GUARDRAIL_SLOW_CONNECTIONS,
+    GUARDRAIL_NORMAL_CONNECTIONS,
+)
+from load_generator import run_load
+from raw_http import make_request, read_response, open_connection
+from server_manager import ServerManager
+from server_metrics import scrape_metrics, print_server_metrics
+
+
+@pytest.fixture(scope="module")
+def guarded_server():
+    with ServerManager(extra_args=[
+        "--header-timeout", str(GUARDRAIL_HEADER_TIMEOUT),
+        "--io-timeout", str(GUARDRAIL_IO_TIMEOUT),
+        "--max-header-size", str(GUARDRAIL_MAX_HEADER_SIZE),
+        "--max-body-size", str(GUARDRAIL_MAX_BODY_SIZE),
+    ]) as sm:
+        yield sm
+
+
+def read_until_closed(stream):
+    data = b""
+    while chunk := stream.read(65536):
+        data += chunk
+    return data
+
+
+def test_oversized_header_gets_431(guarded_server):
+    sock, stream = open_connection(guarded_server.port)
+    with sock, stream:
+        filler = "X-Filler: " + "a" * GUARDRAIL_MAX_HEADER_SIZE + "\r\n"
+        sock.sendall(make_request("big header", headers=filler))
+        status, headers, _ = read_response(stream)
+        assert status == 431
+        assert headers["connection"] == "close"
+
+
+def test_oversized_content_length_gets_413(guarded_server):
+    sock, stream = open_connection(guarded_server.port)
+    with sock, stream:
+        sock.sendall(f"POST / HTTP/1.1\r\nHost: {DEFAULT_HOST}\r\n"
+                     f"Content-Length: {GUARDRAIL_MAX_BODY_SIZE + 1}\r\n\r\n".encode())
+        status, headers, _ = read_response(stream)
+        assert status == 413
+        assert read_until_closed(stream) == b""
+
+
+def test_unparsable_content_length_gets_400(guarded_server):
+    sock, stream = open_connection(guarded_server.port)
+    with sock, stream:
+        sock.sendall(f"POST / HTTP/1.1\r\nHost: {DEFAULT_HOST}\r\n"
+                     f"Content-Length: 99999999999999999999999999\r\n\r\n".encode())
+        status, _, _ = read_response(stream)
+        assert status == 400
+
+
+def test_chunked_body_over_limit_is_cut(guarded_server):
+    sock, stream = open_connection(guarded_server.port)
+    with sock, stream:
+        chunk = b"C" * (64 * 1024)
+        sock.sendall(f"POST / HTTP/1.1\r\nHost: {DEFAULT_HOST}\r\nTransfer-Encoding: chunked\r\n\r\n".encode())
+        try:
+            for _ in range(GUARDRAIL_MAX_BODY_SIZE // len(chunk) + 4):
+                sock.sendall(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            sock.sendall(b"0\r\n\r\n")
+        except OSError:
+            pass  # the server may hang up while we are still sending
+        try:
+            response = read_until_closed(stream)
+        except ConnectionResetError:
+            response = b""
+        assert not response.endswith(b"0\r\n\r\n"), "Body over --max-body-size was echoed in full"
+
+
+def test_slowloris_header_times_out(guarded_server):
+    sock, stream = open_connection(guarded_server.port)
+    with sock, stream:
+        sock.sendall(f"POST / HTTP/1.1\r\nHost: {DEFAULT_HOST}\r\n".encode())
+        start = time.perf_counter()
+        sock.settimeout(0.2)
+        response = b""
+        # Trickling header bytes must not extend the header deadline.
+        while time.perf_counter() - start < GUARDRAIL_HEADER_TIMEOUT + 2:
+            try:
+                sock.sendall(b"X")
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                response += chunk
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+        elapsed = time.perf_counter() - start
+        print(f"\n[TEST] Slow header closed after {elapsed:.2f}s: {response[:40]!r}")
+        assert response.startswith(b"HTTP/1.1 408")
+        assert elapsed < GUARDRAIL_HEADER_TIMEOUT + 1
+
+
+def test_stalled_body_times_out(guarded_server):
+    sock, stream = open_connection(guarded_server.port)
+    with sock, stream:
+        sock.sendall(f"POST / HTTP/1.1\r\nHost: {DEFAULT_HOST}\r\nContent-Length: 1000\r\n\r\npartial".encode())
+        start = time.perf_counter()
+        response = read_until_closed(stream)
+        elapsed = time.perf_counter() - start
+        print(f"\n[TEST] Stalled body closed after {elapsed:.2f}s")
+        assert response.endswith(b"Echo: partial")
+        assert GUARDRAIL_IO_TIMEOUT - 0.5 < elapsed < GUARDRAIL_IO_TIMEOUT + 1
+
+
+def test_max_connections_sheds_with_503():
+    with ServerManager(extra_args=["--max-connections", str(GUARDRAIL_MAX_CONNECTIONS)]) as sm:
+        # The readiness probe's connection may still be closing.
+        time.sleep(0.2)
+        held = [socket.create_connection((DEFAULT_HOST, sm.port), timeout=REQUEST_TIMEOUT)
+                for _ in range(GUARDRAIL_MAX_CONNECTIONS)]
+        try:
+            start = time.perf_counter()
+            sock, stream = open_connection(sm.port)
+            with sock, stream:
+                status, headers, body = read_response(stream)
+            elapsed = time.perf_counter() - start
+            print(f"\n[TEST] Connection over the limit answered in {elapsed * 1000:.2f}ms")
+            assert status == 503
+            assert headers["retry-after"] == "1"
+        finally:
+            for s in held:
+                s.close()
+
+        time.sleep(0.2)
+        sock, stream = open_connection(sm.port)
+        with sock, stream:
+            sock.sendall(make_request("again"))
+            status, _, body = read_response(stream)
+        assert status == 200 and body == "Echo: again"
+
+
+async def _slow_client(port, stop, counters):
+    # Keeps one trickling connection open, reconnecting whenever the server
+    # gives up on it.
+    while not stop.is_set():
+        try:
+            reader, writer = await asyncio.open_connection(DEFAULT_HOST, port)
+        except OSError:
+            await asyncio.sleep(0.1)
+            continue
+        writer.write(f"POST / HTTP/1.1\r\nHost: {DEFAULT_HOST}\r\n".encode())
+        try:
+            while not stop.is_set():
+                writer.write(b"X-Slow: 1\r\n")
+                await writer.drain()
+                try:
+                    if await asyncio.wait_for(reader.read(4096), 0.3) == b"":
+                        break
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    break
+        except OSError:
+            pass
+        counters['dropped'] += 1
+        writer.close()
+
+
+@pytest.mark.asyncio
+async def test_normal_traffic_p99_under_abuse(guarded_server, bench_results):
+    print(f"\n[GUARDRAILS] {GUARDRAIL_SLOW_CONNECTIONS} slowloris connections "
+          f"alongside {GUARDRAIL_NORMAL_CONNECTIONS} normal ones")
+    base_url = guarded_server.get_base_url()
+    stop = asyncio.Event()
+    counters = {'dropped': 0}
+    abusers = [asyncio.create_task(_slow_client(guarded_server.port, stop, counters))
+               for _ in range(GUARDRAIL_SLOW_CONNECTIONS)]
+    await asyncio.sleep(0.5)
+
+    before = scrape_metrics(base_url)
+    stats = await run_load(base_url, GUARDRAIL_NORMAL_CONNECTIONS, 100)
+    # Keep the pressure on long enough for the header deadline to fire.
+    await asyncio.sleep(max(0.0, GUARDRAIL_HEADER_TIMEOUT + 0.5 - stats['total_time']))
+    delta = scrape_metrics(base_url).diff(before)
+    stop.set()
+    await asyncio.gather(*abusers)
+
+    latency = stats['latency']
+    print("\n" + "="*70)
+    print("NORMAL TRAFFIC UNDER SLOWLORIS")
+    print("="*70)
+    print(f"Successful: {stats['successful']}/{stats['total']}")
+    print(f"Latency p50: {latency.percentile(50):.4f}s, p99: {latency.percentile(99):.4f}s")
+    print(f"Slow connections dropped by the server: {counters['dropped']}")
+    summary = print_server_metrics(delta)
+    print(f"  Timeouts: {int(delta.value('http_timeouts_total'))}")
+    print("="*70)
+
+    record = bench_results.record("guardrails_normal_under_abuse", stats, GUARDRAIL_NORMAL_CONNECTIONS,
+                                  slow_connections=GUARDRAIL_SLOW_CONNECTIONS, server=summary,
+                                  timeouts=int(delta.value("http_timeouts_total")))
+    violations = check_budget(record)
+    assert not violations, "Performance budget exceeded: " + "; ".join(violations)
+    assert delta.value("http_timeouts_total") > 0, "Slow connections were never timed out"
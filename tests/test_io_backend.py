@@ -0,0 +1,165 @@
+import subprocess
+import time
+from contextlib import contextmanager
+import httpx
+import pytest
+from config import (
+    SERVER_EXECUTABLE,
+    DEFAULT_HOST,
+    REQUEST_TIMEOUT,
+    RUN_BACKEND_BENCHMARKS,
+    BACKEND_BENCH_CONNECTIONS,
+    BACKEND_BENCH_REQUESTS,
+    BACKEND_BENCH_PAYLOAD_SIZE,
+    BACKEND_STRACE_REQUESTS,
+)
+from load_generator import run_load
+from payload_corpus import post_payload
+from raw_http import make_request, read_response, open_connection
+from resource_sampler import SyscallCounter, read_process
+from server_manager import ServerManager
+
+BACKENDS = ["epoll", "uring"]
+# A small stream buffer makes large bodies go through the paused-read path.
+STREAM_BUFFER = 4096
+
+
+def on_uring(sm):
+    return any("on io_uring" in line for line in sm.get_logs()["stdout"])
+
+
+@contextmanager
+def uring_server(*extra_args):
+    with ServerManager(io_backend="uring", extra_args=list(extra_args)) as sm:
+        if not on_uring(sm):
+            pytest.skip("Kernel has no usable io_uring, the server fell back to epoll")
+        yield sm
+
+
+@pytest.fixture(scope="module")
+def ring_server():
+    with uring_server("--stream-buffer", str(STREAM_BUFFER), "--max-header-size", "1024") as sm:
+        yield sm
+
+
+def test_unknown_backend_is_rejected():
+    result = subprocess.run([SERVER_EXECUTABLE, "0", "--io-backend", "kqueue"], capture_output=True,
+                            timeout=REQUEST_TIMEOUT)
+    assert result.returncode == 1
+    assert b"--io-backend epoll|uring" in result.stderr
+
+
+def test_keepalive_and_pipelining(ring_server):
+    sock, stream = open_connection(ring_server.port)
+    with sock, stream:
+        sock.sendall(make_request("First"))
+        status, headers, body = read_response(stream)
+        assert (status, headers["connection"], body) == (200, "keep-alive", "Echo: First")
+        sock.sendall(b"".join(make_request(f"Pipe-{i}") for i in range(20)))
+        for i in range(20):
+            status, _, body = read_response(stream)
+            assert (status, body) == (200, f"Echo: Pipe-{i}")
+
+
+def test_body_larger_than_stream_buffer(ring_server, payload_corpus):
+    with httpx.Client(timeout=REQUEST_TIMEOUT) as client:
+        for size in (STREAM_BUFFER - 1, 64 * 1024, 4 * 1024 * 1024):
+            status, echoed = post_payload(client, ring_server.get_base_url(), payload_corpus.payload("Ring", size))
+            assert (status, echoed) == (200, True), f"{size} byte body"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_connections(ring_server):
+    stats = await run_load(ring_server.get_base_url(), 500, 1024, requests_per_connection=5)
+    assert stats['successful'] == stats['total'], stats['errors']
+
+
+def test_connections_over_the_limit_are_shed():
+    with uring_server("--max-connections", "1") as sm:
+        # The readiness probe's connection may still be closing.
+        time.sleep(0.2)
+        held, held_stream = open_connection(sm.port)
+        with held, held_stream:
+            held.sendall(make_request("Held"))
+            assert read_response(held_stream)[0] == 200
+            sock, stream = open_connection(sm.port)
+            with sock, stream:
+                status, headers, _ = read_response(stream)
+                assert status == 503
+                assert headers["retry-after"] == "1"
+
+        time.sleep(0.2)
+        sock, stream = open_connection(sm.port)
+        with sock, stream:
+            sock.sendall(make_request("Again"))
+            assert read_response(stream)[0] == 200
+
+
+def test_stalled_head_times_out():
+    with uring_server("--header-timeout", "1") as sm:
+        sock, stream = open_connection(sm.port)
+        with sock, stream:
+            sock.sendall(f"POST / HTTP/1.1\r\nHost: {DEFAULT_HOST}\r\n".encode())
+            start = time.monotonic()
+            status, _, _ = read_response(stream)
+            assert status == 408
+            assert time.monotonic() - start < REQUEST_TIMEOUT
+
+
+@pytest.mark.skipif(not RUN_BACKEND_BENCHMARKS, reason="Backend benchmark disabled by default - restarts the server per backend")
+@pytest.mark.asyncio
+async def test_backend_comparison(bench_results):
+    print(f"\n[BACKENDS] {BACKEND_BENCH_CONNECTIONS} connections x {BACKEND_BENCH_REQUESTS} requests, "
+          f"{BACKEND_BENCH_PAYLOAD_SIZE} byte bodies")
+    if not SyscallCounter.available():
+        print("[BACKENDS] strace not installed, system calls are not counted")
+
+    rows = []
+    for backend in BACKENDS:
+        with ServerManager(io_backend=backend) as sm:
+            if backend == "uring" and not on_uring(sm):
+                print("[BACKENDS] io_uring unavailable, skipping it")
+                continue
+            url = sm.get_base_url()
+            before = read_process(sm.pid)
+            stats = await run_load(url, BACKEND_BENCH_CONNECTIONS, BACKEND_BENCH_PAYLOAD_SIZE,
+                                   requests_per_connection=BACKEND_BENCH_REQUESTS)
+            after = read_process(sm.pid)
+            per_request = max(stats['successful'], 1)
+            extra = {
+                'backend': backend,
+                'cpu_us_per_request': (after['cpu_seconds'] - before['cpu_seconds']) / per_request * 1e6,
+                'switches_per_request': (after['voluntary_switches'] + after['involuntary_switches'] -
+                                         before['voluntary_switches'] - before['involuntary_switches']) / per_request,
+            }
+
+            # Timings under ptrace are meaningless, so calls are counted in
+            # a separate, shorter run.
+            if SyscallCounter.available():
+                counter = SyscallCounter(sm.pid)
+                counter.start()
+                traced = await run_load(url, BACKEND_BENCH_CONNECTIONS, BACKEND_BENCH_PAYLOAD_SIZE,
+                                        requests_per_connection=BACKEND_STRACE_REQUESTS)
+                calls = counter.stop()
+                if calls:
+                    extra['syscalls_per_request'] = sum(calls.values()) / max(traced['successful'], 1)
+                    extra['syscalls'] = calls
+        bench_results.record(f"io_backend_{backend}", stats, BACKEND_BENCH_CONNECTIONS, **extra)
+        rows.append((backend, stats, extra))
+
+    print("\n" + "="*70)
+    print("I/O BACKEND RESULTS")
+    print("="*70)
+    print(f"{'Backend':>8} {'RPS':>12} {'p99':>9} {'CPU us/req':>11} {'Switch/req':>11} {'Syscall/req':>12}")
+    for backend, stats, extra in rows:
+        syscalls = extra.get('syscalls_per_request')
+        syscalls = "-" if syscalls is None else f"{syscalls:.2f}"
+        print(f"{backend:>8} {stats['successful'] / stats['total_time']:>12.2f} {stats['latency'].percentile(99):>9.4f} "
+              f"{extra['cpu_us_per_request']:>11.1f} {extra['switches_per_request']:>11.3f} {syscalls:>12}")
+        for name, count in sorted(extra.get('syscalls', {}).items(), key=lambda x: x[1], reverse=True)[:5]:
+            print(f"    {name}: {count}")
+    print("="*70)
+
+    for backend, stats, _ in rows:
+        assert stats['successful'] >= stats['total'] * 0.99, \
+            f"Too many failed requests on {backend}: {stats['failed']}/{stats['total']}"
@@ -0,0 +1,145 @@
+import time
+import pytest
+from config import (
+    DEFAULT_HOST,
+    KEEPALIVE_TEST_TIMEOUT,
+    KEEPALIVE_TEST_MAX_REQUESTS,
+)
+from raw_http import make_request, read_response, open_connection
+from server_manager import ServerManager
+
+
+def test_keepalive_reuses_connection(server):
+    sock, stream = open_connection(server.port)
+    with sock, stream:
+        for i in range(3):
+            sock.sendall(make_request(f"Keep-{i}"))
+            status, headers, body = read_response(stream)
+            print(f"[TEST] Request {i}: {status}, Connection: {headers.get('connection')}")
+            assert status == 200
+            assert headers["connection"] == "keep-alive"
+            assert body == f"Echo: Keep-{i}"
+
+
+def test_pipelined_requests_answered_in_order(server):
+    count = 20
+    sock, stream = open_connection(server.port)
+    with sock, stream:
+        sock.sendall(b"".join(make_request(f"Pipe-{i}") for i in range(count)))
+        for i in range(count):
+            status, _, body = read_response(stream)
+            assert status == 200
+            assert body == f"Echo: Pipe-{i}"
+
+
+def test_connection_close_header(server):
+    sock, stream = open_connection(server.port)
+    with sock, stream:
+        sock.sendall(make_request("Bye", headers="Connection: close\r\n"))
+        status, headers, body = read_response(stream)
+        assert status == 200
+        assert headers["connection"] == "close"
+        assert body == "Echo: Bye"
+        assert stream.read() == b"", "Server kept the connection open after Connection: close"
+
+
+def test_http10_closes_by_default(server):
+    sock, stream = open_connection(server.port)
+    with sock, stream:
+        sock.sendall(make_request("Old", version="HTTP/1.0"))
+        _, headers, body = read_response(stream)
+        assert headers["connection"] == "close"
+        assert body == "Echo: Old"
+        assert stream.read() == b""
+
+
+@pytest.fixture(scope="module")
+def limited_server():
+    with ServerManager(extra_args=[
+        "--keepalive-timeout", str(KEEPALIVE_TEST_TIMEOUT),
+        "--max-requests", str(KEEPALIVE_TEST_MAX_REQUESTS),
+    ]) as sm:
+        yield sm
+
+
+def test_max_requests_per_connection(limited_server):
+    sock, stream = open_connection(limited_server.port)
+    with sock, stream:
+        sock.sendall(b"".join(make_request(f"Cap-{i}") for i in range(KEEPALIVE_TEST_MAX_REQUESTS + 2)))
+        for i in range(KEEPALIVE_TEST_MAX_REQUESTS):
+            _, headers, body = read_response(stream)
+            assert body == f"Echo: Cap-{i}"
+        assert headers["connection"] == "close"
+        assert stream.read() == b"", "Server answered more requests than --max-requests allows"
+
+
+def test_idle_connection_times_out(limited_server):
+    sock, stream = open_connection(limited_server.port)
+    with sock, stream:
+        sock.sendall(make_request("Idle"))
+        read_response(stream)
+        start = time.perf_counter()
+        assert stream.read() == b"", "Idle connection was not closed"
+        elapsed = time.perf_counter() - start
+        print(f"[TEST] Idle connection closed after {elapsed:.2f}s")
+        assert elapsed < KEEPALIVE_TEST_TIMEOUT + 1.5
+
+
+def read_chunked_body(stream):
+    body = b""
+    while True:
+        size = int(stream.readline().split(b";")[0], 16)
+        if size == 0:
+            while stream.readline() not in (b"\r\n", b""):
+                pass
+            return body
+        body += stream.read(size)
+        assert stream.read(2) == b"\r\n"
+
+
+def make_chunked_request(chunks, version="HTTP/1.1"):
+    head = (
+        f"POST / {version}\r\n"
+        f"Host: {DEFAULT_HOST}\r\n"
+        f"Transfer-Encoding: chunked\r\n"
+        f"\r\n"
+    ).encode()
+    body = b"".join(f"{len(c):x}\r\n".encode() + c.encode() + b"\r\n" for c in chunks)
+    return head + body + b"0\r\n\r\n"
+
+
+def test_chunked_request_echoed_chunked(server):
+    sock, stream = open_connection(server.port)
+    with sock, stream:
+        for i in range(2):
+            sock.sendall(make_chunked_request([f"Part-{i}-a;", f"Part-{i}-b"]))
+            status_line = stream.readline()
+            headers = {}
+            while (line := stream.readline().rstrip(b"\r\n")):
+                name, _, value = line.partition(b":")
+                headers[name.strip().lower().decode()] = value.strip().decode()
+            assert int(status_line.split()[1]) == 200
+            assert headers["transfer-encoding"] == "chunked"
+            assert headers["connection"] == "keep-alive"
+            assert read_chunked_body(stream) == f"Echo: Part-{i}-a;Part-{i}-b".encode()
+
+
+def test_chunked_request_http10_closes(server):
+    sock, stream = open_connection(server.port)
+    with sock, stream:
+        sock.sendall(make_chunked_request(["Old", "-chunked"], version="HTTP/1.0"))
+        status_line = stream.readline()
+        while stream.readline().rstrip(b"\r\n"):
+            pass
+        assert int(status_line.split()[1]) == 200
+        assert stream.read() == b"Echo: Old-chunked"
+
+
+def test_malformed_chunk_size_rejected(server):
+    sock, stream = open_connection(server.port)
+    with sock, stream:
+        sock.sendall(make_chunked_request(["ok"]).replace(b"2\r\nok", b"zz\r\nok"))
+        status, headers, _ = read_response(stream)
+        assert status == 400
+        assert headers["connection"] == "close"
+        assert stream.read() == b""
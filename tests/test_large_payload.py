@@ -1,46 +1,84 @@
 import httpx
 import pytest
 import asyncio
+import hashlib
+import os
 import time
 from statistics import mean, median, stdev
-from config import REQUEST_TIMEOUT, RUN_LARGE_PAYLOAD_TESTS
+from bench_results import check_budget
+from config import (
+    DEFAULT_HOST,
+    REQUEST_TIMEOUT,
+    RUN_LARGE_PAYLOAD_TESTS,
+    STREAMING_PAYLOAD_SIZE,
+    STREAMING_CONCURRENCY,
+    STREAMING_MAX_RSS,
+    COMPRESSION_PAYLOAD_SIZE,
+    COMPRESSION_REQUESTS,
+    COMPRESSION_MIN_TEXT_RATIO,
+)
+from fault_proxy import active_profiles
+from latency_histogram import LatencyHistogram
+from payload_corpus import EchoDigest, Payload, post_payload, post_payload_async
+from resource_sampler import cpu_seconds, read_status
+from server_manager import ServerManager
+from server_metrics import scrape_metrics, print_server_metrics
+
+
+def record_benchmark(bench_results, scenario, timings, total_time, payload_size, connections, server_delta=None,
+                     **extra):
+    latency = LatencyHistogram()
+    for elapsed in timings:
+        latency.record(elapsed)
+    stats = {
+        'total': len(timings),
+        'successful': len(timings),
+        'failed': 0,
+        'total_time': total_time,
+        'latency': latency,
+        'errors': {},
+        'payload_size': payload_size,
+    }
+    if server_delta is not None:
+        extra['server'] = print_server_metrics(server_delta)
+    record = bench_results.record(scenario, stats, connections, **extra)
+    violations = check_budget(record)
+    assert not violations, \
+        f"Performance budget exceeded for {scenario}: " + "; ".join(violations)
 
 
 @pytest.mark.skipif(not RUN_LARGE_PAYLOAD_TESTS, reason="Large payload tests disabled by default")
+@pytest.mark.parametrize("network", active_profiles(with_resets=False), indirect=True)
 class TestLargePayloadConcurrent:    
-    def test_concurrent_large_payloads(self, base_url, server):
+    def test_concurrent_large_payloads(self, base_url, server, network, bench_results, payload_corpus):
         payload_size = 1024 * 1024  # 1 MB
         num_requests = 10
         
         print(f"\n[TEST] Sending {num_requests} concurrent large requests ({payload_size} bytes each!)")
         
-        payloads = [f"Data-{i}-" + "X" * (payload_size - len(f"Data-{i}-")) for i in range(num_requests)]
+        payloads = payload_corpus.payloads("Data", num_requests, payload_size)
         
         timings = []
         responses_data = []
         
         with httpx.Client(timeout=REQUEST_TIMEOUT * 3) as client:
+            before = scrape_metrics(base_url)
             start_total = time.perf_counter()
             
             for i, payload in enumerate(payloads):
                 start = time.perf_counter()
-                
-                response = client.post(
-                    base_url,
-                    content=payload,
-                )
-                
+                status, echoed = post_payload(client, network.url, payload)
                 elapsed = time.perf_counter() - start
                 timings.append(elapsed)
-                responses_data.append((i, response, elapsed))
+                responses_data.append((i, status, echoed))
                 
-                print(f"[TEST] Request {i}: {response.status_code}, {len(response.text)} bytes, {elapsed:.4f}s")
+                print(f"[TEST] Request {i}: {status}, {elapsed:.4f}s")
             
             total_time = time.perf_counter() - start_total
         
-        for i, response, elapsed in responses_data:
-            assert response.status_code == 200, f"Request {i} failed with status {response.status_code}"
-            assert response.text == f"Echo: {payloads[i]}", f"Request {i} returned wrong content"
+        for i, status, echoed in responses_data:
+            assert status == 200, f"Request {i} failed with status {status}"
+            assert echoed, f"Request {i} returned wrong content"
         
         # Статистика
         print("\n" + "="*60)
@@ -57,27 +95,28 @@ class TestLargePayloadConcurrent:
         print(f"Maximum time: {max(timings):.4f}s")
         print(f"Throughput: {(payload_size * num_requests / 1024 / 1024) / total_time:.2f} MB/s")
         print("="*60)
+        
+        record_benchmark(bench_results, network.scenario("large_payload_sequential"), timings, total_time,
+                         payload_size, 1, scrape_metrics(base_url).diff(before), network=network.name)
     
-    def test_concurrent_large_payloads_async(self, base_url, server):
-        asyncio.run(self._async_concurrent_test(base_url))
+    def test_concurrent_large_payloads_async(self, base_url, server, network, bench_results, payload_corpus):
+        asyncio.run(self._async_concurrent_test(base_url, network, bench_results, payload_corpus))
     
-    async def _async_concurrent_test(self, base_url):
+    async def _async_concurrent_test(self, base_url, network, bench_results, payload_corpus):
         payload_size = 512 * 1024  # 512 KB
         num_requests = 20
         
         print(f"\n[TEST] Asynchronous sending of {num_requests} concurrent requests ({payload_size} bytes each)")
         
-        payloads = [f"Async-{i}-" + "Y" * (payload_size - len(f"Async-{i}-")) for i in range(num_requests)]
+        payloads = payload_corpus.payloads("Async", num_requests, payload_size)
         
         async def send_request(client, i, payload):
             start = time.perf_counter()
-            response = await client.post(
-                base_url,
-                content=payload,
-            )
+            status, echoed = await post_payload_async(client, network.url, payload)
             elapsed = time.perf_counter() - start
-            return i, response, elapsed
+            return i, status, echoed, elapsed
         
+        before = scrape_metrics(base_url)
         start_total = time.perf_counter()
         
         async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT * 3) as client:
@@ -86,12 +125,12 @@ class TestLargePayloadConcurrent:
         
         total_time = time.perf_counter() - start_total
         
-        timings = [elapsed for _, _, elapsed in results]
+        timings = [elapsed for _, _, _, elapsed in results]
         
-        for i, response, elapsed in results:
-            print(f"[TEST] Async Request {i}: {response.status_code}, {len(response.text)} bytes, {elapsed:.4f}s")
-            assert response.status_code == 200, f"Async request {i} failed with status {response.status_code}"
-            assert response.text == f"Echo: {payloads[i]}", f"Async request {i} returned wrong content"
+        for i, status, echoed, elapsed in results:
+            print(f"[TEST] Async Request {i}: {status}, {elapsed:.4f}s")
+            assert status == 200, f"Async request {i} failed with status {status}"
+            assert echoed, f"Async request {i} returned wrong content"
         
         print("\n" + "="*60)
         print("Statistics for asynchronous execution")
@@ -108,26 +147,204 @@ class TestLargePayloadConcurrent:
         print(f"Throughput: {(payload_size * num_requests / 1024 / 1024) / total_time:.2f} MB/s")
         print(f"Actual concurrency: {num_requests / total_time:.2f} req/s")
         print("="*60)
+        
+        record_benchmark(bench_results, network.scenario("large_payload_async"), timings, total_time,
+                         payload_size, num_requests, scrape_metrics(base_url).diff(before), network=network.name)
     
     @pytest.mark.parametrize("payload_size_kb", [100, 500, 1000, 5000])
-    def test_various_payload_sizes(self, base_url, server, payload_size_kb):
+    def test_various_payload_sizes(self, base_url, server, network, bench_results, payload_corpus, payload_size_kb):
         """Test with various payload sizes"""
         payload_size = payload_size_kb * 1024
         num_requests = 5
         
         print(f"\n[TEST] Sending {num_requests} requests with {payload_size_kb} KB each")
         
-        payloads = ["Z" * payload_size for _ in range(num_requests)]
+        payloads = payload_corpus.payloads("Z", num_requests, payload_size)
         timings = []
         
         with httpx.Client(timeout=REQUEST_TIMEOUT * 3) as client:
+            before = scrape_metrics(base_url)
+            start_total = time.perf_counter()
             for i, payload in enumerate(payloads):
                 start = time.perf_counter()
-                response = client.post(base_url, content=payload)
+                status, echoed = post_payload(client, network.url, payload)
                 elapsed = time.perf_counter() - start
                 timings.append(elapsed)
                 
-                assert response.status_code == 200
+                assert status == 200
+                assert echoed, f"Request {i} returned wrong content"
                 print(f"[TEST] Request {i}: {elapsed:.4f}s")
         
+            total_time = time.perf_counter() - start_total
+        
         print(f"[STATS] {payload_size_kb} KB - Среднее время: {mean(timings):.4f}s")
+        record_benchmark(bench_results, network.scenario(f"large_payload_{payload_size_kb}kb"), timings, total_time,
+                         payload_size, 1, scrape_metrics(base_url).diff(before), network=network.name)
+
+
+def peak_rss(pid):
+    return read_status(pid, "VmHWM")["VmHWM"] * 1024
+
+
+async def stream_echo(port, payload_size, chunked, block_size=256 * 1024):
+    """Uploads payload_size bytes while reading the echo back, so neither
+    side ever holds the whole body. Returns (bytes echoed, digest matches)."""
+    reader, writer = await asyncio.open_connection(DEFAULT_HOST, port)
+    framing = "Transfer-Encoding: chunked" if chunked else f"Content-Length: {payload_size}"
+    writer.write(f"POST / HTTP/1.1\r\nHost: {DEFAULT_HOST}\r\n{framing}\r\n\r\n".encode())
+    block = bytes(range(256)) * (block_size // 256)
+
+    async def upload():
+        sent_digest = hashlib.sha256()
+        remaining = payload_size
+        while remaining > 0:
+            data = memoryview(block)[:min(block_size, remaining)]
+            if chunked:
+                writer.write(f"{len(data):x}\r\n".encode())
+            writer.write(data)
+            if chunked:
+                writer.write(b"\r\n")
+            sent_digest.update(data)
+            remaining -= len(data)
+            await writer.drain()
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        return sent_digest.hexdigest()
+
+    async def download():
+        headers = {}
+        status_line = await reader.readline()
+        while (line := (await reader.readline()).rstrip(b"\r\n")):
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower().decode()] = value.strip().decode()
+        assert status_line.split()[1] == b"200", status_line
+        received = hashlib.sha256()
+        total = 0
+        prefix = b""
+
+        def consume(data):
+            nonlocal total, prefix
+            if len(prefix) < 6:
+                take = 6 - len(prefix)
+                prefix += data[:take]
+                data = data[take:]
+            received.update(data)
+            total += len(data)
+
+        if chunked:
+            assert headers["transfer-encoding"] == "chunked"
+            while (size := int((await reader.readline()).split(b";")[0], 16)) > 0:
+                consume(await reader.readexactly(size))
+                await reader.readexactly(2)
+            await reader.readline()
+        else:
+            remaining = int(headers["content-length"])
+            while remaining > 0:
+                data = await reader.read(min(remaining, 1024 * 1024))
+                assert data, "Connection closed in the middle of the echo"
+                consume(data)
+                remaining -= len(data)
+        assert prefix == b"Echo: "
+        return total, received.hexdigest()
+
+    sent_digest, (total, received_digest) = await asyncio.gather(upload(), download())
+    writer.close()
+    await writer.wait_closed()
+    return total, sent_digest == received_digest
+
+
+@pytest.mark.skipif(not RUN_LARGE_PAYLOAD_TESTS, reason="Large payload tests disabled by default")
+class TestStreamingPayload:
+    @pytest.mark.parametrize("chunked", [False, True], ids=["content_length", "chunked"])
+    def test_streaming_memory_stays_bounded(self, chunked):
+        payload_mb = STREAMING_PAYLOAD_SIZE // 1024 // 1024
+        print(f"\n[TEST] Streaming {STREAMING_CONCURRENCY} x {payload_mb} MB bodies "
+              f"({'chunked' if chunked else 'content-length'})")
+
+        async def run():
+            return await asyncio.gather(*(stream_echo(sm.port, STREAMING_PAYLOAD_SIZE, chunked)
+                                          for _ in range(STREAMING_CONCURRENCY)))
+
+        with ServerManager() as sm:
+            start = time.perf_counter()
+            results = asyncio.run(run())
+            total_time = time.perf_counter() - start
+            rss = peak_rss(sm.pid)
+
+        moved = STREAMING_PAYLOAD_SIZE * STREAMING_CONCURRENCY / 1024 / 1024
+        print("\n" + "="*60)
+        print("STREAMING PAYLOAD RESULTS")
+        print("="*60)
+        print(f"Total time: {total_time:.4f}s")
+        print(f"Throughput: {moved / total_time:.2f} MB/s")
+        print(f"Server peak RSS: {rss / 1024 / 1024:.2f} MB (limit {STREAMING_MAX_RSS / 1024 / 1024:.0f} MB)")
+        print("="*60)
+
+        for total, digest_ok in results:
+            assert total == STREAMING_PAYLOAD_SIZE, f"Echoed {total} of {STREAMING_PAYLOAD_SIZE} bytes"
+            assert digest_ok, "Echoed body differs from the uploaded one"
+        assert rss < STREAMING_MAX_RSS, f"Server peak RSS {rss} bytes exceeds {STREAMING_MAX_RSS}"
+
+
+def compression_payload(kind, size):
+    if kind == "text":
+        line = b"ts=2026-01-01T12:00:00Z level=access method=POST path=/api/items status=200 bytes=%d\n"
+        data = b"".join(line % i for i in range(size // len(line) + 1))
+        return data[:size]
+    return os.urandom(size)
+
+
+@pytest.mark.skipif(not RUN_LARGE_PAYLOAD_TESTS, reason="Large payload tests disabled by default")
+class TestCompression:
+    @pytest.mark.parametrize("kind", ["text", "random"])
+    def test_wire_bytes_and_cpu(self, server, base_url, bench_results, kind):
+        """Echoes the same bodies with and without Accept-Encoding and reports
+        what went over the wire and what it cost the server in CPU."""
+        # One body, sent as a view each time and checked by digest as the
+        # decoded echo streams in.
+        payload = Payload(b"", memoryview(compression_payload(kind, COMPRESSION_PAYLOAD_SIZE)))
+        results = {}
+        with httpx.Client(timeout=REQUEST_TIMEOUT * 3) as client:
+            for encoding in ("identity", "gzip", "deflate"):
+                before = scrape_metrics(base_url)
+                cpu_before = cpu_seconds(server.pid)
+                timings = []
+                downloaded = 0
+                start_total = time.perf_counter()
+                for _ in range(COMPRESSION_REQUESTS):
+                    start = time.perf_counter()
+                    echo = EchoDigest()
+                    headers = {**payload.headers(), "Accept-Encoding": encoding}
+                    with client.stream("POST", base_url, content=payload.chunks(), headers=headers) as response:
+                        for chunk in response.iter_bytes():
+                            echo.update(chunk)
+                    timings.append(time.perf_counter() - start)
+                    assert response.status_code == 200
+                    assert response.headers.get("content-encoding", "identity") == encoding
+                    assert echo.matches(payload)
+                    downloaded += response.num_bytes_downloaded
+                total_time = time.perf_counter() - start_total
+                cpu = cpu_seconds(server.pid) - cpu_before
+                delta = scrape_metrics(base_url).diff(before)
+                results[encoding] = (downloaded, cpu, total_time)
+                record_benchmark(bench_results, f"compression_{kind}_{encoding}", timings, total_time,
+                                 COMPRESSION_PAYLOAD_SIZE, 1, delta, wire_bytes=downloaded,
+                                 server_cpu_seconds=cpu)
+
+        payload_mb = COMPRESSION_PAYLOAD_SIZE * COMPRESSION_REQUESTS / 1024 / 1024
+        print("\n" + "="*60)
+        print(f"COMPRESSION: {COMPRESSION_REQUESTS} x {COMPRESSION_PAYLOAD_SIZE // 1024} KB {kind} bodies")
+        print("="*60)
+        print(f"{'Encoding':<10} {'Wire MB':>10} {'Ratio':>8} {'Server CPU s':>13} {'CPU ms/MB':>10} {'Time s':>8}")
+        identity_bytes = results["identity"][0]
+        for encoding, (downloaded, cpu, total_time) in results.items():
+            print(f"{encoding:<10} {downloaded / 1024 / 1024:>10.2f} {identity_bytes / downloaded:>8.2f} "
+                  f"{cpu:>13.3f} {cpu * 1000 / payload_mb:>10.2f} {total_time:>8.3f}")
+        print("="*60)
+
+        if kind == "text":
+            for encoding in ("gzip", "deflate"):
+                ratio = identity_bytes / results[encoding][0]
+                assert ratio >= COMPRESSION_MIN_TEXT_RATIO, \
+                    f"{encoding} only shrank text {ratio:.1f}x (expected {COMPRESSION_MIN_TEXT_RATIO}x)"
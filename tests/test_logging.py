@@ -0,0 +1,55 @@
+import time
+import httpx
+from config import REQUEST_TIMEOUT
+from server_manager import ServerManager
+
+
+def wait_for_lines(sm, stream, predicate, count, timeout=2):
+    deadline = time.monotonic() + timeout
+    while True:
+        lines = [line for line in sm.get_logs()[stream] if predicate(line)]
+        if len(lines) >= count or time.monotonic() > deadline:
+            return lines
+        time.sleep(0.05)
+
+
+def parse_line(line):
+    return dict(field.split("=", 1) for field in line.split(" ") if "=" in field)
+
+
+def test_access_log_lines_are_structured():
+    with ServerManager(log_level="access", log_sample=1) as sm:
+        with httpx.Client(timeout=REQUEST_TIMEOUT) as client:
+            for i in range(3):
+                client.post(f"{sm.get_base_url()}/log?i={i}", content="x" * i)
+        lines = wait_for_lines(sm, "stdout", lambda line: "level=access" in line, 3)
+
+    print(f"\n[TEST] Access log: {lines}")
+    assert len(lines) == 3
+    for i, line in enumerate(lines):
+        fields = parse_line(line)
+        assert fields["method"] == "POST"
+        assert fields["path"] == f"/log?i={i}"
+        assert fields["status"] == "200"
+        assert int(fields["bytes"]) > 0
+        assert "duration_us" in fields and fields["ts"].endswith("Z")
+
+
+def test_access_log_sampling():
+    with ServerManager(log_level="access", log_sample=10) as sm:
+        with httpx.Client(timeout=REQUEST_TIMEOUT) as client:
+            for _ in range(50):
+                client.post(sm.get_base_url(), content="sampled")
+        wait_for_lines(sm, "stdout", lambda line: "level=access" in line, 5)
+        time.sleep(0.1)
+        lines = [line for line in sm.get_logs()["stdout"] if "level=access" in line]
+    assert len(lines) == 5
+
+
+def test_log_level_error_skips_access_lines():
+    with ServerManager(log_level="error") as sm:
+        response = httpx.post(sm.get_base_url(), content="quiet", timeout=REQUEST_TIMEOUT)
+        assert response.status_code == 200
+        time.sleep(0.1)
+        logs = sm.get_logs()
+    assert not [line for line in logs["stdout"] if "level=access" in line]
@@ -0,0 +1,29 @@
+import httpx
+from config import REQUEST_TIMEOUT
+from server_metrics import STAGES, parse_metrics, scrape_metrics
+
+
+def test_metrics_endpoint_format(base_url, server):
+    response = httpx.get(f"{base_url}/metrics", timeout=REQUEST_TIMEOUT)
+    print(f"\n[TEST] /metrics: {response.status_code}, {len(response.text)} bytes")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    samples = parse_metrics(response.text)
+    assert samples["http_connections_active"] >= 1
+    for name in STAGES.values():
+        assert samples[f'{name}_bucket{{le="+Inf"}}'] == samples[f"{name}_count"]
+
+
+def test_metrics_count_requests(base_url, server):
+    before = scrape_metrics(base_url)
+    with httpx.Client(timeout=REQUEST_TIMEOUT) as client:
+        for i in range(5):
+            assert client.post(base_url, content=f"Count-{i}").status_code == 200
+    delta = scrape_metrics(base_url).diff(before)
+    summary = delta.summary()
+    print(f"\n[TEST] Metrics delta: {summary}")
+    assert summary['requests'] == 5
+    assert summary['connections_accepted'] == 1
+    assert summary['parse']['count'] >= 5
+    assert summary['send']['count'] >= 5
+    assert delta.value("http_received_bytes_total") > 0
@@ -0,0 +1,79 @@
+import pytest
+from bench_results import check_budget
+from config import (
+    RUN_OPEN_LOOP_TESTS,
+    OPEN_LOOP_RATE,
+    OPEN_LOOP_DURATION,
+    OPEN_LOOP_SWEEP_RATES,
+    OPEN_LOOP_SWEEP_DURATION,
+    OPEN_LOOP_KNEE_FACTOR,
+)
+from load_generator import run_open_loop, sweep_rates
+from server_metrics import scrape_metrics, print_server_metrics
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.mark.skipif(not RUN_OPEN_LOOP_TESTS, reason="Open-loop tests disabled by default - long running")
+class TestOpenLoop:
+    def _print_rate_stats(self, stats):
+        print(f"  Target rate: {stats['target_rate']:.0f} req/s for {stats['duration']}s")
+        print(f"  Achieved rate: {stats['achieved_rate']:.2f} req/s")
+        print(f"  Successful: {stats['successful']}/{stats['total']}")
+        print(f"  Latency p50: {stats['p50']:.4f}s, p99: {stats['p99']:.4f}s")
+        print(f"  Max generator send lag: {stats['max_send_lag']:.4f}s")
+        for error, count in sorted(stats['errors'].items(), key=lambda x: x[1], reverse=True):
+            print(f"  {error}: {count} times")
+
+    @pytest.mark.asyncio
+    async def test_constant_arrival_rate(self, base_url, server, bench_results):
+        print(f"\n[OPEN LOOP] {OPEN_LOOP_RATE} req/s for {OPEN_LOOP_DURATION}s")
+        before = scrape_metrics(base_url)
+        stats = await run_open_loop(base_url, OPEN_LOOP_RATE, OPEN_LOOP_DURATION, 100)
+        server_delta = scrape_metrics(base_url).diff(before)
+
+        print("\n" + "="*70)
+        print("OPEN LOOP CONSTANT RATE RESULTS")
+        print("="*70)
+        self._print_rate_stats(stats)
+        server_summary = print_server_metrics(server_delta)
+        print("="*70)
+
+        record = bench_results.record("open_loop_constant_rate", stats, None,
+                                      server=server_summary,
+                                      target_rate=stats['target_rate'],
+                                      achieved_rate=stats['achieved_rate'],
+                                      max_send_lag=stats['max_send_lag'])
+        violations = check_budget(record)
+        assert not violations, "Performance budget exceeded: " + "; ".join(violations)
+
+    @pytest.mark.asyncio
+    async def test_rate_sweep(self, base_url, server, bench_results):
+        print(f"\n[OPEN LOOP] Sweeping rates {OPEN_LOOP_SWEEP_RATES}, {OPEN_LOOP_SWEEP_DURATION}s each")
+        sweep = await sweep_rates(base_url, OPEN_LOOP_SWEEP_RATES, OPEN_LOOP_SWEEP_DURATION, 100)
+
+        print("\n" + "="*70)
+        print("OPEN LOOP RATE SWEEP RESULTS")
+        print("="*70)
+        print(f"{'Target':>10} {'Achieved':>10} {'Success':>9} {'p50':>9} {'p99':>9}")
+        for stats in sweep['results']:
+            success = stats['successful'] / stats['total'] * 100 if stats['total'] else 0.0
+            print(f"{stats['target_rate']:>10.0f} {stats['achieved_rate']:>10.1f} "
+                  f"{success:>8.2f}% {stats['p50']:>9.4f} {stats['p99']:>9.4f}")
+        if sweep['knee_rate'] is not None:
+            print(f"\nLatency knee (p99 > {OPEN_LOOP_KNEE_FACTOR}x baseline or errors): "
+                  f"{sweep['knee_rate']} req/s")
+        else:
+            print("\nNo latency knee within the swept rates")
+        print(f"Sustainable capacity: {sweep['capacity']} req/s")
+        print("="*70)
+
+        for stats in sweep['results']:
+            bench_results.record(f"open_loop_sweep_{stats['target_rate']}", stats, None,
+                                 target_rate=stats['target_rate'],
+                                 achieved_rate=stats['achieved_rate'],
+                                 max_send_lag=stats['max_send_lag'],
+                                 knee_rate=sweep['knee_rate'],
+                                 capacity=sweep['capacity'])
+
+        assert sweep['results'], "Rate sweep produced no results"
@@ -0,0 +1,39 @@
+import httpx
+import pytest
+from config import REQUEST_TIMEOUT
+from payload_corpus import EchoDigest, ECHO_PREFIX, post_payload, post_payload_async
+
+
+def test_payloads_share_one_block(payload_corpus):
+    first, second = payload_corpus.payloads("Share", 2, 64 * 1024)
+    assert first.size == second.size == 64 * 1024
+    assert first.prefix != second.prefix
+    assert first.tail.obj is second.tail.obj is payload_corpus.block(64 * 1024).obj
+
+
+def test_echo_digest_catches_corruption(payload_corpus):
+    payload = payload_corpus.payload("Digest", 4096)
+    echo = ECHO_PREFIX + payload.prefix + bytes(payload.tail)
+
+    intact = EchoDigest()
+    for start in range(0, len(echo), 1000):
+        intact.update(echo[start:start + 1000])
+    assert intact.matches(payload)
+
+    for corrupted in (echo[:-1], echo + b"X", echo[:100] + echo[101:] + echo[100:101]):
+        digest = EchoDigest()
+        digest.update(corrupted)
+        assert not digest.matches(payload)
+
+
+def test_post_payload_checks_echo(base_url, payload_corpus):
+    with httpx.Client(timeout=REQUEST_TIMEOUT) as client:
+        for payload in payload_corpus.payloads("Sync", 3, 256 * 1024):
+            assert post_payload(client, base_url, payload) == (200, True)
+
+
+@pytest.mark.asyncio
+async def test_post_payload_async_checks_echo(base_url, payload_corpus):
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
+        for payload in payload_corpus.payloads("Async", 3, 256 * 1024):
+            assert await post_payload_async(client, base_url, payload) == (200, True)
@@ -0,0 +1,195 @@
+import asyncio
+import os
+import signal
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from bench_results import check_budget
+from config import (
+    SERVER_EXECUTABLE,
+    RUN_C10K_TESTS,
+    SHUTDOWN_TIMEOUT,
+    RELOAD_DRAIN_TIMEOUT,
+    RELOAD_CONNECTIONS,
+    RELOAD_PAYLOAD_SIZE,
+    RELOAD_INTERVAL,
+)
+from load_generator import run_load
+from raw_http import make_request, read_response, open_connection
+from server_manager import ServerManager
+
+
+@pytest.fixture
+def reloadable_server():
+    with ServerManager(port=0, workers=2, extra_args=["--drain-timeout", str(RELOAD_DRAIN_TIMEOUT)]) as sm:
+        yield sm
+
+
+def start_partial_request(port, body):
+    # Sends the head and the first half of the body; the server starts
+    # answering before the rest arrives.
+    sock, stream = open_connection(port)
+    head = make_request(body)
+    sock.sendall(head[:len(head) - len(body) // 2])
+    return sock, stream, head[len(head) - len(body) // 2:]
+
+
+def wait_for_exit(sm, pid, timeout=SHUTDOWN_TIMEOUT):
+    start = time.monotonic()
+    assert sm._wait_exit(pid, timeout), f"Server process {pid} still running after {timeout}s"
+    return time.monotonic() - start
+
+
+def test_sigterm_finishes_in_flight_request(reloadable_server):
+    sm = reloadable_server
+    pid = sm.pid
+    sock, stream, rest = start_partial_request(sm.port, "in-flight-body")
+    with sock, stream:
+        time.sleep(0.1)
+        os.kill(pid, signal.SIGTERM)
+        time.sleep(0.2)
+        assert sm.is_running(), "Server exited with a request still in flight"
+        sock.sendall(rest)
+        status, _, body = read_response(stream)
+        assert status == 200
+        assert body == "Echo: in-flight-body"
+        # The head went out before the drain began, so the server closes
+        # the connection once the response is complete instead.
+        assert stream.read() == b""
+    elapsed = wait_for_exit(sm, pid)
+    print(f"\n[TEST] Server exited {elapsed:.3f}s after the last response")
+    assert elapsed < 1
+    assert any("Server stopped" in line for line in sm.get_logs()["stdout"])
+
+
+def test_sigterm_closes_idle_keepalive_connections(reloadable_server):
+    sm = reloadable_server
+    pid = sm.pid
+    sock, stream = open_connection(sm.port)
+    with sock, stream:
+        sock.sendall(make_request("idle"))
+        status, headers, _ = read_response(stream)
+        assert status == 200
+        assert headers["connection"] == "keep-alive"
+        os.kill(pid, signal.SIGTERM)
+        assert stream.read() == b""
+    elapsed = wait_for_exit(sm, pid)
+    assert elapsed < 1
+
+
+def test_drain_deadline_closes_stalled_requests(reloadable_server):
+    sm = reloadable_server
+    pid = sm.pid
+    sock, stream, _ = start_partial_request(sm.port, "never-finished")
+    with sock, stream:
+        time.sleep(0.1)
+        start = time.monotonic()
+        os.kill(pid, signal.SIGTERM)
+        wait_for_exit(sm, pid)
+        elapsed = time.monotonic() - start
+    print(f"\n[TEST] Stalled request cut off after {elapsed:.3f}s")
+    assert RELOAD_DRAIN_TIMEOUT - 0.2 <= elapsed < RELOAD_DRAIN_TIMEOUT + 1
+    assert any("closed at the drain deadline" in line for line in sm.get_logs()["stdout"])
+
+
+@pytest.mark.parametrize("sig", [signal.SIGUSR2, signal.SIGHUP], ids=["SIGUSR2", "SIGHUP"])
+def test_reload_replaces_process_on_same_port(reloadable_server, sig):
+    sm = reloadable_server
+    old_pid, port = sm.pid, sm.port
+    new_pid = sm.reload(sig)
+    print(f"\n[TEST] Reloaded pid {old_pid} -> {new_pid} on port {sm.port}")
+    assert new_pid != old_pid
+    assert sm.port == port
+    sock, stream = open_connection(sm.port)
+    with sock, stream:
+        sock.sendall(make_request("after reload"))
+        status, _, body = read_response(stream)
+        assert status == 200
+        assert body == "Echo: after reload"
+    # The new process can be reloaded in turn.
+    assert sm.reload() not in (old_pid, new_pid)
+
+
+def test_reload_finishes_in_flight_request_on_old_process(reloadable_server):
+    sm = reloadable_server
+    old_pid = sm.pid
+    sock, stream, rest = start_partial_request(sm.port, "spans-the-reload")
+    with sock, stream, ThreadPoolExecutor(1) as pool:
+        reload = pool.submit(sm.reload)
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        while sm.pid == old_pid and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sm.pid != old_pid, "New server process never announced itself"
+        # The old process waits for this request before it exits.
+        assert not sm._has_exited(old_pid)
+        sock.sendall(rest)
+        status, _, body = read_response(stream)
+        assert status == 200
+        assert body == "Echo: spans-the-reload"
+        assert stream.read() == b""
+        reload.result(timeout=SHUTDOWN_TIMEOUT)
+
+
+def test_failed_reload_keeps_serving(tmp_path):
+    # A reload execs the path the server was started from; if that binary
+    # cannot start, the running process carries on.
+    binary = tmp_path / "server"
+    binary.write_bytes(Path(SERVER_EXECUTABLE).read_bytes())
+    binary.chmod(0o755)
+    with ServerManager(port=0, executable=str(binary)) as sm:
+        pid = sm.pid
+        # Replaced the way a deploy would, since a running binary cannot be
+        # written to.
+        binary.unlink()
+        binary.write_text("#!/bin/sh\nexit 1\n")
+        binary.chmod(0o755)
+        os.kill(pid, signal.SIGUSR2)
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        while not any("Reload failed" in line for line in sm.get_logs()["stderr"]):
+            assert time.monotonic() < deadline, "Failed reload was not reported"
+            time.sleep(0.01)
+        assert sm.is_running()
+        sock, stream = open_connection(sm.port)
+        with sock, stream:
+            sock.sendall(make_request("still here"))
+            assert read_response(stream)[2] == "Echo: still here"
+
+
+async def reload_during_load(sm):
+    print(f"\n[RELOAD TEST] {RELOAD_CONNECTIONS} connections, reloading every {RELOAD_INTERVAL}s")
+    load = asyncio.ensure_future(run_load(sm.get_base_url(), RELOAD_CONNECTIONS, RELOAD_PAYLOAD_SIZE))
+    pids = [sm.pid]
+    while not load.done():
+        await asyncio.sleep(RELOAD_INTERVAL)
+        if not load.done():
+            pids.append(await asyncio.to_thread(sm.reload))
+    return await load, pids
+
+
+@pytest.mark.skipif(not RUN_C10K_TESTS, reason="C10k tests disabled by default - very resource intensive")
+@pytest.mark.asyncio
+async def test_reload_under_c10k_load(bench_results):
+    # The default drain deadline: under this much load the generator may
+    # connect seconds before it writes, and the old process has to wait
+    # for those requests too.
+    with ServerManager(port=0, workers=2) as sm:
+        stats, pids = await reload_during_load(sm)
+
+    print("\n" + "="*70)
+    print("RELOAD UNDER LOAD")
+    print("="*70)
+    print(f"Reloads: {len(pids) - 1} ({' -> '.join(map(str, pids))})")
+    print(f"Successful: {stats['successful']}/{stats['total']}")
+    print(f"Failed: {stats['failed']}")
+    for error, count in sorted(stats['errors'].items(), key=lambda x: x[1], reverse=True):
+        print(f"  {error}: {count} times")
+    if stats['latency'].count:
+        print(f"p99 latency: {stats['latency'].percentile(99):.4f}s")
+    print("="*70)
+
+    record = bench_results.record("c10k_reload", stats, RELOAD_CONNECTIONS, reloads=len(pids) - 1)
+    assert len(pids) > 1, "Load finished before the first reload; raise RELOAD_CONNECTIONS"
+    assert stats['failed'] == 0, f"Requests failed across reloads: {stats['errors']}"
+    violations = check_budget(record)
+    assert not violations, "Performance budget exceeded for c10k_reload: " + "; ".join(violations)
@@ -0,0 +1,119 @@
+import socket
+import time
+import pytest
+from bench_results import BenchmarkResults
+from config import DEFAULT_HOST, REQUEST_TIMEOUT
+from load_generator import run_load
+from resource_sampler import ResourceSampler, PerfRecorder, summarize, read_process, parse_strace_summary
+from server_manager import ServerManager
+
+SAMPLE_INTERVAL = 0.05
+
+
+def sampled(server):
+    sampler = ResourceSampler(lambda: server.pid, interval=SAMPLE_INTERVAL)
+    sampler.start()
+    return sampler
+
+
+def wait_for_samples(sampler, count):
+    deadline = time.monotonic() + REQUEST_TIMEOUT
+    while len(sampler.samples) < count and time.monotonic() < deadline:
+        time.sleep(SAMPLE_INTERVAL)
+
+
+def test_read_process_counters(server):
+    counters = read_process(server.pid)
+    print(f"\n[TEST] Server counters: {counters}")
+    assert counters['cpu_seconds'] >= 0
+    assert counters['rss'] > 0
+    # At least stdin/stdout/stderr, the listener, epoll and the eventfd.
+    assert counters['fds'] >= 6
+    assert counters['voluntary_switches'] > 0
+    assert read_process(2 ** 22 + 1) is None
+
+
+def test_sampler_sees_open_connections(server):
+    sampler = sampled(server)
+    connections = []
+    try:
+        wait_for_samples(sampler, 2)
+        baseline = sampler.samples[-1]['fds']
+        for _ in range(200):
+            connections.append(socket.create_connection((DEFAULT_HOST, server.port), timeout=REQUEST_TIMEOUT))
+        count = len(sampler.samples)
+        wait_for_samples(sampler, count + 3)
+    finally:
+        for sock in connections:
+            sock.close()
+        sampler.stop()
+    summary = summarize(list(sampler.samples))
+    print(f"\n[TEST] fds: baseline {baseline}, peak {summary['fds']['peak']}")
+    assert summary['fds']['peak'] >= baseline + 200
+
+
+@pytest.mark.asyncio
+async def test_sampler_sees_load(server):
+    sampler = sampled(server)
+    try:
+        stats = await run_load(server.get_base_url(), 2000, 512, requests_per_connection=5)
+    finally:
+        sampler.stop()
+    assert stats['failed'] == 0
+    samples = sampler.window(stats['started'], stats['finished'])
+    summary = summarize(samples)
+    print(f"\n[TEST] {summary}")
+    assert summary['samples'] > 0
+    assert summary['cpu_percent']['peak'] > 0
+    assert summary['cpu_percent']['peak'] >= summary['cpu_percent']['mean']
+    assert summary['rss']['peak'] > 0
+    assert summary['voluntary_switches']['total'] > 0
+
+
+@pytest.mark.asyncio
+async def test_benchmark_record_carries_resources(server, tmp_path):
+    results = BenchmarkResults(str(tmp_path))
+    results.window_start = time.time()
+    stats = await run_load(server.get_base_url(), 2000, 512, requests_per_connection=5)
+    record = results.record("resource_sampling", stats, 2000)
+    resources = record['resources']
+    series = resources['series']
+    print(f"\n[TEST] {len(series['t'])} samples attached, summary {resources['summary']}")
+    assert resources['summary']['pids'] == [server.pid]
+    assert len(series['t']) == resources['summary']['samples']
+    for field in ('cpu_percent', 'rss', 'fds', 'voluntary_switches', 'involuntary_switches'):
+        assert len(series[field]) == len(series['t'])
+
+
+def test_sampler_follows_reload():
+    with ServerManager(port=0) as sm:
+        old_pid = sm.pid
+        wait_for_samples(sm.sampler, 2)
+        new_pid = sm.reload()
+        count = len(sm.sampler.samples)
+        wait_for_samples(sm.sampler, count + 2)
+        pids = summarize(list(sm.sampler.samples))['pids']
+    assert pids == sorted([old_pid, new_pid])
+
+
+@pytest.mark.skipif(not PerfRecorder.available(), reason="perf is not installed")
+def test_perf_record_writes_profile(server, tmp_path):
+    recorder = PerfRecorder(server.pid, str(tmp_path))
+    recorder.start()
+    time.sleep(1)
+    path = recorder.stop()
+    if path is None:
+        pytest.skip("perf could not attach (perf_event_paranoid or missing permissions)")
+    assert path.endswith(f"{server.pid}.perf.data")
+
+
+def test_strace_summary_is_parsed():
+    summary = """% time     seconds  usecs/call     calls    errors syscall
+------ ----------- ----------- --------- --------- ----------------
+ 61.53    0.004000           2      1500           writev
+ 38.47    0.002500           1      1600       100 recvfrom
+  0.00    0.000000           0        40           epoll_wait
+------ ----------- ----------- --------- --------- ----------------
+100.00    0.006500                  3140       100 total
+"""
+    assert parse_strace_summary(summary) == {'writev': 1500, 'recvfrom': 1600, 'epoll_wait': 40}
@@ -0,0 +1,108 @@
+import httpx
+import pytest
+from config import (
+    REQUEST_TIMEOUT,
+    RUN_ROUTER_BENCHMARKS,
+    ROUTER_BENCH_ROUTE_COUNTS,
+    ROUTER_BENCH_CONNECTIONS,
+    ROUTER_BENCH_REQUESTS,
+    ROUTER_MAX_DISPATCH_RATIO,
+    ROUTER_DISPATCH_SLACK,
+    PERFORMANCE_BUDGETS,
+)
+from bench_results import check_budget
+from load_generator import run_load
+from raw_http import open_connection, read_response
+from server_manager import ServerManager
+from server_metrics import scrape_metrics
+
+
+@pytest.fixture(scope="module")
+def routed_server():
+    with ServerManager(extra_args=["--synthetic-routes", "1000"]) as sm:
+        yield sm
+
+
+def send(server, head):
+    sock, stream = open_connection(server.port)
+    with sock, stream:
+        sock.sendall(head.encode())
+        return read_response(stream)
+
+
+def test_registered_routes_dispatch(routed_server):
+    base_url = routed_server.get_base_url()
+    for i in (0, 1, 10, 100, 999):
+        response = httpx.get(f"{base_url}/synthetic/{i}?q=1", timeout=REQUEST_TIMEOUT)
+        assert response.status_code == 200
+        assert response.text == "OK"
+
+
+def test_echo_is_a_route(routed_server):
+    base_url = routed_server.get_base_url()
+    assert httpx.post(f"{base_url}/synthetic/1", content="a", timeout=REQUEST_TIMEOUT).text == "Echo: a"
+    assert httpx.put(f"{base_url}/any/path", content="b", timeout=REQUEST_TIMEOUT).text == "Echo: b"
+
+
+@pytest.mark.parametrize("path", ["/synthetic/1000", "/synthetic/", "/synthetic/10/", "/"])
+def test_unrouted_method_gets_405(routed_server, path):
+    status, headers, body = send(routed_server, f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    assert status == 405
+    assert headers["allow"] == "POST, PUT"
+    assert headers["connection"] == "keep-alive"
+
+
+def test_405_lists_every_method_for_path(routed_server):
+    status, headers, _ = send(routed_server, "DELETE /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    assert status == 405
+    assert sorted(headers["allow"].split(", ")) == ["GET", "POST", "PUT"]
+
+
+def test_405_discards_request_body(routed_server):
+    sock, stream = open_connection(routed_server.port)
+    with sock, stream:
+        sock.sendall(b"DELETE /x HTTP/1.1\r\nHost: localhost\r\nContent-Length: 5\r\n\r\nhello"
+                     b"POST /x HTTP/1.1\r\nHost: localhost\r\nContent-Length: 2\r\n\r\nok")
+        assert read_response(stream)[0] == 405
+        assert read_response(stream)[2] == "Echo: ok"
+
+
+def test_path_outside_every_route_gets_404(routed_server):
+    status, _, _ = send(routed_server, "OPTIONS * HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    assert status == 404
+
+
+@pytest.mark.skipif(not RUN_ROUTER_BENCHMARKS, reason="Router benchmarks disabled by default")
+@pytest.mark.asyncio
+async def test_dispatch_cost_independent_of_route_count(bench_results):
+    results = {}
+    for count in ROUTER_BENCH_ROUTE_COUNTS:
+        with ServerManager(extra_args=["--synthetic-routes", str(count)], log_level="off") as sm:
+            base_url = sm.get_base_url()
+            path = f"/synthetic/{count - 1}"
+            before = scrape_metrics(base_url)
+            stats = await run_load(f"{base_url}{path}", ROUTER_BENCH_CONNECTIONS, 0,
+                                   requests_per_connection=ROUTER_BENCH_REQUESTS, body_prefix="", method="GET")
+            delta = scrape_metrics(base_url).diff(before)
+        dispatch = delta.mean("http_route_seconds")
+        results[count] = (stats, dispatch)
+        # One scenario per table size, so the regression gate compares each.
+        scenario = f"router_dispatch_{count}"
+        record = bench_results.record(scenario, stats, ROUTER_BENCH_CONNECTIONS, routes=count,
+                                      path=path, dispatch_mean=dispatch, server=delta.summary())
+        violations = check_budget(record, {scenario: PERFORMANCE_BUDGETS["router_dispatch"]})
+        assert not violations, f"Performance budget exceeded for {count} routes: " + "; ".join(violations)
+
+    print("\n" + "="*70)
+    print("ROUTER DISPATCH COST")
+    print("="*70)
+    print(f"  {'Routes':>8} {'Dispatch (ns)':>14} {'req/s':>10} {'p99 (ms)':>10}")
+    for count, (stats, dispatch) in results.items():
+        print(f"  {count:>8} {dispatch * 1e9:>14.0f} {stats['successful'] / stats['total_time']:>10.0f} "
+              f"{stats['latency'].percentile(99) * 1000:>10.2f}")
+    print("="*70)
+
+    fewest = results[min(results)][1]
+    most = results[max(results)][1]
+    assert most <= fewest * ROUTER_MAX_DISPATCH_RATIO + ROUTER_DISPATCH_SLACK, \
+        f"Dispatch with {max(results)} routes took {most * 1e9:.0f}ns vs {fewest * 1e9:.0f}ns with {min(results)}"
@@ -0,0 +1,37 @@
+import pytest
+from config import RUN_SCALING_TESTS, SCALING_CONNECTIONS, SCALING_WORKER_COUNTS
+from load_generator import run_load
+from server_manager import ServerManager
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.mark.skipif(not RUN_SCALING_TESTS, reason="Scaling tests disabled by default - restart the server per worker count")
+class TestWorkerScaling:
+    @pytest.mark.asyncio
+    async def test_rps_scaling_with_workers(self, bench_results):
+        print(f"\n[SCALING] Worker counts: {SCALING_WORKER_COUNTS}, {SCALING_CONNECTIONS} connections each")
+
+        rows = []
+        for workers in SCALING_WORKER_COUNTS:
+            with ServerManager(workers=workers) as sm:
+                stats = await run_load(sm.get_base_url(), SCALING_CONNECTIONS, 100)
+            rps = stats['successful'] / stats['total_time']
+            rows.append((workers, rps, stats))
+            bench_results.record(f"scaling_{workers}_workers", stats, SCALING_CONNECTIONS, workers=workers)
+
+        base_rps = rows[0][1]
+        print("\n" + "="*70)
+        print("WORKER SCALING RESULTS")
+        print("="*70)
+        print(f"{'Workers':>8} {'RPS':>12} {'Speedup':>9} {'Efficiency':>11} {'p99':>9} {'Success':>9}")
+        for workers, rps, stats in rows:
+            speedup = rps / base_rps if base_rps else 0.0
+            success = stats['successful'] / stats['total'] * 100
+            print(f"{workers:>8} {rps:>12.2f} {speedup:>8.2f}x {speedup / workers * 100:>10.1f}% "
+                  f"{stats['latency'].percentile(99):>9.4f} {success:>8.2f}%")
+        print("="*70)
+
+        for workers, _, stats in rows:
+            assert stats['successful'] >= stats['total'] * 0.99, \
+                f"Too many failed requests with {workers} workers: {stats['failed']}/{stats['total']}"
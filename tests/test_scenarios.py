@@ -0,0 +1,95 @@
+import pytest
+from bench_results import check_budget
+from config import RUN_SCENARIO_TESTS, LOAD_SCENARIOS
+from load_generator import run_scenario, validate_scenario
+from server_metrics import scrape_metrics, print_server_metrics
+
+SMALL_SCENARIO = {
+    "payload_sizes": {64: 0.5, 4096: 0.5},
+    "phases": [
+        {"name": "ramp", "kind": "ramp", "start_rate": 50, "end_rate": 200, "duration": 1},
+        {"name": "plateau", "kind": "plateau", "connections": 10, "duration": 1,
+         "spikes": {"every": 0.4, "connections": 20}},
+        {"name": "spike", "kind": "spike", "connections": 50, "requests": 2, "keepalive_ratio": 0},
+    ],
+}
+
+
+def print_phases(phases):
+    print(f"{'Phase':<20} {'Requests':>9} {'Failed':>7} {'Opened':>7} {'Time s':>8} "
+          f"{'Req/s':>9} {'p50':>8} {'p99':>8}")
+    for name, stats in phases:
+        latency = stats['latency']
+        print(f"{name:<20} {stats['total']:>9} {stats['failed']:>7} {stats['connections_opened']:>7} "
+              f"{stats['total_time']:>8.2f} {stats['achieved_rate']:>9.1f} "
+              f"{latency.percentile(50):>8.4f} {latency.percentile(99):>8.4f}")
+        for error, count in sorted(stats['errors'].items(), key=lambda x: x[1], reverse=True):
+            print(f"    {error}: {count} times")
+
+
+@pytest.mark.asyncio
+async def test_phases_are_reported_separately(base_url, server):
+    phases = dict(await run_scenario(base_url, SMALL_SCENARIO, workers=2))
+    print_phases(phases.items())
+
+    assert list(phases) == ["ramp", "plateau", "plateau:spike", "spike"]
+    for name, stats in phases.items():
+        assert stats['total'] > 0 and stats['failed'] == 0, f"{name}: {stats['errors']}"
+    # 50 -> 200 req/s over a second is 125 arrivals.
+    assert abs(phases["ramp"]['total'] - 125) <= 2
+    assert 0.9 < phases["plateau"]['total_time'] < 2
+    # Two bursts of 20, at 0.4s and 0.8s.
+    assert phases["plateau:spike"]['total'] == 40
+    # Without keep-alive every request opens its own connection.
+    assert phases["spike"]['total'] == phases["spike"]['connections_opened'] == 100
+
+
+@pytest.mark.parametrize("scenario", [
+    {"phases": []},
+    {"phases": [{"name": "x", "kind": "wave", "duration": 1}]},
+    {"phases": [{"name": "x", "kind": "plateau", "duration": 1}]},
+    {"phases": [{"name": "x", "kind": "spike", "connections": 1}, {"name": "x", "kind": "spike", "connections": 1}]},
+    {"phases": [{"name": "x", "kind": "spike", "connections": 1, "keepalive_ratio": 2}]},
+    {"phases": [{"name": "x", "kind": "spike", "connections": 1, "spikes": {"every": 1, "connections": 1}}]},
+])
+def test_invalid_scenarios_are_rejected(scenario):
+    with pytest.raises(ValueError):
+        validate_scenario(scenario)
+
+
+def test_configured_scenarios_are_valid():
+    for scenario in LOAD_SCENARIOS.values():
+        validate_scenario(scenario)
+
+
+@pytest.mark.skipif(not RUN_SCENARIO_TESTS, reason="Scenario runs disabled by default - long running")
+@pytest.mark.parametrize("name", list(LOAD_SCENARIOS))
+@pytest.mark.asyncio
+async def test_scenario(base_url, server, bench_results, name):
+    scenario = LOAD_SCENARIOS[name]
+    budgets = {phase['name']: phase.get('budget') for phase in scenario['phases']}
+    print(f"\n[SCENARIO] {name}: {', '.join(budgets)}")
+
+    before = scrape_metrics(base_url)
+    phases = await run_scenario(base_url, scenario)
+    server_delta = scrape_metrics(base_url).diff(before)
+
+    print("\n" + "="*70)
+    print(f"SCENARIO RESULTS: {name}")
+    print("="*70)
+    print_phases(phases)
+    server_summary = print_server_metrics(server_delta)
+    print("="*70)
+
+    violations = []
+    for phase_name, stats in phases:
+        scenario_name = f"scenario_{name}_{phase_name}"
+        record = bench_results.record(scenario_name, stats, None,
+                                      phase=phase_name,
+                                      achieved_rate=stats['achieved_rate'],
+                                      connections_opened=stats['connections_opened'],
+                                      server=server_summary)
+        budget = budgets.get(phase_name)
+        if budget:
+            violations += [f"{phase_name}: {v}" for v in check_budget(record, {scenario_name: budget})]
+    assert not violations, f"Performance budget exceeded for {name}: " + "; ".join(violations)
@@ -0,0 +1,38 @@
+import time
+import httpx
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from config import REQUEST_TIMEOUT, STARTUP_TIMEOUT
+from server_manager import ServerManager
+
+
+def test_ephemeral_port_reported():
+    start = time.perf_counter()
+    with ServerManager(port=0) as sm:
+        elapsed = time.perf_counter() - start
+        print(f"\n[TEST] Server ready on port {sm.port} after {elapsed:.3f}s")
+        assert sm.port != 0
+        assert elapsed < STARTUP_TIMEOUT
+        response = httpx.post(sm.get_base_url(), content="Ready", timeout=REQUEST_TIMEOUT)
+        assert response.text == "Echo: Ready"
+
+
+def test_parallel_instances():
+    managers = [ServerManager(port=0, workers=2) for _ in range(4)]
+    with ThreadPoolExecutor(len(managers)) as pool:
+        list(pool.map(lambda sm: sm.start(), managers))
+    try:
+        ports = {sm.port for sm in managers}
+        assert len(ports) == len(managers)
+        for sm in managers:
+            response = httpx.post(sm.get_base_url(), content=str(sm.port), timeout=REQUEST_TIMEOUT)
+            assert response.text == f"Echo: {sm.port}"
+    finally:
+        for sm in managers:
+            sm.stop()
+
+
+def test_startup_failure_is_reported():
+    sm = ServerManager(port=0, extra_args=["--workers", "0"])
+    with pytest.raises(RuntimeError, match="exited with code"):
+        sm.start()
@@ -0,0 +1,186 @@
+import hashlib
+import os
+import time
+import httpx
+import pytest
+from bench_results import check_budget
+from config import (
+    REQUEST_TIMEOUT,
+    RUN_STATIC_BENCHMARKS,
+    STATIC_SMALL_FILES,
+    STATIC_SMALL_FILE_SIZE,
+    STATIC_LARGE_FILE_SIZE,
+    STATIC_BENCH_CONNECTIONS,
+    STATIC_BENCH_REQUESTS,
+    STATIC_LARGE_BENCH_CONNECTIONS,
+    STATIC_LARGE_BENCH_REQUESTS,
+)
+from load_generator import run_load
+from raw_http import open_connection
+from server_manager import ServerManager
+from server_metrics import scrape_metrics, print_server_metrics
+
+
+@pytest.fixture(scope="module")
+def static_root(tmp_path_factory):
+    root = tmp_path_factory.mktemp("static")
+    for i in range(STATIC_SMALL_FILES):
+        (root / f"small-{i}.bin").write_bytes(os.urandom(STATIC_SMALL_FILE_SIZE))
+    (root / "large.bin").write_bytes(os.urandom(STATIC_LARGE_FILE_SIZE))
+    (root / "index.html").write_text("<h1>index</h1>\n")
+    (root / "style.css").write_text("body { margin: 0 }\n")
+    return root
+
+
+@pytest.fixture(scope="module")
+def static_server(static_root):
+    with ServerManager(extra_args=["--static-dir", str(static_root)]) as sm:
+        yield sm
+
+
+@pytest.fixture(scope="module")
+def uncached_server(static_root):
+    with ServerManager(extra_args=["--static-dir", str(static_root), "--cache-size", "0"]) as sm:
+        yield sm
+
+
+def get(server, path, **kwargs):
+    return httpx.get(f"{server.get_base_url()}{path}", timeout=REQUEST_TIMEOUT, **kwargs)
+
+
+def test_serves_file_with_etag(static_server, static_root):
+    response = get(static_server, "/small-0.bin")
+    assert response.status_code == 200
+    assert response.content == (static_root / "small-0.bin").read_bytes()
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["etag"].startswith('"')
+
+
+def test_content_type_and_index(static_server):
+    assert get(static_server, "/style.css").headers["content-type"] == "text/css"
+    response = get(static_server, "/")
+    assert response.headers["content-type"].startswith("text/html")
+    assert response.text == "<h1>index</h1>\n"
+
+
+def test_second_request_hits_cache(static_server):
+    get(static_server, "/small-1.bin")
+    before = scrape_metrics(static_server.get_base_url())
+    for _ in range(5):
+        assert get(static_server, "/small-1.bin").status_code == 200
+    delta = scrape_metrics(static_server.get_base_url()).diff(before)
+    assert delta.value("http_static_cache_hits_total") == 5
+    assert delta.value("http_static_cache_misses_total") == 0
+
+
+def test_if_none_match_gets_304(static_server):
+    etag = get(static_server, "/small-2.bin").headers["etag"]
+    response = get(static_server, "/small-2.bin", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+    stale = get(static_server, "/small-2.bin", headers={"If-None-Match": '"0-0"'})
+    assert stale.status_code == 200
+
+
+def test_modified_file_is_revalidated(static_server, static_root):
+    path = static_root / "changing.txt"
+    path.write_text("first")
+    first = get(static_server, "/changing.txt")
+    assert first.text == "first"
+    path.write_text("second version")
+    # Cached entries are re-checked against the file at most once a second.
+    time.sleep(1.2)
+    second = get(static_server, "/changing.txt")
+    assert second.text == "second version"
+    assert second.headers["etag"] != first.headers["etag"]
+
+
+def test_large_file_is_sent_intact(static_server, static_root):
+    expected = hashlib.sha256((static_root / "large.bin").read_bytes()).hexdigest()
+    before = scrape_metrics(static_server.get_base_url())
+    with httpx.stream("GET", f"{static_server.get_base_url()}/large.bin", timeout=REQUEST_TIMEOUT) as response:
+        assert response.status_code == 200
+        assert int(response.headers["content-length"]) == STATIC_LARGE_FILE_SIZE
+        digest = hashlib.sha256()
+        for chunk in response.iter_bytes():
+            digest.update(chunk)
+    assert digest.hexdigest() == expected
+    delta = scrape_metrics(static_server.get_base_url()).diff(before)
+    assert delta.value("http_static_cache_misses_total") == 1
+
+
+def test_head_sends_headers_only(static_server):
+    sock, stream = open_connection(static_server.port)
+    with sock, stream:
+        for path in ("/small-3.bin", "/large.bin", "/small-3.bin"):
+            sock.sendall(f"HEAD {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            assert stream.readline().startswith(b"HTTP/1.1 200")
+            headers = {}
+            while line := stream.readline().rstrip(b"\r\n"):
+                name, _, value = line.partition(b":")
+                headers[name.strip().lower()] = value.strip()
+            assert headers[b"connection"] == b"keep-alive"
+        sock.sendall(b"GET /style.css HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        assert stream.readline().startswith(b"HTTP/1.1 200")
+
+
+@pytest.mark.parametrize("path", ["/missing.bin", "/../etc/passwd", "/a/./b", "/small-0.bin/"])
+def test_missing_or_unsafe_path_gets_404(static_server, path):
+    sock, stream = open_connection(static_server.port)
+    with sock, stream:
+        sock.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        assert stream.readline().startswith(b"HTTP/1.1 404")
+
+
+def test_post_still_echoes(static_server):
+    response = httpx.post(static_server.get_base_url(), content="hello", timeout=REQUEST_TIMEOUT)
+    assert response.text == "Echo: hello"
+
+
+def test_metrics_route_wins_over_files(static_server):
+    assert "http_static_cache_hits_total" in get(static_server, "/metrics").text
+
+
+@pytest.mark.skipif(not RUN_STATIC_BENCHMARKS, reason="Static file benchmarks disabled by default")
+@pytest.mark.asyncio
+class TestStaticThroughput:
+    async def _benchmark(self, bench_results, scenario, server, path, size, connections, requests):
+        base_url = server.get_base_url()
+        before = scrape_metrics(base_url)
+        stats = await run_load(f"{base_url}{path}", connections, 0, requests_per_connection=requests,
+                               body_prefix="", method="GET")
+        delta = scrape_metrics(base_url).diff(before)
+        rps = stats['successful'] / stats['total_time']
+        mb_per_second = stats['successful'] * size / stats['total_time'] / 1024 / 1024
+
+        print("\n" + "="*70)
+        print(f"STATIC BENCHMARK: {scenario}")
+        print("="*70)
+        print(f"Requests: {stats['total']} ({stats['failed']} failed) over {connections} connections")
+        print(f"Requests per second: {rps:.2f} req/s")
+        print(f"Throughput: {mb_per_second:.2f} MB/s")
+        print(f"Cache hits: {delta.value('http_static_cache_hits_total'):.0f}, "
+              f"misses: {delta.value('http_static_cache_misses_total'):.0f}")
+        if stats['latency'].count:
+            print(f"p50 {stats['latency'].percentile(50):.4f}s, p99 {stats['latency'].percentile(99):.4f}s")
+        print_server_metrics(delta)
+        print("="*70)
+
+        record = bench_results.record(scenario, stats, connections, file_size=size,
+                                      mb_per_second=mb_per_second, server=delta.summary())
+        violations = check_budget(record)
+        assert not violations, f"Performance budget exceeded for {scenario}: " + "; ".join(violations)
+        return rps
+
+    async def test_hot_cache(self, static_server, bench_results):
+        await self._benchmark(bench_results, "static_hot_cache", static_server, "/small-0.bin",
+                              STATIC_SMALL_FILE_SIZE, STATIC_BENCH_CONNECTIONS, STATIC_BENCH_REQUESTS)
+
+    async def test_cold_cache(self, uncached_server, bench_results):
+        await self._benchmark(bench_results, "static_cold_cache", uncached_server, "/small-0.bin",
+                              STATIC_SMALL_FILE_SIZE, STATIC_BENCH_CONNECTIONS, STATIC_BENCH_REQUESTS)
+
+    async def test_large_file_sendfile(self, static_server, bench_results):
+        await self._benchmark(bench_results, "static_large_file", static_server, "/large.bin",
+                              STATIC_LARGE_FILE_SIZE, STATIC_LARGE_BENCH_CONNECTIONS, STATIC_LARGE_BENCH_REQUESTS)
@@ -0,0 +1,116 @@
+#pragma once
+
+#include <chrono>
+#include <cstddef>
+#include <cstdint>
+#include <vector>
+
+// Hashed timer wheel for per-connection deadlines. Scheduling, rescheduling
+// and cancelling are O(1) list operations, so every connection can move its
+// deadline on each event without touching a heap. Deadlines are rounded up
+// to the wheel resolution; ones further away than a full turn stay in their
+// slot until the wheel comes round to the right turn.
+
+struct Timer {
+    Timer* prev = nullptr;
+    Timer* next = nullptr;
+    uint64_t tick = 0;
+    bool active = false;
+    void* data = nullptr;
+};
+
+class TimerWheel {
+public:
+    using Clock = std::chrono::steady_clock;
+
+    TimerWheel(std::chrono::milliseconds resolution, size_t slots)
+        : resolution_(resolution), origin_(Clock::now()), slots_(slots) {
+        for (Timer& head : slots_) {
+            head.prev = head.next = &head;
+        }
+    }
+
+    // Slot heads point at themselves, so the wheel must stay in place.
+    TimerWheel(const TimerWheel&) = delete;
+    TimerWheel& operator=(const TimerWheel&) = delete;
+
+    void schedule(Timer& timer, Clock::time_point deadline) {
+        uint64_t tick = tickAt(deadline, true);
+        if (tick <= current_) tick = current_ + 1;
+        if (timer.active) {
+            if (timer.tick == tick) return;
+            unlink(timer);
+        }
+        timer.tick = tick;
+        Timer& head = slots_[tick % slots_.size()];
+        timer.prev = head.prev;
+        timer.next = &head;
+        head.prev->next = &timer;
+        head.prev = &timer;
+        timer.active = true;
+        ++size_;
+    }
+
+    void cancel(Timer& timer) {
+        if (timer.active) unlink(timer);
+    }
+
+    // Calls onExpired(timer) for every timer whose deadline has passed. The
+    // timer is already removed from the wheel when the callback runs.
+    template <typename Callback>
+    void expire(Clock::time_point now, Callback&& onExpired) {
+        uint64_t target = tickAt(now, false);
+        if (target <= current_) return;
+        // One full turn visits every slot, so larger jumps can be cut short.
+        uint64_t first = target - current_ > slots_.size() ? target - slots_.size() + 1 : current_ + 1;
+        for (uint64_t tick = first; tick <= target; ++tick) {
+            Timer& head = slots_[tick % slots_.size()];
+            for (Timer* timer = head.next; timer != &head;) {
+                Timer* next = timer->next;
+                if (timer->tick <= target) {
+                    unlink(*timer);
+                    onExpired(*timer);
+                }
+                timer = next;
+            }
+        }
+        current_ = target;
+    }
+
+    // Milliseconds until the next tick, for epoll_wait; -1 when no timer is
+    // scheduled.
+    int nextTimeout(Clock::time_point now) const {
+        if (size_ == 0) return -1;
+        auto next = origin_ + resolution_ * (current_ + 1);
+        auto wait = std::chrono::duration_cast<std::chrono::milliseconds>(next - now).count();
+        return wait > 0 ? (int)wait + 1 : 0;
+    }
+
+    size_t size() const {
+        return size_;
+    }
+
+private:
+    std::chrono::milliseconds resolution_;
+    Clock::time_point origin_;
+    std::vector<Timer> slots_;
+    uint64_t current_ = 0;
+    size_t size_ = 0;
+
+    uint64_t tickAt(Clock::time_point when, bool roundUp) const {
+        if (when <= origin_) return 0;
+        auto elapsed = std::chrono::duration_cast<std::chrono::nanoseconds>(when - origin_);
+        auto step = std::chrono::duration_cast<std::chrono::nanoseconds>(resolution_);
+        uint64_t tick = (uint64_t)(elapsed.count() / step.count());
+        if (roundUp && elapsed.count() % step.count() != 0) ++tick;
+        return tick;
+    }
+
+    void unlink(Timer& timer) {
+        timer.prev->next = timer.next;
+        timer.next->prev = timer.prev;
+        timer.prev = timer.next = nullptr;
+        timer.active = false;
+        --size_;
+    }
+};
@@ -0,0 +1,253 @@
+#pragma once
+
+#include <linux/io_uring.h>
+#include <sys/mman.h>
+#include <sys/syscall.h>
+#include <unistd.h>
+#include <algorithm>
+#include <cerrno>
+#include <csignal>
+#include <cstdint>
+#include <cstring>
+#include <initializer_list>
+#include <string>
+#include <utility>
+#include <vector>
+
+// Just enough io_uring for the --io-backend uring event loop, on the raw
+// system calls so the server does not need liburing.
+//
+// Submissions are queued in the shared ring and handed to the kernel in one
+// io_uring_enter() per loop iteration, which also waits for completions.
+// Receives pick one of the worker's provided buffers only when data
+// arrives, so a connection waiting for input holds no memory of its own.
+//
+// A ring belongs to one worker thread; nothing here is locked.
+
+class IoRing {
+public:
+    IoRing() = default;
+    IoRing(const IoRing&) = delete;
+    IoRing& operator=(const IoRing&) = delete;
+
+    ~IoRing() {
+        if (sqes_ != nullptr) munmap(sqes_, sqeBytes_);
+        if (ring_ != nullptr) munmap(ring_, ringBytes_);
+        if (fd_ >= 0) close(fd_);
+    }
+
+    // Sets up a ring with `entries` submission slots and four times as many
+    // completion slots. Returns false, with error() saying why, when the
+    // kernel cannot provide one or lacks the features and `opcodes` the
+    // caller relies on.
+    bool init(unsigned entries, std::initializer_list<uint8_t> opcodes) {
+        io_uring_params params;
+        std::memset(&params, 0, sizeof(params));
+        params.flags = IORING_SETUP_CQSIZE;
+        params.cq_entries = entries * 4;
+        fd_ = (int)syscall(__NR_io_uring_setup, entries, &params);
+        if (fd_ < 0) return fail("io_uring_setup", errno);
+        const unsigned needed = IORING_FEAT_SINGLE_MMAP | IORING_FEAT_NODROP | IORING_FEAT_EXT_ARG |
+                                IORING_FEAT_FAST_POLL;
+        if ((params.features & needed) != needed) {
+            error_ = "kernel lacks single mmap, no-drop, extended wait or fast poll support";
+            return false;
+        }
+
+        ringBytes_ = std::max(params.sq_off.array + params.sq_entries * sizeof(unsigned),
+                              params.cq_off.cqes + params.cq_entries * sizeof(io_uring_cqe));
+        void* ring = mmap(nullptr, ringBytes_, PROT_READ | PROT_WRITE, MAP_SHARED | MAP_POPULATE, fd_,
+                          IORING_OFF_SQ_RING);
+        if (ring == MAP_FAILED) return fail("mmap", errno);
+        ring_ = static_cast<char*>(ring);
+        sqeBytes_ = params.sq_entries * sizeof(io_uring_sqe);
+        void* sqes = mmap(nullptr, sqeBytes_, PROT_READ | PROT_WRITE, MAP_SHARED | MAP_POPULATE, fd_,
+                          IORING_OFF_SQES);
+        if (sqes == MAP_FAILED) return fail("mmap", errno);
+        sqes_ = static_cast<io_uring_sqe*>(sqes);
+
+        sqHead_ = reinterpret_cast<unsigned*>(ring_ + params.sq_off.head);
+        sqTail_ = reinterpret_cast<unsigned*>(ring_ + params.sq_off.tail);
+        sqMask_ = *reinterpret_cast<unsigned*>(ring_ + params.sq_off.ring_mask);
+        sqEntries_ = params.sq_entries;
+        cqHead_ = reinterpret_cast<unsigned*>(ring_ + params.cq_off.head);
+        cqTail_ = reinterpret_cast<unsigned*>(ring_ + params.cq_off.tail);
+        cqMask_ = *reinterpret_cast<unsigned*>(ring_ + params.cq_off.ring_mask);
+        cqes_ = reinterpret_cast<io_uring_cqe*>(ring_ + params.cq_off.cqes);
+        // Slot i of the submission array always names entry i.
+        unsigned* array = reinterpret_cast<unsigned*>(ring_ + params.sq_off.array);
+        for (unsigned i = 0; i < sqEntries_; ++i) array[i] = i;
+        sqLocalTail_ = *sqTail_;
+
+        std::vector<char> probeBuffer(sizeof(io_uring_probe) + 256 * sizeof(io_uring_probe_op));
+        io_uring_probe* probe = reinterpret_cast<io_uring_probe*>(probeBuffer.data());
+        if (syscall(__NR_io_uring_register, fd_, IORING_REGISTER_PROBE, probe, 256) < 0) {
+            return fail("io_uring_register(PROBE)", errno);
+        }
+        for (uint8_t opcode : opcodes) {
+            if (opcode > probe->last_op || !(probe->ops[opcode].flags & IO_URING_OP_SUPPORTED)) {
+                error_ = "kernel lacks io_uring opcode " + std::to_string(opcode);
+                return false;
+            }
+        }
+        return true;
+    }
+
+    const std::string& error() const {
+        return error_;
+    }
+
+    // A zeroed submission entry, or nullptr if the queue is full and the
+    // kernel would not take the queued entries.
+    io_uring_sqe* next() {
+        io_uring_sqe* sqe = take();
+        if (sqe == nullptr) {
+            submitAndWait(0);
+            sqe = take();
+        }
+        return sqe;
+    }
+
+    // Makes room for `count` more entries without a submission in between,
+    // so a linked chain reaches the kernel whole.
+    bool reserve(unsigned count) {
+        if (sqEntries_ - (sqLocalTail_ - __atomic_load_n(sqHead_, __ATOMIC_ACQUIRE)) < count) submitAndWait(0);
+        return sqEntries_ - (sqLocalTail_ - __atomic_load_n(sqHead_, __ATOMIC_ACQUIRE)) >= count;
+    }
+
+    // Hands every queued entry to the kernel and, unless completions are
+    // already waiting, sleeps until one arrives or timeoutMs passes (forever
+    // if negative; 0 only submits). Returns false on a real error.
+    bool submitAndWait(int timeoutMs) {
+        returnBuffers();
+        __atomic_store_n(sqTail_, sqLocalTail_, __ATOMIC_RELEASE);
+        unsigned queued = sqLocalTail_ - __atomic_load_n(sqHead_, __ATOMIC_ACQUIRE);
+        bool wait = timeoutMs != 0 && *cqHead_ == __atomic_load_n(cqTail_, __ATOMIC_ACQUIRE);
+        __kernel_timespec timeout;
+        io_uring_getevents_arg arg;
+        std::memset(&arg, 0, sizeof(arg));
+        arg.sigmask_sz = _NSIG / 8;
+        if (timeoutMs > 0) {
+            timeout.tv_sec = timeoutMs / 1000;
+            timeout.tv_nsec = (long long)(timeoutMs % 1000) * 1'000'000;
+            arg.ts = reinterpret_cast<uint64_t>(&timeout);
+        }
+        if (queued == 0 && !wait) return true;
+        int result = (int)syscall(__NR_io_uring_enter, fd_, queued, wait ? 1 : 0,
+                                  IORING_ENTER_GETEVENTS | IORING_ENTER_EXT_ARG, &arg, sizeof(arg));
+        return result >= 0 || errno == ETIME || errno == EINTR || errno == EAGAIN || errno == EBUSY;
+    }
+
+    // Calls fn(user_data, res, flags) for each completion posted so far,
+    // including ones posted while fn runs.
+    template <typename Fn>
+    void forEachCompletion(Fn fn) {
+        unsigned head = *cqHead_;
+        while (head != __atomic_load_n(cqTail_, __ATOMIC_ACQUIRE)) {
+            io_uring_cqe cqe = cqes_[head & cqMask_];
+            __atomic_store_n(cqHead_, ++head, __ATOMIC_RELEASE);
+            fn(cqe.user_data, cqe.res, cqe.flags);
+        }
+    }
+
+    // Hands `count` buffers of `size` bytes to the kernel as provided-buffer
+    // group `group`, for receives with IOSQE_BUFFER_SELECT.
+    bool provideBuffers(uint16_t group, unsigned count, unsigned size) {
+        buffers_.assign((size_t)count * size, 0);
+        bufferSize_ = size;
+        bufferGroup_ = group;
+        io_uring_sqe* sqe = next();
+        if (sqe == nullptr) {
+            error_ = "submission queue full";
+            return false;
+        }
+        sqe->opcode = IORING_OP_PROVIDE_BUFFERS;
+        sqe->fd = (int)count;
+        sqe->addr = reinterpret_cast<uint64_t>(buffers_.data());
+        sqe->len = size;
+        sqe->buf_group = group;
+        if (!submitAndWait(-1)) return fail("io_uring_enter", errno);
+        int result = -EAGAIN;
+        forEachCompletion([&](uint64_t, int res, uint32_t) { result = res; });
+        if (result < 0) return fail("IORING_OP_PROVIDE_BUFFERS", -result);
+        return true;
+    }
+
+    unsigned bufferSize() const {
+        return bufferSize_;
+    }
+
+    const char* buffer(uint16_t id) const {
+        return buffers_.data() + (size_t)id * bufferSize_;
+    }
+
+    // Gives a provided buffer back once its data is consumed. The buffer
+    // goes back with the next submission, tagged `userData`; if the queue is
+    // full it waits for the first submission that finds room, so the group
+    // never loses it.
+    void recycle(uint16_t id, uint64_t userData) {
+        io_uring_sqe* sqe = next();
+        if (sqe == nullptr) {
+            unreturned_.push_back({id, userData});
+            return;
+        }
+        provideBuffer(sqe, id, userData);
+    }
+
+private:
+    int fd_ = -1;
+    std::string error_;
+    char* ring_ = nullptr;
+    size_t ringBytes_ = 0;
+    io_uring_sqe* sqes_ = nullptr;
+    size_t sqeBytes_ = 0;
+    unsigned* sqHead_ = nullptr;
+    unsigned* sqTail_ = nullptr;
+    unsigned sqMask_ = 0;
+    unsigned sqEntries_ = 0;
+    unsigned sqLocalTail_ = 0;
+    unsigned* cqHead_ = nullptr;
+    unsigned* cqTail_ = nullptr;
+    unsigned cqMask_ = 0;
+    io_uring_cqe* cqes_ = nullptr;
+    std::vector<char> buffers_;
+    unsigned bufferSize_ = 0;
+    uint16_t bufferGroup_ = 0;
+    std::vector<std::pair<uint16_t, uint64_t>> unreturned_;
+
+    // The next free submission entry, zeroed, without submitting anything.
+    io_uring_sqe* take() {
+        if (sqLocalTail_ - __atomic_load_n(sqHead_, __ATOMIC_ACQUIRE) >= sqEntries_) return nullptr;
+        io_uring_sqe* sqe = &sqes_[sqLocalTail_ & sqMask_];
+        std::memset(sqe, 0, sizeof(*sqe));
+        ++sqLocalTail_;
+        return sqe;
+    }
+
+    void provideBuffer(io_uring_sqe* sqe, uint16_t id, uint64_t userData) {
+        sqe->opcode = IORING_OP_PROVIDE_BUFFERS;
+        sqe->fd = 1;
+        sqe->addr = reinterpret_cast<uint64_t>(buffer(id));
+        sqe->len = bufferSize_;
+        sqe->buf_group = bufferGroup_;
+        sqe->off = id;
+        sqe->user_data = userData;
+    }
+
+    // Queues the buffers recycle() had no room for, as far as room allows.
+    void returnBuffers() {
+        size_t returned = 0;
+        while (returned < unreturned_.size()) {
+            io_uring_sqe* sqe = take();
+            if (sqe == nullptr) break;
+            provideBuffer(sqe, unreturned_[returned].first, unreturned_[returned].second);
+            ++returned;
+        }
+        unreturned_.erase(unreturned_.begin(), unreturned_.begin() + (std::ptrdiff_t)returned);
+    }
+
+    bool fail(const char* call, int error) {
+        error_ = std::string(call) + ": " + std::strerror(error);
+        return false;
+    }
+};